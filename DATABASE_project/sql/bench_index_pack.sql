@@ -0,0 +1,243 @@
+-- ========================================
+-- 索引包基准测试：车队/外键/状态访问路径上新增索引前后，各页面与接口
+-- 实际执行的查询的平均耗时与平均逻辑读
+-- 用法：在已执行 init_all.sql、并用 generate_large_data.sql 造过大数据量的
+--       测试库上运行（两个项目的库均可）。脚本先选出样本：车辆最多的车队、
+--       该车队活跃运单最多的车辆、近 30 天运单最多的司机；然后
+--         1. 禁用（ALTER INDEX ... DISABLE）本次新增的索引，每条探测语句
+--            先执行一次预热（编译并载入数据页），再计时 @Repeat 次；
+--         2. 重建（REBUILD）这些索引，同样再测一遍；
+--       最后按路由并排输出前后的平均毫秒数、平均逻辑读与加速比。
+--       探测语句与应用中的 SQL 形状一致，结果写入临时表 #sink，不返回客户端。
+-- 注意：禁用/重建会重写索引并锁表，仅用于测试库；1000 万运单时重建需
+--       数分钟。中途出错也会重建被禁用的索引。
+-- ========================================
+USE LogisticsDB;
+GO
+SET NOCOUNT ON;
+
+DECLARE @Repeat INT = 20;          -- 每条探测语句每轮计时的执行次数
+DECLARE @Top INT = 51;             -- 列表页 page_size 50 + 1
+
+DECLARE @Pack TABLE (TableName SYSNAME, IndexName SYSNAME);
+INSERT INTO @Pack (TableName, IndexName) VALUES
+    (N'dbo.Drivers', N'IX_Drivers_FleetId'),
+    (N'dbo.Vehicles', N'IX_Vehicles_FleetId'),
+    (N'dbo.Orders', N'IX_Orders_Active_Vehicle'),
+    (N'dbo.Orders', N'IX_Orders_Driver_OrderDate'),
+    (N'dbo.Exceptions', N'IX_Exceptions_Vehicle_OccurTime'),
+    (N'dbo.Exceptions', N'IX_Exceptions_Driver_OccurTime'),
+    (N'dbo.Exceptions', N'IX_Exceptions_Unprocessed');
+
+IF EXISTS (SELECT 1 FROM @Pack p WHERE INDEXPROPERTY(OBJECT_ID(p.TableName), p.IndexName, 'IndexID') IS NULL)
+BEGIN
+    RAISERROR(N'索引不完整，请先执行 init_all.sql', 16, 1);
+    RETURN;
+END
+
+DECLARE @Ddl NVARCHAR(MAX);
+
+-- A previous run that was killed mid-way may have left indexes disabled
+SELECT @Ddl = STRING_AGG(CONCAT(N'ALTER INDEX ', QUOTENAME(p.IndexName), N' ON ', p.TableName, N' REBUILD;'), NCHAR(10))
+FROM @Pack p
+JOIN sys.indexes i ON i.object_id = OBJECT_ID(p.TableName) AND i.name = p.IndexName
+WHERE i.is_disabled = 1;
+IF @Ddl IS NOT NULL
+    EXEC sys.sp_executesql @Ddl;
+
+DECLARE @FleetId INT, @VehicleId INT, @DriverId INT;
+DECLARE @End DATETIME2 = SYSDATETIME();
+DECLARE @Start DATETIME2 = DATEADD(DAY, -30, @End);
+
+SELECT TOP (1) @FleetId = FleetId
+FROM dbo.Vehicles
+GROUP BY FleetId
+ORDER BY COUNT(*) DESC;
+
+SELECT TOP (1) @VehicleId = o.VehicleId
+FROM dbo.Orders o
+JOIN dbo.Vehicles v ON v.VehicleId = o.VehicleId
+WHERE v.FleetId = @FleetId AND o.Status IN (N'新建', N'装货中', N'运输中')
+GROUP BY o.VehicleId
+ORDER BY COUNT(*) DESC;
+
+SELECT TOP (1) @DriverId = o.DriverId
+FROM dbo.Orders o
+JOIN dbo.Drivers d ON d.DriverId = o.DriverId
+WHERE d.FleetId = @FleetId AND o.OrderDate BETWEEN @Start AND @End
+GROUP BY o.DriverId
+ORDER BY COUNT(*) DESC;
+
+IF @FleetId IS NULL OR @VehicleId IS NULL OR @DriverId IS NULL
+BEGIN
+    RAISERROR(N'样本不足（需要有车辆、活跃运单和近 30 天运单的车队），请先执行 generate_large_data.sql', 16, 1);
+    RETURN;
+END
+
+PRINT CONCAT(N'样本：FleetId=', @FleetId, N' VehicleId=', @VehicleId, N' DriverId=', @DriverId);
+
+DECLARE @Params NVARCHAR(200) =
+    N'@Top INT, @FleetId INT, @VehicleId INT, @DriverId INT, @Start DATETIME2, @End DATETIME2';
+
+DECLARE @Probes TABLE (ProbeId INT IDENTITY(1,1) PRIMARY KEY, Route NVARCHAR(100), Probe NVARCHAR(100), Sql NVARCHAR(MAX));
+INSERT INTO @Probes (Route, Probe, Sql) VALUES
+(N'/drivers?fleet_id=', N'司机列表第一页', N'
+    SELECT TOP (@Top) d.DriverId, d.EmployeeNo, d.Name, d.LicenseLevel, d.Phone,
+           d.FleetId, f.Name AS FleetName
+    INTO #sink
+    FROM dbo.Drivers d
+    JOIN dbo.Fleets f ON f.FleetId = d.FleetId
+    WHERE d.FleetId = @FleetId
+    ORDER BY d.DriverId DESC'),
+(N'/vehicles?fleet_id=', N'车辆列表第一页', N'
+    SELECT TOP (@Top) v.VehicleId, v.PlateNo, v.MaxWeight, v.MaxVolume, v.Status, v.FleetId, f.Name AS FleetName,
+           ISNULL(l.ActiveOrders, 0) AS ActiveOrders
+    INTO #sink
+    FROM dbo.Vehicles v
+    JOIN dbo.Fleets f ON f.FleetId = v.FleetId
+    LEFT JOIN dbo.VehicleLoad l WITH (NOEXPAND) ON l.VehicleId = v.VehicleId
+    WHERE v.FleetId = @FleetId
+    ORDER BY v.VehicleId DESC'),
+(N'/orders/sign', N'待签收运单第一页', N'
+    SELECT TOP (@Top) o.OrderId, o.Status, o.Weight, o.Volume, o.Destination, o.OrderDate,
+           v.PlateNo, d.Name AS DriverName
+    INTO #sink
+    FROM dbo.Orders o
+    JOIN dbo.Vehicles v ON v.VehicleId = o.VehicleId
+    LEFT JOIN dbo.Drivers d ON d.DriverId = o.DriverId
+    WHERE o.Status IN (N''新建'', N''装货中'', N''运输中'')
+    ORDER BY o.OrderDate DESC, o.OrderId DESC'),
+(N'/orders/sign?fleet_id=', N'车队待签收运单第一页', N'
+    SELECT TOP (@Top) o.OrderId, o.Status, o.Weight, o.Volume, o.Destination, o.OrderDate,
+           v.PlateNo, d.Name AS DriverName
+    INTO #sink
+    FROM dbo.Orders o
+    JOIN dbo.Vehicles v ON v.VehicleId = o.VehicleId
+    LEFT JOIN dbo.Drivers d ON d.DriverId = o.DriverId
+    WHERE o.Status IN (N''新建'', N''装货中'', N''运输中'') AND v.FleetId = @FleetId
+    ORDER BY o.OrderDate DESC, o.OrderId DESC'),
+(N'/api/orders/active?fleet_id=', N'车队全部活跃运单', N'
+    SELECT o.OrderId, o.VehicleId, v.PlateNo, v.FleetId, o.DriverId, d.Name AS DriverName,
+           o.Weight, o.Volume, o.Destination, o.OrderDate, o.Status
+    INTO #sink
+    FROM dbo.Orders o
+    JOIN dbo.Vehicles v ON v.VehicleId = o.VehicleId
+    LEFT JOIN dbo.Drivers d ON d.DriverId = o.DriverId
+    WHERE v.FleetId = @FleetId AND o.Status IN (N''新建'', N''装货中'', N''运输中'')
+    ORDER BY o.OrderDate DESC, o.OrderId DESC'),
+(N'/exceptions/process', N'未处理异常第一页', N'
+    SELECT TOP (@Top) e.ExceptionId, e.OccurTime, e.ExceptionType, e.Phase, e.FineAmount,
+           v.PlateNo, v.Status AS VehicleStatus, d.Name AS DriverName
+    INTO #sink
+    FROM dbo.Exceptions e
+    JOIN dbo.Vehicles v ON v.VehicleId = e.VehicleId
+    LEFT JOIN dbo.Drivers d ON d.DriverId = e.DriverId
+    WHERE e.Processed = 0
+    ORDER BY e.OccurTime DESC, e.ExceptionId DESC'),
+(N'/exceptions/process?fleet_id=', N'车队未处理异常第一页', N'
+    SELECT TOP (@Top) e.ExceptionId, e.OccurTime, e.ExceptionType, e.Phase, e.FineAmount,
+           v.PlateNo, v.Status AS VehicleStatus, d.Name AS DriverName
+    INTO #sink
+    FROM dbo.Exceptions e
+    JOIN dbo.Vehicles v ON v.VehicleId = e.VehicleId
+    LEFT JOIN dbo.Drivers d ON d.DriverId = e.DriverId
+    WHERE e.Processed = 0 AND v.FleetId = @FleetId
+    ORDER BY e.OccurTime DESC, e.ExceptionId DESC'),
+(N'/api/telematics/alarms', N'车辆当前活跃运单的司机', N'
+    SELECT TOP (1) o.DriverId
+    INTO #sink
+    FROM dbo.Orders o
+    WHERE o.VehicleId = @VehicleId AND o.DriverId IS NOT NULL
+      AND o.Status IN (N''新建'', N''装货中'', N''运输中'')
+    ORDER BY o.OrderDate DESC'),
+(N'/reports/driver_performance', N'司机运单统计（近 30 天）', N'
+    SELECT COUNT(OrderId) AS TotalOrders,
+           SUM(CASE WHEN Status = N''已完成'' THEN 1 ELSE 0 END) AS CompletedOrders,
+           SUM(Weight) AS TotalWeight,
+           SUM(Volume) AS TotalVolume
+    INTO #sink
+    FROM dbo.Orders
+    WHERE DriverId = @DriverId AND OrderDate BETWEEN @Start AND @End'),
+(N'/reports/driver_performance', N'司机异常明细（近 30 天）', N'
+    SELECT ExceptionId, VehicleId, OccurTime, ExceptionType, Phase, FineAmount, Processed
+    INTO #sink
+    FROM dbo.Exceptions
+    WHERE DriverId = @DriverId AND OccurTime BETWEEN @Start AND @End
+    ORDER BY OccurTime DESC'),
+(N'/vehicles/edit/<id>（换车队）', N'TR_Vehicles_FleetDailyStats 迁移的运单与异常', N'
+    SELECT CAST(o.OrderDate AS DATE) AS StatDate, o.Status, CAST(0 AS DECIMAL(14,2)) AS Fine
+    INTO #sink
+    FROM dbo.Orders o
+    WHERE o.VehicleId = @VehicleId
+    UNION ALL
+    SELECT CAST(e.OccurTime AS DATE), NULL, e.FineAmount
+    FROM dbo.Exceptions e
+    WHERE e.VehicleId = @VehicleId'),
+(N'/drivers/delete/<id>', N'删除司机时的外键检查', N'
+    SELECT (SELECT TOP (1) 1 FROM dbo.Orders WHERE DriverId = @DriverId) AS InOrders,
+           (SELECT TOP (1) 1 FROM dbo.Exceptions WHERE DriverId = @DriverId) AS InExceptions
+    INTO #sink');
+
+DECLARE @Results TABLE (Phase NVARCHAR(10), ProbeId INT, TotalMicroseconds BIGINT, LogicalReads BIGINT);
+DECLARE @Step INT = 0, @ProbeId INT, @ProbeCount INT = (SELECT COUNT(*) FROM @Probes);
+DECLARE @Sql NVARCHAR(MAX), @i INT, @t0 DATETIME2(7), @Elapsed BIGINT, @Reads0 BIGINT, @Reads BIGINT;
+
+BEGIN TRY
+    WHILE @Step < 2
+    BEGIN
+        -- Step 0 measures without the pack, step 1 with it rebuilt
+        SELECT @Ddl = STRING_AGG(CONCAT(N'ALTER INDEX ', QUOTENAME(IndexName), N' ON ', TableName,
+                                        CASE @Step WHEN 0 THEN N' DISABLE;' ELSE N' REBUILD;' END), NCHAR(10))
+        FROM @Pack;
+        EXEC sys.sp_executesql @Ddl;
+
+        SET @ProbeId = 1;
+        WHILE @ProbeId <= @ProbeCount
+        BEGIN
+            SELECT @Sql = Sql FROM @Probes WHERE ProbeId = @ProbeId;
+
+            -- Warm-up: compile against the current index set, load the pages
+            EXEC sys.sp_executesql @Sql, @Params, @Top, @FleetId, @VehicleId, @DriverId, @Start, @End;
+
+            SELECT @Reads0 = logical_reads FROM sys.dm_exec_requests WHERE session_id = @@SPID;
+            SET @i = 0;
+            SET @t0 = SYSDATETIME();
+            WHILE @i < @Repeat
+            BEGIN
+                EXEC sys.sp_executesql @Sql, @Params, @Top, @FleetId, @VehicleId, @DriverId, @Start, @End;
+                SET @i += 1;
+            END
+            SET @Elapsed = DATEDIFF_BIG(MICROSECOND, @t0, SYSDATETIME());
+            SELECT @Reads = logical_reads - @Reads0 FROM sys.dm_exec_requests WHERE session_id = @@SPID;
+
+            INSERT INTO @Results (Phase, ProbeId, TotalMicroseconds, LogicalReads)
+            VALUES (CASE @Step WHEN 0 THEN N'before' ELSE N'after' END, @ProbeId, @Elapsed, @Reads);
+            SET @ProbeId += 1;
+        END
+
+        SET @Step += 1;
+    END
+END TRY
+BEGIN CATCH
+    -- Never leave the pack disabled
+    SET @Ddl = NULL;
+    SELECT @Ddl = STRING_AGG(CONCAT(N'ALTER INDEX ', QUOTENAME(p.IndexName), N' ON ', p.TableName, N' REBUILD;'), NCHAR(10))
+    FROM @Pack p
+    JOIN sys.indexes i ON i.object_id = OBJECT_ID(p.TableName) AND i.name = p.IndexName
+    WHERE i.is_disabled = 1;
+    IF @Ddl IS NOT NULL
+        EXEC sys.sp_executesql @Ddl;
+    THROW;
+END CATCH
+
+SELECT p.Route, p.Probe,
+       CAST(b.TotalMicroseconds / 1000.0 / @Repeat AS DECIMAL(12,3)) AS BeforeAvgMs,
+       CAST(a.TotalMicroseconds / 1000.0 / @Repeat AS DECIMAL(12,3)) AS AfterAvgMs,
+       b.LogicalReads / @Repeat AS BeforeAvgReads,
+       a.LogicalReads / @Repeat AS AfterAvgReads,
+       CAST(b.TotalMicroseconds * 1.0 / NULLIF(a.TotalMicroseconds, 0) AS DECIMAL(10,1)) AS Speedup
+FROM @Probes p
+JOIN @Results b ON b.ProbeId = p.ProbeId AND b.Phase = N'before'
+JOIN @Results a ON a.ProbeId = p.ProbeId AND a.Phase = N'after'
+ORDER BY p.ProbeId;
+GO
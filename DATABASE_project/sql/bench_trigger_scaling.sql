@@ -0,0 +1,87 @@
+-- ========================================
+-- 触发器基准测试：单行插入运单的耗时应与车辆总数无关
+-- 用法：在已执行 init_all.sql 的测试库上运行（两个项目的库均可）。
+--       每个规模在独立事务中造数并测量，结束后回滚，不留测试数据
+--       （仅消耗自增值）。
+-- 对比：先用旧版 triggers.sql 运行一次，再用新版运行一次；
+--       旧版 TR_Orders_CheckWeight 每次插入都会改写全部有活跃运单的车辆，
+--       AvgMicroseconds 随 VehicleCount 线性增长；新版应基本持平。
+-- ========================================
+USE LogisticsDB;
+GO
+SET NOCOUNT ON;
+
+DECLARE @Scales TABLE (VehicleCount INT PRIMARY KEY);
+INSERT INTO @Scales (VehicleCount) VALUES (100), (1000), (10000), (50000);
+
+DECLARE @Results TABLE (
+    VehicleCount INT,
+    Inserts INT,
+    TotalMs INT,
+    AvgMicroseconds INT
+);
+
+DECLARE @Probe INT = 200;          -- 每个规模测量的单行插入次数
+DECLARE @FleetId INT = (SELECT MIN(FleetId) FROM dbo.Fleets);
+DECLARE @N INT, @i INT, @MinId INT, @MaxId INT, @Target INT;
+DECLARE @t0 DATETIME2(7), @Elapsed BIGINT;
+
+IF @FleetId IS NULL
+BEGIN
+    RAISERROR(N'请先执行 init_all.sql 插入车队数据', 16, 1);
+    RETURN;
+END
+
+DECLARE scale_cursor CURSOR LOCAL FAST_FORWARD FOR
+    SELECT VehicleCount FROM @Scales ORDER BY VehicleCount;
+OPEN scale_cursor;
+FETCH NEXT FROM scale_cursor INTO @N;
+
+WHILE @@FETCH_STATUS = 0
+BEGIN
+    BEGIN TRANSACTION;
+
+    -- N vehicles, each already carrying one active order (so every vehicle
+    -- would match the old trigger's fleet-wide UPDATE)
+    INSERT INTO dbo.Vehicles (FleetId, PlateNo, MaxWeight, MaxVolume, Status)
+    SELECT @FleetId, CONCAT(N'BENCH', t.n), 100000, 100000, N'空闲'
+    FROM (
+        SELECT TOP (@N) ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) AS n
+        FROM sys.all_objects a CROSS JOIN sys.all_objects b
+    ) t;
+
+    SELECT @MinId = MIN(VehicleId), @MaxId = MAX(VehicleId)
+    FROM dbo.Vehicles WHERE PlateNo LIKE N'BENCH%';
+
+    INSERT INTO dbo.Orders (VehicleId, DriverId, Weight, Volume, Destination, Status)
+    SELECT VehicleId, NULL, 1, 1, N'bench', N'新建'
+    FROM dbo.Vehicles
+    WHERE VehicleId BETWEEN @MinId AND @MaxId;
+
+    -- Measure @Probe single-row inserts, each through the full trigger chain
+    SET @i = 0;
+    SET @t0 = SYSDATETIME();
+    WHILE @i < @Probe
+    BEGIN
+        SET @Target = @MinId + (CHECKSUM(NEWID()) & 2147483647) % (@MaxId - @MinId + 1);
+        INSERT INTO dbo.Orders (VehicleId, DriverId, Weight, Volume, Destination, Status)
+        VALUES (@Target, NULL, 1, 1, N'bench-probe', N'新建');
+        SET @i += 1;
+    END
+    SET @Elapsed = DATEDIFF_BIG(MICROSECOND, @t0, SYSDATETIME());
+
+    ROLLBACK TRANSACTION;
+
+    INSERT INTO @Results (VehicleCount, Inserts, TotalMs, AvgMicroseconds)
+    VALUES (@N, @Probe, @Elapsed / 1000, @Elapsed / @Probe);
+
+    FETCH NEXT FROM scale_cursor INTO @N;
+END
+
+CLOSE scale_cursor;
+DEALLOCATE scale_cursor;
+
+SELECT VehicleCount, Inserts, TotalMs, AvgMicroseconds
+FROM @Results
+ORDER BY VehicleCount;
+GO
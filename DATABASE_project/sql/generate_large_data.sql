@@ -0,0 +1,273 @@
+-- ========================================
+-- 大规模测试数据生成：配送中心、车队、司机、车辆、运单、异常
+-- 用法：在已执行 init_all.sql 的测试库上运行（两个项目的库均可），
+--       先按需修改下方规模参数。可重复运行，每次在现有数据之后追加。
+--       生成期间禁用四张业务表上的触发器，按 @BatchSize 行一批插入并提交；
+--       完成后按运单/异常修正车辆状态，重新启用触发器，重建 FleetDailyStats
+--       日汇总并更新统计信息（中途出错也会重新启用触发器）。
+-- 分布：运单与异常时间集中在近期（越近越多）；12 小时内的运单才处于
+--       新建/装货中/运输中，更早的 95% 已完成、5% 取消；活跃运单超出
+--       车辆载重的部分改为已完成，保证 TR_Orders_CheckWeight 的前提成立。
+--       异常 1 天前的均已处理，1 天内约一半未处理。
+--       项目二的库另为每个新车队生成主管和登录账号 gen_mgr<车队ID>。
+-- 注意：仅用于测试库。默认规模（1000 万运单、100 万异常）视机器需十几分钟
+--       到半小时，日志文件会明显增长，建议测试库使用简单恢复模式。
+-- ========================================
+USE LogisticsDB;
+GO
+SET NOCOUNT ON;
+SET XACT_ABORT ON;
+
+DECLARE @Centers INT = 100;
+DECLARE @FleetsPerCenter INT = 5;
+DECLARE @Drivers INT = 8000;
+DECLARE @Vehicles INT = 5000;
+DECLARE @Orders INT = 10000000;
+DECLARE @Exceptions INT = 1000000;
+DECLARE @Days INT = 365;                      -- 运单/异常分布在最近 @Days 天
+DECLARE @BatchSize INT = 500000;
+DECLARE @ManagerPassword NVARCHAR(100) = N'123456';
+
+DECLARE @Now DATETIME2 = SYSDATETIME();
+DECLARE @Done INT, @n INT, @Fleets INT, @Base INT, @Msg NVARCHAR(200);
+DECLARE @t0 DATETIME2 = SYSDATETIME();
+
+CREATE TABLE #Fleet (Rn INT PRIMARY KEY, FleetId INT NOT NULL);
+CREATE TABLE #Driver (FleetId INT NOT NULL, K INT NOT NULL, DriverId INT NOT NULL, PRIMARY KEY (FleetId, K));
+CREATE TABLE #FleetDrivers (FleetId INT PRIMARY KEY, Cnt INT NOT NULL);
+CREATE TABLE #Vehicle (Rn INT PRIMARY KEY, VehicleId INT NOT NULL, FleetId INT NOT NULL,
+                       MaxWeight DECIMAL(12,2) NOT NULL, MaxVolume DECIMAL(12,2) NOT NULL);
+
+BEGIN TRY
+    ALTER TABLE dbo.Drivers DISABLE TRIGGER ALL;
+    ALTER TABLE dbo.Vehicles DISABLE TRIGGER ALL;
+    ALTER TABLE dbo.Orders DISABLE TRIGGER ALL;
+    ALTER TABLE dbo.Exceptions DISABLE TRIGGER ALL;
+
+    -- 1) Centers and fleets
+    DECLARE @NewCenters TABLE (CenterId INT NOT NULL);
+    INSERT INTO dbo.Centers (Name, Region)
+    OUTPUT inserted.CenterId INTO @NewCenters
+    SELECT CONCAT(N'生成配送中心', t.n),
+           CHOOSE(t.n % 8 + 1, N'上海', N'北京', N'广州', N'深圳', N'成都', N'武汉', N'西安', N'杭州')
+    FROM (SELECT TOP (@Centers) ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) AS n FROM sys.all_objects) t;
+
+    INSERT INTO dbo.Fleets (CenterId, Name, FleetType)
+    SELECT c.CenterId, CONCAT(N'生成车队', c.CenterId, N'-', f.n),
+           CHOOSE(f.n % 4 + 1, N'长途运输', N'市内配送', N'快递配送', N'通用')
+    FROM @NewCenters c
+    CROSS JOIN (SELECT TOP (@FleetsPerCenter) ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) AS n FROM sys.all_objects) f;
+
+    INSERT INTO #Fleet (Rn, FleetId)
+    SELECT ROW_NUMBER() OVER (ORDER BY f.FleetId), f.FleetId
+    FROM dbo.Fleets f JOIN @NewCenters c ON c.CenterId = f.CenterId;
+    SET @Fleets = @@ROWCOUNT;
+    IF @Fleets = 0
+    BEGIN
+        RAISERROR(N'@Centers 与 @FleetsPerCenter 须大于 0', 16, 1);
+    END
+
+    -- Project 2 only: a manager and a login per new fleet
+    IF OBJECT_ID('dbo.Managers', 'U') IS NOT NULL AND OBJECT_ID('dbo.Users', 'U') IS NOT NULL
+    BEGIN
+        EXEC sp_executesql N'
+            DECLARE @NewManagers TABLE (ManagerId INT NOT NULL, FleetId INT NOT NULL);
+            INSERT INTO dbo.Managers (Name, FleetId)
+            OUTPUT inserted.ManagerId, inserted.FleetId INTO @NewManagers
+            SELECT CONCAT(N''生成主管'', FleetId), FleetId FROM #Fleet;
+            INSERT INTO dbo.Users (Username, Password, Role, RelatedId)
+            SELECT CONCAT(N''gen_mgr'', FleetId), @Password, N''Manager'', ManagerId FROM @NewManagers;',
+            N'@Password NVARCHAR(100)', @Password = @ManagerPassword;
+    END
+
+    -- 2) Drivers, spread evenly over the new fleets; EmployeeNo G0000001...
+    SELECT @Base = ISNULL(MAX(TRY_CAST(SUBSTRING(EmployeeNo, 2, 7) AS INT)), 0)
+    FROM dbo.Drivers
+    WHERE EmployeeNo LIKE N'G[0-9][0-9][0-9][0-9][0-9][0-9][0-9]';
+
+    INSERT INTO dbo.Drivers (EmployeeNo, Name, LicenseLevel, Phone, FleetId)
+    SELECT CONCAT(N'G', RIGHT(CONCAT(N'0000000', @Base + t.n), 7)),
+           CONCAT(CHOOSE(t.n % 10 + 1, N'王', N'李', N'张', N'刘', N'陈', N'杨', N'赵', N'黄', N'周', N'吴'),
+                  CHOOSE(t.n / 10 % 10 + 1, N'伟', N'芳', N'娜', N'敏', N'静', N'强', N'磊', N'军', N'洋', N'勇'), t.n),
+           CHOOSE(t.n % 6 + 1, N'A2', N'B2', N'B2', N'A1', N'C1', N'B1'),
+           CONCAT(N'139', RIGHT(CONCAT(N'00000000', t.n), 8)),
+           f.FleetId
+    FROM (SELECT TOP (@Drivers) ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) AS n
+          FROM sys.all_columns a CROSS JOIN sys.all_columns b) t
+    JOIN #Fleet f ON f.Rn = (t.n - 1) % @Fleets + 1;
+
+    INSERT INTO #Driver (FleetId, K, DriverId)
+    SELECT d.FleetId, ROW_NUMBER() OVER (PARTITION BY d.FleetId ORDER BY d.DriverId), d.DriverId
+    FROM dbo.Drivers d JOIN #Fleet f ON f.FleetId = d.FleetId;
+    INSERT INTO #FleetDrivers (FleetId, Cnt)
+    SELECT FleetId, COUNT(*) FROM #Driver GROUP BY FleetId;
+
+    -- 3) Vehicles; PlateNo G00001... (matches the app's plate format)
+    SELECT @Base = ISNULL(MAX(TRY_CAST(SUBSTRING(PlateNo, 2, 5) AS INT)), 0)
+    FROM dbo.Vehicles
+    WHERE PlateNo LIKE N'G[0-9][0-9][0-9][0-9][0-9]';
+    IF @Base + @Vehicles > 99999
+    BEGIN
+        RAISERROR(N'车牌号段 G00001–G99999 不足', 16, 1);
+    END
+
+    INSERT INTO dbo.Vehicles (FleetId, PlateNo, MaxWeight, MaxVolume, Status)
+    SELECT f.FleetId, CONCAT(N'G', RIGHT(CONCAT(N'00000', @Base + t.n), 5)), w.MaxWeight, w.MaxWeight * 2, N'空闲'
+    FROM (SELECT TOP (@Vehicles) ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) AS n
+          FROM sys.all_columns a CROSS JOIN sys.all_columns b) t
+    JOIN #Fleet f ON f.Rn = (t.n - 1) % @Fleets + 1
+    CROSS APPLY (SELECT CAST(CHOOSE(t.n % 5 + 1, 5, 10, 15, 20, 30) AS DECIMAL(12,2)) AS MaxWeight) w;
+
+    INSERT INTO #Vehicle (Rn, VehicleId, FleetId, MaxWeight, MaxVolume)
+    SELECT ROW_NUMBER() OVER (ORDER BY v.VehicleId), v.VehicleId, v.FleetId, v.MaxWeight, v.MaxVolume
+    FROM dbo.Vehicles v JOIN #Fleet f ON f.FleetId = v.FleetId
+    WHERE v.PlateNo LIKE N'G[0-9][0-9][0-9][0-9][0-9]' AND TRY_CAST(SUBSTRING(v.PlateNo, 2, 5) AS INT) > @Base;
+    SET @n = @@ROWCOUNT;
+    IF @n = 0 AND (@Orders > 0 OR @Exceptions > 0)
+    BEGIN
+        RAISERROR(N'@Vehicles 须大于 0', 16, 1);
+    END
+    SET @Vehicles = @n;
+
+    SET @Msg = CONCAT(N'车队 ', @Fleets, N'，司机 ', @Drivers, N'，车辆 ', @Vehicles);
+    RAISERROR(@Msg, 0, 1) WITH NOWAIT;
+
+    -- 4) Orders in batches. AgeSec = seconds before @Now, skewed to the recent
+    -- past (1 - sqrt(r)); 10% have no driver.
+    SET @Done = 0;
+    WHILE @Done < @Orders
+    BEGIN
+        SET @n = CASE WHEN @Orders - @Done < @BatchSize THEN @Orders - @Done ELSE @BatchSize END;
+
+        INSERT INTO dbo.Orders (VehicleId, DriverId, Weight, Volume, Destination, OrderDate, Status)
+        SELECT v.VehicleId,
+               CASE WHEN r.R2 % 10 = 0 THEN NULL ELSE d.DriverId END,
+               CAST(v.MaxWeight * (2 + r.R2 % 9) / 100 AS DECIMAL(12,2)),
+               CAST(v.MaxVolume * (2 + r.R3 % 9) / 100 AS DECIMAL(12,2)),
+               CONCAT(CHOOSE(r.R3 % 8 + 1, N'上海', N'北京', N'广州', N'深圳', N'成都', N'武汉', N'西安', N'杭州'),
+                      N'市', r.R2 % 20 + 1, N'区', r.R3 % 200 + 1, N'号'),
+               DATEADD(SECOND, -a.AgeSec, @Now),
+               CASE WHEN a.AgeSec > 43200 THEN CASE WHEN r.R3 % 20 = 0 THEN N'取消' ELSE N'已完成' END
+                    WHEN r.R3 % 20 < 4 THEN N'新建'
+                    WHEN r.R3 % 20 < 7 THEN N'装货中'
+                    WHEN r.R3 % 20 < 14 THEN N'运输中'
+                    WHEN r.R3 % 20 < 19 THEN N'已完成'
+                    ELSE N'取消' END
+        FROM (SELECT TOP (@n) ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) AS n
+              FROM sys.all_columns a CROSS JOIN sys.all_columns b) t
+        -- Non-negative random INTs (ABS overflows when CHECKSUM returns INT_MIN)
+        CROSS APPLY (SELECT CHECKSUM(NEWID()) & 2147483647 AS R1, CHECKSUM(NEWID()) & 2147483647 AS R2,
+                            CHECKSUM(NEWID()) & 2147483647 AS R3) r
+        CROSS APPLY (SELECT CAST(@Days * 86400.0 * (1 - SQRT((r.R1 % 1000000) / 1000000.0)) AS INT) AS AgeSec) a
+        JOIN #Vehicle v ON v.Rn = r.R1 % @Vehicles + 1
+        LEFT JOIN #FleetDrivers fd ON fd.FleetId = v.FleetId
+        LEFT JOIN #Driver d ON d.FleetId = v.FleetId AND d.K = r.R2 % fd.Cnt + 1;
+
+        SET @Done += @n;
+        SET @Msg = CONCAT(N'运单 ', @Done, N' / ', @Orders, N'（', DATEDIFF(SECOND, @t0, SYSDATETIME()), N' 秒）');
+        RAISERROR(@Msg, 0, 1) WITH NOWAIT;
+    END
+
+    -- Active load never above capacity: complete the newest active orders that
+    -- would push a vehicle over MaxWeight / MaxVolume
+    ;WITH Active AS (
+        SELECT o.Status,
+               SUM(o.Weight) OVER (PARTITION BY o.VehicleId ORDER BY o.OrderDate, o.OrderId
+                                   ROWS UNBOUNDED PRECEDING) AS RunWeight,
+               SUM(o.Volume) OVER (PARTITION BY o.VehicleId ORDER BY o.OrderDate, o.OrderId
+                                   ROWS UNBOUNDED PRECEDING) AS RunVolume,
+               v.MaxWeight, v.MaxVolume
+        FROM dbo.Orders o
+        JOIN #Vehicle v ON v.VehicleId = o.VehicleId
+        WHERE o.Status IN (N'新建', N'装货中', N'运输中') AND o.OrderDate >= DATEADD(DAY, -1, @Now)
+    )
+    UPDATE Active SET Status = N'已完成'
+    WHERE RunWeight > MaxWeight OR RunVolume > MaxVolume;
+
+    -- 5) Exceptions
+    SET @Done = 0;
+    WHILE @Done < @Exceptions
+    BEGIN
+        SET @n = CASE WHEN @Exceptions - @Done < @BatchSize THEN @Exceptions - @Done ELSE @BatchSize END;
+
+        INSERT INTO dbo.Exceptions (VehicleId, DriverId, OccurTime, ExceptionType, Phase, FineAmount,
+                                    Processed, ProcessedTime)
+        SELECT v.VehicleId,
+               CASE WHEN r.R2 % 10 < 3 THEN NULL ELSE d.DriverId END,
+               DATEADD(SECOND, -a.AgeSec, @Now),
+               x.ExceptionType,
+               CASE WHEN r.R3 % 10 < 7 THEN N'运输中异常' ELSE N'空闲时异常' END,
+               CASE x.ExceptionType WHEN N'超速报警' THEN 200
+                                    WHEN N'货物破损' THEN 500 + r.R3 % 5 * 100
+                                    WHEN N'严重延误' THEN CASE WHEN r.R3 % 2 = 0 THEN 100 ELSE 0 END
+                                    ELSE 0 END,
+               p.Processed,
+               -- Processed somewhere between the exception and now
+               CASE WHEN p.Processed = 1
+                    THEN DATEADD(SECOND, -CAST(CAST(a.AgeSec AS BIGINT) * (r.R2 % 100) / 100 AS INT), @Now) END
+        FROM (SELECT TOP (@n) ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) AS n
+              FROM sys.all_columns a CROSS JOIN sys.all_columns b) t
+        -- Non-negative random INTs (ABS overflows when CHECKSUM returns INT_MIN)
+        CROSS APPLY (SELECT CHECKSUM(NEWID()) & 2147483647 AS R1, CHECKSUM(NEWID()) & 2147483647 AS R2,
+                            CHECKSUM(NEWID()) & 2147483647 AS R3) r
+        CROSS APPLY (SELECT CAST(@Days * 86400.0 * (1 - SQRT((r.R1 % 1000000) / 1000000.0)) AS INT) AS AgeSec) a
+        CROSS APPLY (SELECT CASE WHEN r.R2 % 20 < 9 THEN N'超速报警'
+                                 WHEN r.R2 % 20 < 14 THEN N'严重延误'
+                                 WHEN r.R2 % 20 < 18 THEN N'车辆故障'
+                                 ELSE N'货物破损' END AS ExceptionType) x
+        CROSS APPLY (SELECT CAST(CASE WHEN a.AgeSec > 86400 OR r.R3 % 2 = 0 THEN 1 ELSE 0 END AS BIT) AS Processed) p
+        JOIN #Vehicle v ON v.Rn = r.R1 % @Vehicles + 1
+        LEFT JOIN #FleetDrivers fd ON fd.FleetId = v.FleetId
+        LEFT JOIN #Driver d ON d.FleetId = v.FleetId AND d.K = r.R2 % fd.Cnt + 1;
+
+        SET @Done += @n;
+        SET @Msg = CONCAT(N'异常 ', @Done, N' / ', @Exceptions, N'（', DATEDIFF(SECOND, @t0, SYSDATETIME()), N' 秒）');
+        RAISERROR(@Msg, 0, 1) WITH NOWAIT;
+    END
+
+    -- 6) Vehicle status from what was generated: 异常 with an unprocessed
+    -- exception, 运输中 with an order in transit, a few under repair, else idle
+    UPDATE veh
+    SET Status = CASE
+            WHEN EXISTS (SELECT 1 FROM dbo.Exceptions e
+                         WHERE e.VehicleId = veh.VehicleId AND e.Processed = 0) THEN N'异常'
+            WHEN EXISTS (SELECT 1 FROM dbo.Orders o
+                         WHERE o.VehicleId = veh.VehicleId AND o.Status = N'运输中') THEN N'运输中'
+            WHEN NOT EXISTS (SELECT 1 FROM dbo.Orders o
+                             WHERE o.VehicleId = veh.VehicleId AND o.Status IN (N'新建', N'装货中'))
+                 AND veh.VehicleId % 30 = 0 THEN N'维修中'
+            ELSE N'空闲' END
+    FROM dbo.Vehicles veh
+    JOIN #Vehicle v ON v.VehicleId = veh.VehicleId;
+
+    ALTER TABLE dbo.Drivers ENABLE TRIGGER ALL;
+    ALTER TABLE dbo.Vehicles ENABLE TRIGGER ALL;
+    ALTER TABLE dbo.Orders ENABLE TRIGGER ALL;
+    ALTER TABLE dbo.Exceptions ENABLE TRIGGER ALL;
+END TRY
+BEGIN CATCH
+    ALTER TABLE dbo.Drivers ENABLE TRIGGER ALL;
+    ALTER TABLE dbo.Vehicles ENABLE TRIGGER ALL;
+    ALTER TABLE dbo.Orders ENABLE TRIGGER ALL;
+    ALTER TABLE dbo.Exceptions ENABLE TRIGGER ALL;
+    THROW;
+END CATCH
+
+-- 7) The rollup triggers were off: rebuild it, then refresh statistics
+EXEC dbo.sp_refresh_fleet_daily_stats;
+UPDATE STATISTICS dbo.Drivers;
+UPDATE STATISTICS dbo.Vehicles;
+UPDATE STATISTICS dbo.Orders;
+UPDATE STATISTICS dbo.Exceptions;
+UPDATE STATISTICS dbo.FleetDailyStats;
+
+SET @Msg = CONCAT(N'生成完成，用时 ', DATEDIFF(SECOND, @t0, SYSDATETIME()), N' 秒');
+RAISERROR(@Msg, 0, 1) WITH NOWAIT;
+
+SELECT (SELECT COUNT(*) FROM dbo.Centers) AS Centers,
+       (SELECT COUNT(*) FROM dbo.Fleets) AS Fleets,
+       (SELECT COUNT(*) FROM dbo.Drivers) AS Drivers,
+       (SELECT COUNT(*) FROM dbo.Vehicles) AS Vehicles,
+       (SELECT COUNT_BIG(*) FROM dbo.Orders) AS Orders,
+       (SELECT COUNT_BIG(*) FROM dbo.Exceptions) AS Exceptions;
+GO
@@ -2,34 +2,469 @@ USE LogisticsDB;
 GO
 
 -- Stored Procedure: Monthly safety & efficiency report per fleet
+-- Sums FleetDailyStats rows, so the cost depends on the number of days asked
+-- for, not on the size of Orders / Exceptions. Pass @Year/@Month for a calendar
+-- month, or @StartDate/@EndDate (inclusive) for any range.
 CREATE OR ALTER PROCEDURE dbo.sp_fleet_monthly_report
     @FleetId INT,
-    @Year INT,
-    @Month INT
+    @Year INT = NULL,
+    @Month INT = NULL,
+    @StartDate DATE = NULL,
+    @EndDate DATE = NULL
 AS
 BEGIN
     SET NOCOUNT ON;
-    DECLARE @StartDate DATE = DATEFROMPARTS(@Year, @Month, 1);
-    DECLARE @EndDate DATE = EOMONTH(@StartDate);
+    IF @StartDate IS NULL OR @EndDate IS NULL
+    BEGIN
+        SET @StartDate = DATEFROMPARTS(@Year, @Month, 1);
+        SET @EndDate = EOMONTH(@StartDate);
+    END
 
-    ;WITH FleetVehicles AS (
-        SELECT VehicleId FROM dbo.Vehicles WHERE FleetId = @FleetId
-    )
-    SELECT 
+    SELECT
         @FleetId AS FleetId,
-        COUNT(*) AS TotalOrders,
-        SUM(CASE WHEN o.Status = N'已完成' THEN 1 ELSE 0 END) AS CompletedOrders,
-        SUM(CASE WHEN o.Status IN (N'新建', N'装货中', N'运输中') THEN 1 ELSE 0 END) AS ActiveOrders,
-        (SELECT COUNT(*) FROM dbo.Exceptions e JOIN FleetVehicles fv ON fv.VehicleId = e.VehicleId
-         WHERE e.OccurTime >= @StartDate AND e.OccurTime < DATEADD(DAY, 1, @EndDate)) AS TotalExceptions,
-        (SELECT ISNULL(SUM(e.FineAmount), 0) FROM dbo.Exceptions e JOIN FleetVehicles fv ON fv.VehicleId = e.VehicleId
-         WHERE e.OccurTime >= @StartDate AND e.OccurTime < DATEADD(DAY, 1, @EndDate)) AS TotalFineAmount,
-        CAST(NULL AS DECIMAL(5,2)) AS CompletionRate
+        ISNULL(SUM(TotalOrders), 0) AS TotalOrders,
+        ISNULL(SUM(CompletedOrders), 0) AS CompletedOrders,
+        ISNULL(SUM(NewOrders + LoadingOrders + InTransitOrders), 0) AS ActiveOrders,
+        ISNULL(SUM(TotalExceptions), 0) AS TotalExceptions,
+        ISNULL(SUM(TotalFineAmount), 0) AS TotalFineAmount,
+        CAST(CASE WHEN SUM(TotalOrders) > 0
+                  THEN 100.0 * SUM(CompletedOrders) / SUM(TotalOrders) END AS DECIMAL(5,2)) AS CompletionRate,
+        @StartDate AS StartDate,
+        @EndDate AS EndDate
+    FROM dbo.FleetDailyStats
+    WHERE FleetId = @FleetId
+      AND StatDate BETWEEN @StartDate AND @EndDate;
+END
+GO
+
+-- Stored Procedure: Network-wide report, every fleet (or every center) in one pass
+-- One grouped read of FleetDailyStats instead of one sp_fleet_monthly_report call
+-- per fleet. @ByCenter = 1 returns one row per center plus a network total row
+-- (CenterId NULL). Fleets without activity in the range are listed with zeros.
+CREATE OR ALTER PROCEDURE dbo.sp_network_monthly_report
+    @Year INT = NULL,
+    @Month INT = NULL,
+    @StartDate DATE = NULL,
+    @EndDate DATE = NULL,
+    @ByCenter BIT = 0
+AS
+BEGIN
+    SET NOCOUNT ON;
+    IF @StartDate IS NULL OR @EndDate IS NULL
+    BEGIN
+        SET @StartDate = DATEFROMPARTS(@Year, @Month, 1);
+        SET @EndDate = EOMONTH(@StartDate);
+    END
+
+    ;WITH FleetTotals AS (
+        SELECT c.CenterId, c.Name AS CenterName, f.FleetId, f.Name AS FleetName,
+               ISNULL(SUM(s.TotalOrders), 0) AS TotalOrders,
+               ISNULL(SUM(s.CompletedOrders), 0) AS CompletedOrders,
+               ISNULL(SUM(s.NewOrders + s.LoadingOrders + s.InTransitOrders), 0) AS ActiveOrders,
+               ISNULL(SUM(s.TotalExceptions), 0) AS TotalExceptions,
+               ISNULL(SUM(s.TotalFineAmount), 0) AS TotalFineAmount
+        FROM dbo.Fleets f
+        JOIN dbo.Centers c ON c.CenterId = f.CenterId
+        LEFT JOIN dbo.FleetDailyStats s
+               ON s.FleetId = f.FleetId AND s.StatDate BETWEEN @StartDate AND @EndDate
+        GROUP BY c.CenterId, c.Name, f.FleetId, f.Name
+    ),
+    Report AS (
+        SELECT CenterId, CenterName, FleetId, FleetName,
+               TotalOrders, CompletedOrders, ActiveOrders, TotalExceptions, TotalFineAmount
+        FROM FleetTotals
+        WHERE @ByCenter = 0
+        UNION ALL
+        SELECT CenterId, MAX(CenterName), NULL, NULL,
+               SUM(TotalOrders), SUM(CompletedOrders), SUM(ActiveOrders), SUM(TotalExceptions), SUM(TotalFineAmount)
+        FROM FleetTotals
+        WHERE @ByCenter = 1
+        GROUP BY GROUPING SETS ((CenterId), ())
+    )
+    SELECT CenterId, CenterName, FleetId, FleetName,
+           TotalOrders, CompletedOrders, ActiveOrders, TotalExceptions, TotalFineAmount,
+           CAST(CASE WHEN TotalOrders > 0 THEN 100.0 * CompletedOrders / TotalOrders END AS DECIMAL(5,2)) AS CompletionRate,
+           @StartDate AS StartDate, @EndDate AS EndDate
+    FROM Report
+    ORDER BY CASE WHEN CenterId IS NULL THEN 1 ELSE 0 END, CenterId, FleetId;
+END
+GO
+
+-- Stored Procedure: Rebuild FleetDailyStats from Orders / Exceptions (hot and archived)
+-- (first backfill, or repair). Dates are inclusive; without them every day is rebuilt.
+CREATE OR ALTER PROCEDURE dbo.sp_refresh_fleet_daily_stats
+    @StartDate DATE = NULL,
+    @EndDate DATE = NULL
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    DECLARE @From DATE = ISNULL(@StartDate, '00010101');
+    DECLARE @To DATE = ISNULL(@EndDate, '99991231');
+
+    BEGIN TRANSACTION;
+    -- TABLOCKX keeps the delta triggers out until the rebuilt rows are committed
+    DELETE FROM dbo.FleetDailyStats WITH (TABLOCKX)
+    WHERE StatDate BETWEEN @From AND @To;
+
+    INSERT INTO dbo.FleetDailyStats (FleetId, StatDate, TotalOrders, NewOrders, LoadingOrders, InTransitOrders,
+                                     CompletedOrders, CancelledOrders, TotalExceptions, TotalFineAmount)
+    SELECT FleetId, StatDate, SUM(TotalOrders), SUM(NewOrders), SUM(LoadingOrders), SUM(InTransitOrders),
+           SUM(CompletedOrders), SUM(CancelledOrders), SUM(TotalExceptions), SUM(TotalFineAmount)
+    FROM (
+        SELECT v.FleetId, CAST(o.OrderDate AS DATE) AS StatDate, 1 AS TotalOrders,
+               CASE WHEN o.Status = N'新建' THEN 1 ELSE 0 END AS NewOrders,
+               CASE WHEN o.Status = N'装货中' THEN 1 ELSE 0 END AS LoadingOrders,
+               CASE WHEN o.Status = N'运输中' THEN 1 ELSE 0 END AS InTransitOrders,
+               CASE WHEN o.Status = N'已完成' THEN 1 ELSE 0 END AS CompletedOrders,
+               CASE WHEN o.Status = N'取消' THEN 1 ELSE 0 END AS CancelledOrders,
+               0 AS TotalExceptions, CAST(0 AS DECIMAL(14,2)) AS TotalFineAmount
+        FROM dbo.vw_orders_all o
+        JOIN dbo.Vehicles v ON v.VehicleId = o.VehicleId
+        WHERE CAST(o.OrderDate AS DATE) BETWEEN @From AND @To
+        UNION ALL
+        SELECT v.FleetId, CAST(e.OccurTime AS DATE), 0, 0, 0, 0, 0, 0, 1, e.FineAmount
+        FROM dbo.vw_exceptions_all e
+        JOIN dbo.Vehicles v ON v.VehicleId = e.VehicleId
+        WHERE CAST(e.OccurTime AS DATE) BETWEEN @From AND @To
+    ) x
+    GROUP BY FleetId, StatDate;
+    COMMIT TRANSACTION;
+END
+GO
+
+-- Stored Procedure: Trim ChangeFeed. The live feed only replays recent events
+-- to reconnecting clients; the web app's poller calls this once an hour.
+CREATE OR ALTER PROCEDURE dbo.sp_purge_change_feed
+    @KeepHours INT = 24
+AS
+BEGIN
+    SET NOCOUNT ON;
+    DECLARE @Cutoff DATETIME2 = DATEADD(HOUR, -@KeepHours, SYSDATETIME());
+    -- Small batches keep each delete short next to the triggers' inserts
+    WHILE 1 = 1
+    BEGIN
+        DELETE TOP (5000) FROM dbo.ChangeFeed WHERE ChangedAt < @Cutoff;
+        IF @@ROWCOUNT < 5000 BREAK;
+    END
+END
+GO
+
+-- Stored Procedure: Drop tombstones older than @KeepDays. Clients whose sync
+-- token predates the purge get HTTP 410 and must resync from 0.
+CREATE OR ALTER PROCEDURE dbo.sp_purge_sync_tombstones
+    @KeepDays INT = 30
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    DECLARE @Purged BINARY(8) = (
+        SELECT MAX(DeletedVer) FROM dbo.SyncTombstones
+        WHERE DeletedAt < DATEADD(DAY, -@KeepDays, SYSDATETIME())
+    );
+    IF @Purged IS NULL RETURN;
+
+    BEGIN TRANSACTION;
+    UPDATE dbo.SyncPurgeMark SET PurgedVer = @Purged WHERE Id = 1 AND PurgedVer < @Purged;
+    DELETE FROM dbo.SyncTombstones WHERE DeletedVer <= @Purged;
+    COMMIT TRANSACTION;
+END
+GO
+
+-- Stored Procedure: Add the monthly boundaries of pf_ArchiveMonth from the
+-- month of @From through the month after @Through. Boundaries past the
+-- archived data split empty partitions, which only changes metadata.
+CREATE OR ALTER PROCEDURE dbo.sp_extend_archive_partitions
+    @From DATETIME2,
+    @Through DATETIME2
+AS
+BEGIN
+    SET NOCOUNT ON;
+    DECLARE @Month DATETIME2 = DATEFROMPARTS(YEAR(@From), MONTH(@From), 1);
+    DECLARE @Last DATETIME2 = DATEADD(MONTH, 1, DATEFROMPARTS(YEAR(@Through), MONTH(@Through), 1));
+    WHILE @Month <= @Last
+    BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM sys.partition_range_values r
+            JOIN sys.partition_functions f ON f.function_id = r.function_id
+            WHERE f.name = 'pf_ArchiveMonth' AND CAST(r.value AS DATETIME2) = @Month)
+        BEGIN
+            ALTER PARTITION SCHEME ps_ArchiveMonth NEXT USED [PRIMARY];
+            ALTER PARTITION FUNCTION pf_ArchiveMonth() SPLIT RANGE (@Month);
+        END
+        SET @Month = DATEADD(MONTH, 1, @Month);
+    END
+END
+GO
+
+-- Stored Procedure: Move closed records older than @KeepDays to the archive:
+-- orders 已完成 / 取消 and processed exceptions. Each batch of @BatchSize rows
+-- is copied and deleted in its own short transaction, so the job can run next
+-- to the web app (daily, e.g. from SQL Server Agent or a scheduled sqlcmd).
+-- The delete triggers leave archived rows in FleetDailyStats and write no sync
+-- tombstones for them. Returns the number of rows moved.
+CREATE OR ALTER PROCEDURE dbo.sp_archive_closed_records
+    @KeepDays INT = 90,
+    @BatchSize INT = 5000
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    -- vw_week_exception_alerts lists (processed) exceptions of the last 7 days
+    IF @KeepDays < 7 OR @BatchSize < 1
+        THROW 51001, N'@KeepDays 不能小于 7，@BatchSize 须大于 0', 1;
+    DECLARE @Cutoff DATETIME2 = DATEADD(DAY, -@KeepDays, SYSDATETIME());
+    DECLARE @Orders INT = 0, @Exceptions INT = 0, @Rows INT;
+    DECLARE @Batch TABLE (Id INT PRIMARY KEY);
+
+    DECLARE @Oldest DATETIME2 = (
+        SELECT MIN(d) FROM (
+            SELECT MIN(OrderDate) FROM dbo.Orders WHERE Status IN (N'已完成', N'取消') AND OrderDate < @Cutoff
+            UNION ALL
+            SELECT MIN(OccurTime) FROM dbo.Exceptions WHERE Processed = 1 AND OccurTime < @Cutoff
+        ) x (d)
+    );
+    IF @Oldest IS NOT NULL
+        EXEC dbo.sp_extend_archive_partitions @From = @Oldest, @Through = @Cutoff;
+
+    WHILE @Oldest IS NOT NULL
+    BEGIN
+        DELETE FROM @Batch;
+        BEGIN TRANSACTION;
+        INSERT INTO @Batch (Id)
+        SELECT TOP (@BatchSize) OrderId FROM dbo.Orders WITH (UPDLOCK)
+        WHERE Status IN (N'已完成', N'取消') AND OrderDate < @Cutoff;
+        SET @Rows = @@ROWCOUNT;
+
+        INSERT INTO dbo.OrdersArchive (OrderId, VehicleId, DriverId, Weight, Volume, Destination, OrderDate, Status)
+        SELECT o.OrderId, o.VehicleId, o.DriverId, o.Weight, o.Volume, o.Destination, o.OrderDate, o.Status
+        FROM dbo.Orders o
+        JOIN @Batch b ON b.Id = o.OrderId;
+        DELETE o FROM dbo.Orders o JOIN @Batch b ON b.Id = o.OrderId;
+        COMMIT TRANSACTION;
+
+        SET @Orders += @Rows;
+        IF @Rows < @BatchSize BREAK;
+    END
+
+    WHILE @Oldest IS NOT NULL
+    BEGIN
+        DELETE FROM @Batch;
+        BEGIN TRANSACTION;
+        INSERT INTO @Batch (Id)
+        SELECT TOP (@BatchSize) ExceptionId FROM dbo.Exceptions WITH (UPDLOCK)
+        WHERE Processed = 1 AND OccurTime < @Cutoff;
+        SET @Rows = @@ROWCOUNT;
+
+        INSERT INTO dbo.ExceptionsArchive (ExceptionId, VehicleId, DriverId, OccurTime, ExceptionType, Phase,
+                                           FineAmount, Processed, ProcessedTime)
+        SELECT e.ExceptionId, e.VehicleId, e.DriverId, e.OccurTime, e.ExceptionType, e.Phase,
+               e.FineAmount, e.Processed, e.ProcessedTime
+        FROM dbo.Exceptions e
+        JOIN @Batch b ON b.Id = e.ExceptionId;
+        DELETE e FROM dbo.Exceptions e JOIN @Batch b ON b.Id = e.ExceptionId;
+        COMMIT TRANSACTION;
+
+        SET @Exceptions += @Rows;
+        IF @Rows < @BatchSize BREAK;
+    END
+
+    SELECT @Orders AS ArchivedOrders, @Exceptions AS ArchivedExceptions;
+END
+GO
+
+-- Write procedures used by the web pages. Each does its checks and its write
+-- in one call, with the vehicle row locked (UPDLOCK, HOLDLOCK) from the check
+-- to the commit, so two dispatchers acting on the same vehicle are serialized
+-- instead of both passing a stale check. Each answers with one row:
+--   ResultCode  0 成功 / 1 车辆或记录不存在 / 2 车辆状态不允许 / 3 司机无效
+--               4 超出最大载重 / 5 参数无效 / 6 没有待运单
+--   Message     text for the page
+-- A failed check writes nothing; the procedures only ever COMMIT, so they
+-- behave the same inside the caller's implicit transaction.
+
+-- Stored Procedure: Assign one order to a vehicle
+CREATE OR ALTER PROCEDURE dbo.sp_assign_order
+    @VehicleId INT,
+    @DriverId INT = NULL,
+    @Weight DECIMAL(12,2),
+    @Volume DECIMAL(12,2),
+    @Destination NVARCHAR(200),
+    @FleetId INT = NULL,            -- limit to one fleet (manager pages)
+    @RequireDriver BIT = 1,
+    @BlockDeparted BIT = 1
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    DECLARE @Result INT = 0, @Message NVARCHAR(200) = N'运单已分配';
+    DECLARE @Status NVARCHAR(20), @VehicleFleet INT, @MaxWeight DECIMAL(12,2);
+
+    BEGIN TRANSACTION;
+    SELECT @Status = Status, @VehicleFleet = FleetId, @MaxWeight = MaxWeight
+    FROM dbo.Vehicles WITH (UPDLOCK, HOLDLOCK)
+    WHERE VehicleId = @VehicleId;
+
+    IF @Weight IS NULL OR @Volume IS NULL OR @Weight <= 0 OR @Volume <= 0 OR NULLIF(LTRIM(@Destination), N'') IS NULL
+        SELECT @Result = 5, @Message = N'重量、体积须大于 0 且目的地不能为空';
+    ELSE IF @Status IS NULL OR (@FleetId IS NOT NULL AND @VehicleFleet <> @FleetId)
+        SELECT @Result = 1, @Message = N'车辆不存在';
+    ELSE IF @BlockDeparted = 1 AND @Status = N'运输中'
+        SELECT @Result = 2, @Message = N'车辆已发车，无法再添加运单';
+    ELSE IF @DriverId IS NULL AND @RequireDriver = 1
+        SELECT @Result = 3, @Message = N'必须选择司机';
+    ELSE IF @DriverId IS NOT NULL AND NOT EXISTS (
+        SELECT 1 FROM dbo.Drivers WHERE DriverId = @DriverId AND (@FleetId IS NULL OR FleetId = @FleetId))
+        SELECT @Result = 3, @Message = N'司机不存在或不属于该车队';
+    ELSE IF ISNULL((SELECT AssignedWeight FROM dbo.VehicleLoad WITH (NOEXPAND) WHERE VehicleId = @VehicleId), 0)
+            + @Weight > @MaxWeight
+        SELECT @Result = 4, @Message = N'超出最大载重：分配失败';
+
+    -- TR_Orders_CheckWeight still re-checks the weight on insert
+    IF @Result = 0
+        INSERT INTO dbo.Orders (VehicleId, DriverId, Weight, Volume, Destination, Status)
+        VALUES (@VehicleId, @DriverId, @Weight, @Volume, @Destination, N'新建');
+    COMMIT TRANSACTION;
+
+    SELECT @Result AS ResultCode, @Message AS Message;
+END
+GO
+
+-- Stored Procedure: Depart a vehicle (status -> 运输中) when it has active orders
+CREATE OR ALTER PROCEDURE dbo.sp_vehicle_depart
+    @VehicleId INT,
+    @FleetId INT = NULL
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    DECLARE @Result INT = 0, @Message NVARCHAR(200) = N'车辆已发车，状态变更为运输中';
+    DECLARE @Status NVARCHAR(20), @VehicleFleet INT;
+
+    BEGIN TRANSACTION;
+    SELECT @Status = Status, @VehicleFleet = FleetId
+    FROM dbo.Vehicles WITH (UPDLOCK, HOLDLOCK)
+    WHERE VehicleId = @VehicleId;
+
+    IF @Status IS NULL OR (@FleetId IS NOT NULL AND @VehicleFleet <> @FleetId)
+        SELECT @Result = 1, @Message = N'车辆不存在';
+    ELSE IF @Status = N'运输中'
+        SELECT @Result = 2, @Message = N'车辆已在运输中';
+    ELSE IF ISNULL((SELECT ActiveOrders FROM dbo.VehicleLoad WITH (NOEXPAND) WHERE VehicleId = @VehicleId), 0) = 0
+        SELECT @Result = 6, @Message = N'该车辆没有待运单，无法发车';
+
+    IF @Result = 0
+        UPDATE dbo.Vehicles SET Status = N'运输中' WHERE VehicleId = @VehicleId;
+    COMMIT TRANSACTION;
+
+    SELECT @Result AS ResultCode, @Message AS Message;
+END
+GO
+
+-- Stored Procedure: Record one exception (TR_Exceptions_AfterInsert_Status
+-- then marks the vehicle 异常)
+CREATE OR ALTER PROCEDURE dbo.sp_record_exception
+    @VehicleId INT,
+    @DriverId INT = NULL,
+    @ExceptionType NVARCHAR(50),
+    @Phase NVARCHAR(20),
+    @FineAmount DECIMAL(12,2) = 0,
+    @FleetId INT = NULL
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    DECLARE @Result INT = 0, @Message NVARCHAR(200) = N'异常已记录，车辆状态置为异常';
+    DECLARE @VehicleFleet INT;
+
+    BEGIN TRANSACTION;
+    SELECT @VehicleFleet = FleetId
+    FROM dbo.Vehicles WITH (UPDLOCK, HOLDLOCK)
+    WHERE VehicleId = @VehicleId;
+
+    IF @ExceptionType NOT IN (N'货物破损', N'车辆故障', N'严重延误', N'超速报警')
+       OR @Phase NOT IN (N'运输中异常', N'空闲时异常') OR ISNULL(@FineAmount, -1) < 0
+        SELECT @Result = 5, @Message = N'异常类型、阶段或罚款金额无效';
+    ELSE IF @VehicleFleet IS NULL OR (@FleetId IS NOT NULL AND @VehicleFleet <> @FleetId)
+        SELECT @Result = 1, @Message = N'车辆不存在';
+    ELSE IF @DriverId IS NOT NULL AND NOT EXISTS (
+        SELECT 1 FROM dbo.Drivers WHERE DriverId = @DriverId AND (@FleetId IS NULL OR FleetId = @FleetId))
+        SELECT @Result = 3, @Message = N'司机不存在或不属于该车队';
+
+    IF @Result = 0
+        INSERT INTO dbo.Exceptions (VehicleId, DriverId, ExceptionType, Phase, FineAmount)
+        VALUES (@VehicleId, @DriverId, @ExceptionType, @Phase, @FineAmount);
+    COMMIT TRANSACTION;
+
+    SELECT @Result AS ResultCode, @Message AS Message;
+END
+GO
+
+-- Stored Procedure: Sign off (complete) a batch of orders given as a JSON id
+-- array. One UPDATE for the batch, so TR_Orders_AfterUpdate_Status runs once;
+-- returns Id, Outcome (ok / not_found / bad_status) and Status per id.
+CREATE OR ALTER PROCEDURE dbo.sp_sign_orders
+    @Ids NVARCHAR(MAX),
+    @FleetId INT = NULL
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    DECLARE @Batch TABLE (Id INT PRIMARY KEY);
+    DECLARE @Done TABLE (Id INT PRIMARY KEY);
+    INSERT INTO @Batch (Id) SELECT DISTINCT CAST(value AS INT) FROM OPENJSON(@Ids);
+
+    UPDATE o
+    SET o.Status = N'已完成'
+    OUTPUT inserted.OrderId INTO @Done (Id)
     FROM dbo.Orders o
-    JOIN FleetVehicles fv ON fv.VehicleId = o.VehicleId
-    WHERE o.OrderDate >= @StartDate AND o.OrderDate < DATEADD(DAY, 1, @EndDate);
+    JOIN @Batch b ON b.Id = o.OrderId
+    JOIN dbo.Vehicles v ON v.VehicleId = o.VehicleId
+    WHERE o.Status IN (N'新建', N'装货中', N'运输中') AND (@FleetId IS NULL OR v.FleetId = @FleetId);
+
+    SELECT b.Id,
+           CASE WHEN d.Id IS NOT NULL THEN 'ok'
+                WHEN o.OrderId IS NULL OR v.FleetId <> @FleetId THEN 'not_found'
+                ELSE 'bad_status' END AS Outcome,
+           o.Status
+    FROM @Batch b
+    LEFT JOIN @Done d ON d.Id = b.Id
+    LEFT JOIN dbo.Orders o ON o.OrderId = b.Id
+    LEFT JOIN dbo.Vehicles v ON v.VehicleId = o.VehicleId
+    ORDER BY b.Id;
+END
+GO
+
+-- Stored Procedure: Mark a batch of exceptions processed (JSON id array);
+-- TR_Exceptions_AfterUpdate_Processed runs once for the batch
+CREATE OR ALTER PROCEDURE dbo.sp_process_exceptions
+    @Ids NVARCHAR(MAX),
+    @FleetId INT = NULL
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    DECLARE @Batch TABLE (Id INT PRIMARY KEY);
+    DECLARE @Done TABLE (Id INT PRIMARY KEY);
+    INSERT INTO @Batch (Id) SELECT DISTINCT CAST(value AS INT) FROM OPENJSON(@Ids);
+
+    UPDATE e
+    SET e.Processed = 1, e.ProcessedTime = SYSDATETIME()
+    OUTPUT inserted.ExceptionId INTO @Done (Id)
+    FROM dbo.Exceptions e
+    JOIN @Batch b ON b.Id = e.ExceptionId
+    JOIN dbo.Vehicles v ON v.VehicleId = e.VehicleId
+    WHERE e.Processed = 0 AND (@FleetId IS NULL OR v.FleetId = @FleetId);
 
-    -- Optional: compute completion rate as completed / total
-    -- Client can compute if needed
+    SELECT b.Id,
+           CASE WHEN d.Id IS NOT NULL THEN 'ok'
+                WHEN e.ExceptionId IS NULL OR v.FleetId <> @FleetId THEN 'not_found'
+                ELSE 'bad_status' END AS Outcome,
+           CASE WHEN e.Processed = 1 THEN N'已处理' ELSE N'未处理' END AS Status
+    FROM @Batch b
+    LEFT JOIN @Done d ON d.Id = b.Id
+    LEFT JOIN dbo.Exceptions e ON e.ExceptionId = b.Id
+    LEFT JOIN dbo.Vehicles v ON v.VehicleId = e.VehicleId
+    ORDER BY b.Id;
 END
 GO
@@ -4,6 +4,9 @@ IF DB_ID('LogisticsDB') IS NULL
 GO
 USE LogisticsDB;
 GO
+-- Read-only routes use SNAPSHOT isolation (row versions instead of shared locks)
+ALTER DATABASE LogisticsDB SET ALLOW_SNAPSHOT_ISOLATION ON;
+GO
 
 -- Centers
 CREATE TABLE dbo.Centers (
@@ -33,6 +36,7 @@ CREATE TABLE dbo.Drivers (
     Phone NVARCHAR(30) NULL,
     FleetId INT NOT NULL,
     CreatedAt DATETIME2 NOT NULL DEFAULT SYSDATETIME(),
+    RowVer ROWVERSION NOT NULL,
     CONSTRAINT CK_Drivers_LicenseLevel CHECK (LicenseLevel IN (N'C1', N'C2', N'B1', N'B2', N'A1', N'A2')),
     CONSTRAINT FK_Drivers_Fleets FOREIGN KEY (FleetId)
         REFERENCES dbo.Fleets(FleetId) ON DELETE NO ACTION ON UPDATE NO ACTION
@@ -47,6 +51,7 @@ CREATE TABLE dbo.Vehicles (
     MaxVolume DECIMAL(12,2) NOT NULL,
     Status NVARCHAR(20) NOT NULL DEFAULT N'空闲',
     CreatedAt DATETIME2 NOT NULL DEFAULT SYSDATETIME(),
+    RowVer ROWVERSION NOT NULL,
     CONSTRAINT CK_Vehicles_Status CHECK (Status IN (N'空闲', N'装货中', N'运输中', N'维修中', N'异常')),
     CONSTRAINT FK_Vehicles_Fleets FOREIGN KEY (FleetId)
         REFERENCES dbo.Fleets(FleetId) ON DELETE NO ACTION ON UPDATE NO ACTION
@@ -62,6 +67,7 @@ CREATE TABLE dbo.Orders (
     Destination NVARCHAR(200) NOT NULL,
     OrderDate DATETIME2 NOT NULL DEFAULT SYSDATETIME(),
     Status NVARCHAR(20) NOT NULL DEFAULT N'新建',
+    RowVer ROWVERSION NOT NULL,
     CONSTRAINT CK_Orders_Status CHECK (Status IN (N'新建', N'装货中', N'运输中', N'已完成', N'取消')),
     CONSTRAINT FK_Orders_Vehicles FOREIGN KEY (VehicleId)
         REFERENCES dbo.Vehicles(VehicleId) ON DELETE NO ACTION ON UPDATE NO ACTION,
@@ -80,6 +86,7 @@ CREATE TABLE dbo.Exceptions (
     FineAmount DECIMAL(12,2) NOT NULL DEFAULT 0,
     Processed BIT NOT NULL DEFAULT 0,
     ProcessedTime DATETIME2 NULL,
+    RowVer ROWVERSION NOT NULL,
     CONSTRAINT CK_Exceptions_Type CHECK (ExceptionType IN (N'货物破损', N'车辆故障', N'严重延误', N'超速报警')),
     CONSTRAINT CK_Exceptions_Phase CHECK (Phase IN (N'运输中异常', N'空闲时异常')),
     CONSTRAINT FK_Exceptions_Vehicles FOREIGN KEY (VehicleId)
@@ -100,8 +107,150 @@ CREATE TABLE dbo.History_Log (
     ChangedAt DATETIME2 NOT NULL DEFAULT SYSDATETIME()
 );
 
+-- FleetDailyStats (per-fleet daily rollup read by sp_fleet_monthly_report;
+-- maintained incrementally by the TR_*_FleetDailyStats triggers; RowVer
+-- versions the cached report of a fleet and period)
+CREATE TABLE dbo.FleetDailyStats (
+    FleetId INT NOT NULL,
+    StatDate DATE NOT NULL,
+    TotalOrders INT NOT NULL DEFAULT 0,
+    NewOrders INT NOT NULL DEFAULT 0,
+    LoadingOrders INT NOT NULL DEFAULT 0,
+    InTransitOrders INT NOT NULL DEFAULT 0,
+    CompletedOrders INT NOT NULL DEFAULT 0,
+    CancelledOrders INT NOT NULL DEFAULT 0,
+    TotalExceptions INT NOT NULL DEFAULT 0,
+    TotalFineAmount DECIMAL(14,2) NOT NULL DEFAULT 0,
+    RowVer ROWVERSION NOT NULL,
+    CONSTRAINT PK_FleetDailyStats PRIMARY KEY (FleetId, StatDate),
+    CONSTRAINT FK_FleetDailyStats_Fleets FOREIGN KEY (FleetId)
+        REFERENCES dbo.Fleets(FleetId) ON DELETE NO ACTION ON UPDATE NO ACTION
+);
+
+-- ChangeFeed (vehicle status and exception changes captured by the
+-- TR_*_ChangeFeed triggers; read by the web app's live feed poller)
+CREATE TABLE dbo.ChangeFeed (
+    FeedId BIGINT IDENTITY(1,1) PRIMARY KEY,
+    Kind NVARCHAR(30) NOT NULL,             -- vehicle_status / exception / exception_processed
+    FleetId INT NOT NULL,
+    VehicleId INT NOT NULL,
+    ExceptionId INT NULL,
+    OldValue NVARCHAR(50) NULL,
+    NewValue NVARCHAR(50) NULL,
+    ChangedAt DATETIME2 NOT NULL DEFAULT SYSDATETIME()
+);
+
+-- SyncTombstones (deleted Drivers / Vehicles / Orders / Exceptions rows for the
+-- delta sync API). DeletedVer comes from the same database-wide counter as the
+-- tables' RowVer, so one token orders inserts, updates and deletes.
+CREATE TABLE dbo.SyncTombstones (
+    Entity NVARCHAR(20) NOT NULL,
+    EntityId INT NOT NULL,
+    DeletedVer ROWVERSION NOT NULL,
+    DeletedAt DATETIME2 NOT NULL DEFAULT SYSDATETIME(),
+    CONSTRAINT PK_SyncTombstones PRIMARY KEY (Entity, DeletedVer)
+);
+
+-- Oldest sync token still served: raised by sp_purge_sync_tombstones
+CREATE TABLE dbo.SyncPurgeMark (
+    Id TINYINT NOT NULL PRIMARY KEY CHECK (Id = 1),
+    PurgedVer BINARY(8) NOT NULL
+);
+INSERT INTO dbo.SyncPurgeMark (Id, PurgedVer) VALUES (1, 0x0);
+
+-- Delta rows passed from the triggers to sp_apply_fleet_daily_delta
+CREATE TYPE dbo.FleetDailyDelta AS TABLE (
+    FleetId INT NOT NULL,
+    StatDate DATE NOT NULL,
+    TotalOrders INT NOT NULL DEFAULT 0,
+    NewOrders INT NOT NULL DEFAULT 0,
+    LoadingOrders INT NOT NULL DEFAULT 0,
+    InTransitOrders INT NOT NULL DEFAULT 0,
+    CompletedOrders INT NOT NULL DEFAULT 0,
+    CancelledOrders INT NOT NULL DEFAULT 0,
+    TotalExceptions INT NOT NULL DEFAULT 0,
+    TotalFineAmount DECIMAL(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (FleetId, StatDate)
+);
+
 -- Indexes
 CREATE UNIQUE INDEX IX_Vehicles_PlateNo ON dbo.Vehicles(PlateNo);
 CREATE INDEX IX_Orders_OrderDate ON dbo.Orders(OrderDate);
+CREATE INDEX IX_Orders_Vehicle_Status ON dbo.Orders(VehicleId, Status);
 CREATE INDEX IX_Drivers_EmployeeNo ON dbo.Drivers(EmployeeNo);
 CREATE INDEX IX_Exceptions_OccurTime ON dbo.Exceptions(OccurTime);
+-- MAX(RowVer) probes behind the JSON API ETags
+CREATE INDEX IX_Drivers_RowVer ON dbo.Drivers(RowVer);
+CREATE INDEX IX_Vehicles_RowVer ON dbo.Vehicles(RowVer);
+CREATE INDEX IX_Orders_RowVer ON dbo.Orders(RowVer);
+CREATE INDEX IX_Exceptions_RowVer ON dbo.Exceptions(RowVer);
+-- Open-exception lookup behind the telematics ingestion de-duplication
+CREATE INDEX IX_Exceptions_Open_Vehicle_Type ON dbo.Exceptions(VehicleId, ExceptionType, OccurTime) WHERE Processed = 0;
+-- Fleet-scoped lists and FleetId joins (drivers / vehicles pages, fleet filters, FK checks)
+CREATE INDEX IX_Drivers_FleetId ON dbo.Drivers(FleetId) INCLUDE (EmployeeNo, Name);
+CREATE INDEX IX_Vehicles_FleetId ON dbo.Vehicles(FleetId) INCLUDE (PlateNo, Status, MaxWeight, MaxVolume);
+-- Active orders of a vehicle (sign list, /api/orders/active, telematics driver lookup)
+CREATE INDEX IX_Orders_Active_Vehicle ON dbo.Orders(VehicleId, OrderDate) INCLUDE (DriverId, Status, Weight, Volume, Destination)
+    WHERE Status IN (N'新建', N'装货中', N'运输中');
+-- Per-driver / per-vehicle history by date (driver performance report, fleet moves, FK checks)
+CREATE INDEX IX_Orders_Driver_OrderDate ON dbo.Orders(DriverId, OrderDate) INCLUDE (Status, Weight, Volume);
+CREATE INDEX IX_Exceptions_Vehicle_OccurTime ON dbo.Exceptions(VehicleId, OccurTime) INCLUDE (FineAmount);
+CREATE INDEX IX_Exceptions_Driver_OccurTime ON dbo.Exceptions(DriverId, OccurTime)
+    INCLUDE (VehicleId, ExceptionType, Phase, FineAmount, Processed);
+-- Unprocessed exceptions newest first (exception processing list)
+CREATE INDEX IX_Exceptions_Unprocessed ON dbo.Exceptions(OccurTime)
+    INCLUDE (VehicleId, DriverId, ExceptionType, Phase, FineAmount) WHERE Processed = 0;
+-- ChangeFeed retention (sp_purge_change_feed)
+CREATE INDEX IX_ChangeFeed_ChangedAt ON dbo.ChangeFeed(ChangedAt);
+GO
+
+-- Archive of closed records, filled by sp_archive_closed_records: completed /
+-- cancelled orders and processed exceptions past the retention period, so the
+-- hot tables only hold active work and recent history. Both are partitioned by
+-- calendar month on the date column (the job adds the monthly boundaries) and
+-- page-compressed. Reports read hot + archive through vw_orders_all /
+-- vw_exceptions_all; FleetDailyStats keeps counting archived rows.
+CREATE PARTITION FUNCTION pf_ArchiveMonth (DATETIME2) AS RANGE RIGHT FOR VALUES ();
+CREATE PARTITION SCHEME ps_ArchiveMonth AS PARTITION pf_ArchiveMonth ALL TO ([PRIMARY]);
+GO
+
+CREATE TABLE dbo.OrdersArchive (
+    OrderId INT NOT NULL,
+    VehicleId INT NOT NULL,
+    DriverId INT NULL,
+    Weight DECIMAL(12,2) NOT NULL,
+    Volume DECIMAL(12,2) NOT NULL,
+    Destination NVARCHAR(200) NOT NULL,
+    OrderDate DATETIME2 NOT NULL,
+    Status NVARCHAR(20) NOT NULL,
+    ArchivedAt DATETIME2 NOT NULL DEFAULT SYSDATETIME(),
+    CONSTRAINT PK_OrdersArchive PRIMARY KEY (OrderDate, OrderId),
+    CONSTRAINT FK_OrdersArchive_Vehicles FOREIGN KEY (VehicleId) REFERENCES dbo.Vehicles(VehicleId),
+    CONSTRAINT FK_OrdersArchive_Drivers FOREIGN KEY (DriverId) REFERENCES dbo.Drivers(DriverId)
+) ON ps_ArchiveMonth (OrderDate) WITH (DATA_COMPRESSION = PAGE);
+
+CREATE TABLE dbo.ExceptionsArchive (
+    ExceptionId INT NOT NULL,
+    VehicleId INT NOT NULL,
+    DriverId INT NULL,
+    OccurTime DATETIME2 NOT NULL,
+    ExceptionType NVARCHAR(50) NOT NULL,
+    Phase NVARCHAR(20) NOT NULL,
+    FineAmount DECIMAL(12,2) NOT NULL,
+    Processed BIT NOT NULL,
+    ProcessedTime DATETIME2 NULL,
+    ArchivedAt DATETIME2 NOT NULL DEFAULT SYSDATETIME(),
+    CONSTRAINT PK_ExceptionsArchive PRIMARY KEY (OccurTime, ExceptionId),
+    CONSTRAINT FK_ExceptionsArchive_Vehicles FOREIGN KEY (VehicleId) REFERENCES dbo.Vehicles(VehicleId),
+    CONSTRAINT FK_ExceptionsArchive_Drivers FOREIGN KEY (DriverId) REFERENCES dbo.Drivers(DriverId)
+) ON ps_ArchiveMonth (OccurTime) WITH (DATA_COMPRESSION = PAGE);
+
+-- Archive indexes (partition-aligned): per-driver reports, fleet moves, FK checks
+CREATE INDEX IX_OrdersArchive_Driver_OrderDate ON dbo.OrdersArchive(DriverId, OrderDate)
+    INCLUDE (Status, Weight, Volume) WITH (DATA_COMPRESSION = PAGE);
+CREATE INDEX IX_OrdersArchive_Vehicle_OrderDate ON dbo.OrdersArchive(VehicleId, OrderDate)
+    INCLUDE (Status) WITH (DATA_COMPRESSION = PAGE);
+CREATE INDEX IX_ExceptionsArchive_Driver_OccurTime ON dbo.ExceptionsArchive(DriverId, OccurTime)
+    INCLUDE (VehicleId, ExceptionType, Phase, FineAmount, Processed) WITH (DATA_COMPRESSION = PAGE);
+CREATE INDEX IX_ExceptionsArchive_Vehicle_OccurTime ON dbo.ExceptionsArchive(VehicleId, OccurTime)
+    INCLUDE (FineAmount) WITH (DATA_COMPRESSION = PAGE);
@@ -9,23 +9,18 @@ AS
 BEGIN
     SET NOCOUNT ON;
     -- Validate against vehicle capacity
+    -- Current load comes from the VehicleLoad indexed view (one seek per vehicle)
     ;WITH NewByVehicle AS (
         SELECT VehicleId, SUM(Weight) AS NewWeight
         FROM inserted
         GROUP BY VehicleId
-    ), CurrLoad AS (
-        SELECT o.VehicleId, SUM(o.Weight) AS CurrWeight
-        FROM dbo.Orders o
-        WHERE o.Status IN (N'新建', N'装货中', N'运输中')
-          AND EXISTS (SELECT 1 FROM inserted i WHERE i.VehicleId = o.VehicleId)
-        GROUP BY o.VehicleId
     )
     SELECT v.VehicleId
     INTO #OverWeight
     FROM NewByVehicle n
     JOIN dbo.Vehicles v ON v.VehicleId = n.VehicleId
-    LEFT JOIN CurrLoad c ON c.VehicleId = n.VehicleId
-    WHERE (ISNULL(c.CurrWeight, 0) + n.NewWeight) > v.MaxWeight;
+    LEFT JOIN dbo.VehicleLoad l WITH (NOEXPAND) ON l.VehicleId = n.VehicleId
+    WHERE (ISNULL(l.AssignedWeight, 0) + n.NewWeight) > v.MaxWeight;
 
     IF EXISTS (SELECT 1 FROM #OverWeight)
     BEGIN
@@ -39,16 +34,14 @@ BEGIN
     SELECT VehicleId, DriverId, Weight, Volume, Destination, ISNULL(OrderDate, SYSDATETIME()), ISNULL(Status, N'新建')
     FROM inserted;
 
-        -- Set vehicle status to "装货中" when it has active orders (unless already 运输中)
-        UPDATE v
-        SET v.Status = N'装货中'
-        FROM dbo.Vehicles v
-        WHERE v.Status <> N'运输中'
-            AND EXISTS (
-                SELECT 1 FROM dbo.Orders o
-                WHERE o.VehicleId = v.VehicleId
-                    AND o.Status IN (N'新建', N'装货中', N'运输中')
-        );
+    -- Set vehicle status to "装货中" when it has active orders (unless already 运输中).
+    -- Only the vehicles in this statement are touched; rows already 装货中 are skipped.
+    UPDATE v
+    SET v.Status = N'装货中'
+    FROM dbo.Vehicles v
+    JOIN (SELECT DISTINCT VehicleId FROM inserted) t ON t.VehicleId = v.VehicleId
+    JOIN dbo.VehicleLoad l WITH (NOEXPAND) ON l.VehicleId = v.VehicleId
+    WHERE v.Status NOT IN (N'运输中', N'装货中');
 END
 GO
 
@@ -59,39 +52,25 @@ AFTER UPDATE
 AS
 BEGIN
     SET NOCOUNT ON;
-    -- When orders become/remain active and vehicle not departed, set to "装货中"
-    IF EXISTS (
-        SELECT 1 FROM inserted i
-        WHERE i.Status IN (N'新建', N'装货中', N'运输中')
-    )
-    BEGIN
-        UPDATE v
-        SET v.Status = N'装货中'
-        FROM dbo.Vehicles v
-        WHERE v.Status <> N'运输中'
-          AND EXISTS (
-              SELECT 1 FROM inserted i WHERE i.VehicleId = v.VehicleId
-          );
-    END
+    IF NOT UPDATE(Status) RETURN;
 
-    -- When orders complete, if no active orders remain, set vehicle to "空闲"
-    IF EXISTS (
-        SELECT 1 FROM inserted i
-        WHERE i.Status = N'已完成'
+    -- One set-based pass over the vehicles of the updated orders:
+    --   orders became/remain active and vehicle not departed -> "装货中"
+    --   orders completed and no active orders remain          -> "空闲"
+    ;WITH Touched AS (
+        SELECT i.VehicleId,
+               MAX(CASE WHEN i.Status IN (N'新建', N'装货中', N'运输中') THEN 1 ELSE 0 END) AS AnyActive,
+               MAX(CASE WHEN i.Status = N'已完成' THEN 1 ELSE 0 END) AS AnyCompleted
+        FROM inserted i
+        GROUP BY i.VehicleId
     )
-    BEGIN
-        UPDATE v
-        SET v.Status = N'空闲'
-        FROM dbo.Vehicles v
-        WHERE NOT EXISTS (
-            SELECT 1 FROM dbo.Orders o
-            WHERE o.VehicleId = v.VehicleId
-              AND o.Status IN (N'新建', N'装货中', N'运输中')
-        )
-        AND EXISTS (
-            SELECT 1 FROM inserted i WHERE i.VehicleId = v.VehicleId
-        );
-    END
+    UPDATE v
+    SET v.Status = CASE WHEN l.VehicleId IS NULL THEN N'空闲' ELSE N'装货中' END
+    FROM dbo.Vehicles v
+    JOIN Touched t ON t.VehicleId = v.VehicleId
+    LEFT JOIN dbo.VehicleLoad l WITH (NOEXPAND) ON l.VehicleId = v.VehicleId
+    WHERE (l.VehicleId IS NOT NULL AND t.AnyActive = 1 AND v.Status NOT IN (N'运输中', N'装货中'))
+       OR (l.VehicleId IS NULL AND t.AnyCompleted = 1 AND v.Status <> N'空闲');
 END
 GO
 
@@ -105,7 +84,8 @@ BEGIN
     UPDATE v
     SET v.Status = N'异常'
     FROM dbo.Vehicles v
-    WHERE EXISTS (SELECT 1 FROM inserted i WHERE i.VehicleId = v.VehicleId);
+    JOIN (SELECT DISTINCT VehicleId FROM inserted) t ON t.VehicleId = v.VehicleId
+    WHERE v.Status <> N'异常';
 END
 GO
 
@@ -116,6 +96,8 @@ AFTER UPDATE
 AS
 BEGIN
     SET NOCOUNT ON;
+    IF NOT UPDATE(Processed) RETURN;
+
     -- Audit logs when processed changes
     INSERT INTO dbo.History_Log (Entity, EntityId, Action, OldValue, NewValue, ChangedBy)
     SELECT N'Exception', d.ExceptionId, N'Processed',
@@ -126,24 +108,17 @@ BEGIN
     JOIN inserted i ON i.ExceptionId = d.ExceptionId
     WHERE ISNULL(d.Processed, 0) <> ISNULL(i.Processed, 0);
 
-    -- When processed=1, restore vehicle status
-    IF EXISTS (
-        SELECT 1 FROM inserted i
-        WHERE i.Processed = 1
-    )
-    BEGIN
-        UPDATE v
-        SET v.Status = CASE
-            WHEN EXISTS (
-                SELECT 1 FROM dbo.Orders o
-                WHERE o.VehicleId = v.VehicleId
-                  AND o.Status IN (N'新建', N'装货中', N'运输中')
-            ) THEN N'运输中' ELSE N'空闲' END
-        FROM dbo.Vehicles v
-        WHERE EXISTS (
-            SELECT 1 FROM inserted i WHERE i.VehicleId = v.VehicleId AND i.Processed = 1
-        );
-    END
+    -- When processed flips to 1, restore the status of those vehicles only
+    UPDATE v
+    SET v.Status = CASE WHEN l.VehicleId IS NOT NULL THEN N'运输中' ELSE N'空闲' END
+    FROM dbo.Vehicles v
+    JOIN (
+        SELECT DISTINCT i.VehicleId
+        FROM inserted i
+        JOIN deleted d ON d.ExceptionId = i.ExceptionId
+        WHERE i.Processed = 1 AND ISNULL(d.Processed, 0) = 0
+    ) t ON t.VehicleId = v.VehicleId
+    LEFT JOIN dbo.VehicleLoad l WITH (NOEXPAND) ON l.VehicleId = v.VehicleId;
 END
 GO
 
@@ -154,6 +129,7 @@ AFTER UPDATE
 AS
 BEGIN
     SET NOCOUNT ON;
+    IF NOT UPDATE(LicenseLevel) RETURN;
     INSERT INTO dbo.History_Log (Entity, EntityId, Action, OldValue, NewValue, ChangedBy)
     SELECT N'Driver', d.DriverId, N'LicenseLevelChange',
            CONCAT(N'LicenseLevel(old)=', d.LicenseLevel),
@@ -164,3 +140,230 @@ BEGIN
     WHERE d.LicenseLevel <> i.LicenseLevel;
 END
 GO
+
+-- 6) FleetDailyStats upkeep: each trigger below turns its inserted/deleted
+--    rows into signed per-(fleet, day) deltas and hands them to this procedure
+CREATE OR ALTER PROCEDURE dbo.sp_apply_fleet_daily_delta
+    @Delta dbo.FleetDailyDelta READONLY
+AS
+BEGIN
+    SET NOCOUNT ON;
+    MERGE dbo.FleetDailyStats WITH (HOLDLOCK) AS t
+    USING (
+        SELECT * FROM @Delta
+        WHERE TotalOrders <> 0 OR NewOrders <> 0 OR LoadingOrders <> 0 OR InTransitOrders <> 0
+           OR CompletedOrders <> 0 OR CancelledOrders <> 0 OR TotalExceptions <> 0 OR TotalFineAmount <> 0
+    ) AS s
+    ON t.FleetId = s.FleetId AND t.StatDate = s.StatDate
+    WHEN MATCHED THEN UPDATE SET
+        TotalOrders = t.TotalOrders + s.TotalOrders,
+        NewOrders = t.NewOrders + s.NewOrders,
+        LoadingOrders = t.LoadingOrders + s.LoadingOrders,
+        InTransitOrders = t.InTransitOrders + s.InTransitOrders,
+        CompletedOrders = t.CompletedOrders + s.CompletedOrders,
+        CancelledOrders = t.CancelledOrders + s.CancelledOrders,
+        TotalExceptions = t.TotalExceptions + s.TotalExceptions,
+        TotalFineAmount = t.TotalFineAmount + s.TotalFineAmount
+    WHEN NOT MATCHED THEN
+        INSERT (FleetId, StatDate, TotalOrders, NewOrders, LoadingOrders, InTransitOrders,
+                CompletedOrders, CancelledOrders, TotalExceptions, TotalFineAmount)
+        VALUES (s.FleetId, s.StatDate, s.TotalOrders, s.NewOrders, s.LoadingOrders, s.InTransitOrders,
+                s.CompletedOrders, s.CancelledOrders, s.TotalExceptions, s.TotalFineAmount);
+END
+GO
+
+CREATE OR ALTER TRIGGER dbo.TR_Orders_FleetDailyStats
+ON dbo.Orders
+AFTER INSERT, UPDATE, DELETE
+AS
+BEGIN
+    SET NOCOUNT ON;
+    IF NOT EXISTS (SELECT 1 FROM inserted) AND NOT EXISTS (SELECT 1 FROM deleted) RETURN;
+    IF EXISTS (SELECT 1 FROM deleted) AND NOT (UPDATE(Status) OR UPDATE(VehicleId) OR UPDATE(OrderDate))
+       AND EXISTS (SELECT 1 FROM inserted) RETURN;
+
+    DECLARE @Delta dbo.FleetDailyDelta;
+    INSERT INTO @Delta (FleetId, StatDate, TotalOrders, NewOrders, LoadingOrders, InTransitOrders,
+                        CompletedOrders, CancelledOrders)
+    SELECT v.FleetId, x.StatDate,
+           SUM(x.Sign),
+           SUM(CASE WHEN x.Status = N'新建' THEN x.Sign ELSE 0 END),
+           SUM(CASE WHEN x.Status = N'装货中' THEN x.Sign ELSE 0 END),
+           SUM(CASE WHEN x.Status = N'运输中' THEN x.Sign ELSE 0 END),
+           SUM(CASE WHEN x.Status = N'已完成' THEN x.Sign ELSE 0 END),
+           SUM(CASE WHEN x.Status = N'取消' THEN x.Sign ELSE 0 END)
+    FROM (
+        SELECT VehicleId, CAST(OrderDate AS DATE) AS StatDate, Status, 1 AS Sign FROM inserted
+        UNION ALL
+        SELECT d.VehicleId, CAST(d.OrderDate AS DATE), d.Status, -1 FROM deleted d
+        -- Orders moved to the archive (sp_archive_closed_records) stay counted
+        WHERE NOT EXISTS (SELECT 1 FROM dbo.OrdersArchive a WHERE a.OrderDate = d.OrderDate AND a.OrderId = d.OrderId)
+    ) x
+    JOIN dbo.Vehicles v ON v.VehicleId = x.VehicleId
+    GROUP BY v.FleetId, x.StatDate;
+
+    EXEC dbo.sp_apply_fleet_daily_delta @Delta;
+END
+GO
+
+CREATE OR ALTER TRIGGER dbo.TR_Exceptions_FleetDailyStats
+ON dbo.Exceptions
+AFTER INSERT, UPDATE, DELETE
+AS
+BEGIN
+    SET NOCOUNT ON;
+    IF NOT EXISTS (SELECT 1 FROM inserted) AND NOT EXISTS (SELECT 1 FROM deleted) RETURN;
+    -- Processing an exception (Processed / ProcessedTime) does not change the rollup
+    IF EXISTS (SELECT 1 FROM deleted) AND NOT (UPDATE(FineAmount) OR UPDATE(VehicleId) OR UPDATE(OccurTime))
+       AND EXISTS (SELECT 1 FROM inserted) RETURN;
+
+    DECLARE @Delta dbo.FleetDailyDelta;
+    INSERT INTO @Delta (FleetId, StatDate, TotalExceptions, TotalFineAmount)
+    SELECT v.FleetId, x.StatDate, SUM(x.Sign), SUM(x.Sign * x.FineAmount)
+    FROM (
+        SELECT VehicleId, CAST(OccurTime AS DATE) AS StatDate, FineAmount, 1 AS Sign FROM inserted
+        UNION ALL
+        SELECT d.VehicleId, CAST(d.OccurTime AS DATE), d.FineAmount, -1 FROM deleted d
+        -- Exceptions moved to the archive (sp_archive_closed_records) stay counted
+        WHERE NOT EXISTS (SELECT 1 FROM dbo.ExceptionsArchive a
+                          WHERE a.OccurTime = d.OccurTime AND a.ExceptionId = d.ExceptionId)
+    ) x
+    JOIN dbo.Vehicles v ON v.VehicleId = x.VehicleId
+    GROUP BY v.FleetId, x.StatDate;
+
+    EXEC dbo.sp_apply_fleet_daily_delta @Delta;
+END
+GO
+
+-- Moving a vehicle to another fleet moves its history (archived included) in the rollup as well
+CREATE OR ALTER TRIGGER dbo.TR_Vehicles_FleetDailyStats
+ON dbo.Vehicles
+AFTER UPDATE
+AS
+BEGIN
+    SET NOCOUNT ON;
+    IF NOT UPDATE(FleetId) RETURN;
+
+    DECLARE @Delta dbo.FleetDailyDelta;
+    ;WITH Moved AS (
+        SELECT i.VehicleId, d.FleetId AS OldFleetId, i.FleetId AS NewFleetId
+        FROM inserted i
+        JOIN deleted d ON d.VehicleId = i.VehicleId
+        WHERE i.FleetId <> d.FleetId
+    ),
+    Facts AS (
+        SELECT m.OldFleetId, m.NewFleetId, CAST(o.OrderDate AS DATE) AS StatDate,
+               1 AS Orders, o.Status, 0 AS Exceptions, CAST(0 AS DECIMAL(14,2)) AS Fine
+        FROM Moved m JOIN dbo.vw_orders_all o ON o.VehicleId = m.VehicleId
+        UNION ALL
+        SELECT m.OldFleetId, m.NewFleetId, CAST(e.OccurTime AS DATE),
+               0, NULL, 1, e.FineAmount
+        FROM Moved m JOIN dbo.vw_exceptions_all e ON e.VehicleId = m.VehicleId
+    ),
+    Signed AS (
+        SELECT OldFleetId AS FleetId, StatDate, -1 AS Sign, Orders, Status, Exceptions, Fine FROM Facts
+        UNION ALL
+        SELECT NewFleetId, StatDate, 1, Orders, Status, Exceptions, Fine FROM Facts
+    )
+    INSERT INTO @Delta (FleetId, StatDate, TotalOrders, NewOrders, LoadingOrders, InTransitOrders,
+                        CompletedOrders, CancelledOrders, TotalExceptions, TotalFineAmount)
+    SELECT FleetId, StatDate,
+           SUM(Sign * Orders),
+           SUM(CASE WHEN Status = N'新建' THEN Sign ELSE 0 END),
+           SUM(CASE WHEN Status = N'装货中' THEN Sign ELSE 0 END),
+           SUM(CASE WHEN Status = N'运输中' THEN Sign ELSE 0 END),
+           SUM(CASE WHEN Status = N'已完成' THEN Sign ELSE 0 END),
+           SUM(CASE WHEN Status = N'取消' THEN Sign ELSE 0 END),
+           SUM(Sign * Exceptions),
+           SUM(Sign * Fine)
+    FROM Signed
+    GROUP BY FleetId, StatDate;
+
+    EXEC dbo.sp_apply_fleet_daily_delta @Delta;
+END
+GO
+
+-- 7) ChangeFeed capture for the live feed. Vehicle status is only changed by
+--    the triggers above (nested trigger calls, on by default) or the vehicle
+--    pages, so one trigger on Vehicles sees every status change.
+CREATE OR ALTER TRIGGER dbo.TR_Vehicles_ChangeFeed
+ON dbo.Vehicles
+AFTER INSERT, UPDATE
+AS
+BEGIN
+    SET NOCOUNT ON;
+    IF NOT UPDATE(Status) RETURN;
+
+    INSERT INTO dbo.ChangeFeed (Kind, FleetId, VehicleId, OldValue, NewValue)
+    SELECT N'vehicle_status', i.FleetId, i.VehicleId, d.Status, i.Status
+    FROM inserted i
+    LEFT JOIN deleted d ON d.VehicleId = i.VehicleId
+    WHERE d.VehicleId IS NULL OR d.Status <> i.Status;
+END
+GO
+
+CREATE OR ALTER TRIGGER dbo.TR_Exceptions_ChangeFeed
+ON dbo.Exceptions
+AFTER INSERT, UPDATE
+AS
+BEGIN
+    SET NOCOUNT ON;
+    INSERT INTO dbo.ChangeFeed (Kind, FleetId, VehicleId, ExceptionId, OldValue, NewValue)
+    SELECT CASE WHEN d.ExceptionId IS NULL THEN N'exception' ELSE N'exception_processed' END,
+           v.FleetId, i.VehicleId, i.ExceptionId, i.Phase, i.ExceptionType
+    FROM inserted i
+    JOIN dbo.Vehicles v ON v.VehicleId = i.VehicleId
+    LEFT JOIN deleted d ON d.ExceptionId = i.ExceptionId
+    WHERE d.ExceptionId IS NULL OR (i.Processed = 1 AND d.Processed = 0);
+END
+GO
+
+-- 8) Tombstones for the delta sync API: one row per deleted record
+CREATE OR ALTER TRIGGER dbo.TR_Drivers_SyncTombstone
+ON dbo.Drivers
+AFTER DELETE
+AS
+BEGIN
+    SET NOCOUNT ON;
+    INSERT INTO dbo.SyncTombstones (Entity, EntityId)
+    SELECT N'drivers', DriverId FROM deleted;
+END
+GO
+
+CREATE OR ALTER TRIGGER dbo.TR_Vehicles_SyncTombstone
+ON dbo.Vehicles
+AFTER DELETE
+AS
+BEGIN
+    SET NOCOUNT ON;
+    INSERT INTO dbo.SyncTombstones (Entity, EntityId)
+    SELECT N'vehicles', VehicleId FROM deleted;
+END
+GO
+
+CREATE OR ALTER TRIGGER dbo.TR_Orders_SyncTombstone
+ON dbo.Orders
+AFTER DELETE
+AS
+BEGIN
+    SET NOCOUNT ON;
+    INSERT INTO dbo.SyncTombstones (Entity, EntityId)
+    SELECT N'orders', d.OrderId FROM deleted d
+    -- Archiving is not a delete: sync clients keep the row
+    WHERE NOT EXISTS (SELECT 1 FROM dbo.OrdersArchive a WHERE a.OrderDate = d.OrderDate AND a.OrderId = d.OrderId);
+END
+GO
+
+CREATE OR ALTER TRIGGER dbo.TR_Exceptions_SyncTombstone
+ON dbo.Exceptions
+AFTER DELETE
+AS
+BEGIN
+    SET NOCOUNT ON;
+    INSERT INTO dbo.SyncTombstones (Entity, EntityId)
+    SELECT N'exceptions', d.ExceptionId FROM deleted d
+    -- Archiving is not a delete: sync clients keep the row
+    WHERE NOT EXISTS (SELECT 1 FROM dbo.ExceptionsArchive a
+                      WHERE a.OccurTime = d.OccurTime AND a.ExceptionId = d.ExceptionId);
+END
+GO
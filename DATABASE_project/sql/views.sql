@@ -1,6 +1,28 @@
 USE LogisticsDB;
 GO
 
+-- Indexed view: active load per vehicle (assigned weight/volume, active order count).
+-- SQL Server maintains it incrementally on every Orders write, so readers get an
+-- O(1) seek instead of re-aggregating dbo.Orders.
+SET ANSI_NULLS ON;
+SET QUOTED_IDENTIFIER ON;
+GO
+CREATE OR ALTER VIEW dbo.VehicleLoad
+WITH SCHEMABINDING
+AS
+SELECT o.VehicleId,
+       SUM(o.Weight) AS AssignedWeight,
+       SUM(o.Volume) AS AssignedVolume,
+       COUNT_BIG(*) AS ActiveOrders
+FROM dbo.Orders o
+WHERE o.Status IN (N'新建', N'装货中', N'运输中')
+GROUP BY o.VehicleId;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_VehicleLoad_VehicleId' AND object_id = OBJECT_ID('dbo.VehicleLoad'))
+    CREATE UNIQUE CLUSTERED INDEX IX_VehicleLoad_VehicleId ON dbo.VehicleLoad(VehicleId);
+GO
+
 -- View: Weekly exception alerts
 CREATE OR ALTER VIEW dbo.vw_week_exception_alerts AS
 SELECT e.ExceptionId, e.OccurTime, e.ExceptionType, e.Phase, e.FineAmount, e.Processed,
@@ -18,14 +40,30 @@ GO
 -- View: Fleet vehicle load summary
 CREATE OR ALTER VIEW dbo.vw_fleet_vehicle_load AS
 SELECT v.VehicleId, v.PlateNo, v.FleetId, v.Status,
-       ISNULL(ActiveLoad.TotalWeight, 0) AS AssignedWeight,
-       v.MaxWeight - ISNULL(ActiveLoad.TotalWeight, 0) AS RemainingWeight,
-       ISNULL(ActiveLoad.TotalVolume, 0) AS AssignedVolume,
-       v.MaxVolume - ISNULL(ActiveLoad.TotalVolume, 0) AS RemainingVolume
+       ISNULL(l.AssignedWeight, 0) AS AssignedWeight,
+       v.MaxWeight - ISNULL(l.AssignedWeight, 0) AS RemainingWeight,
+       ISNULL(l.AssignedVolume, 0) AS AssignedVolume,
+       v.MaxVolume - ISNULL(l.AssignedVolume, 0) AS RemainingVolume,
+       CAST(ISNULL(l.ActiveOrders, 0) AS INT) AS ActiveOrders
 FROM dbo.Vehicles v
-OUTER APPLY (
-    SELECT SUM(o.Weight) AS TotalWeight, SUM(o.Volume) AS TotalVolume
-    FROM dbo.Orders o
-    WHERE o.VehicleId = v.VehicleId AND o.Status IN (N'新建', N'装货中', N'运输中')
-) ActiveLoad;
+LEFT JOIN dbo.VehicleLoad l WITH (NOEXPAND) ON l.VehicleId = v.VehicleId;
+GO
+
+-- Views: hot + archived orders / exceptions, for reports over any period.
+-- Date and driver / vehicle predicates reach both sides of the UNION ALL, so
+-- each seeks its own index (and only the archive partitions in range).
+CREATE OR ALTER VIEW dbo.vw_orders_all AS
+SELECT OrderId, VehicleId, DriverId, Weight, Volume, Destination, OrderDate, Status
+FROM dbo.Orders
+UNION ALL
+SELECT OrderId, VehicleId, DriverId, Weight, Volume, Destination, OrderDate, Status
+FROM dbo.OrdersArchive;
+GO
+
+CREATE OR ALTER VIEW dbo.vw_exceptions_all AS
+SELECT ExceptionId, VehicleId, DriverId, OccurTime, ExceptionType, Phase, FineAmount, Processed, ProcessedTime
+FROM dbo.Exceptions
+UNION ALL
+SELECT ExceptionId, VehicleId, DriverId, OccurTime, ExceptionType, Phase, FineAmount, Processed, ProcessedTime
+FROM dbo.ExceptionsArchive;
 GO
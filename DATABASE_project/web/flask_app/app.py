@@ -1,38 +1,264 @@
+import json
+import logging
+import math
 import os
-from flask import Flask, request, render_template, redirect, url_for, flash
+from datetime import date, timedelta
+from flask import Flask, Response, current_app, has_request_context, request, render_template, redirect, url_for, flash, jsonify, stream_with_context
 import pyodbc
 from dotenv import load_dotenv
+from werkzeug.local import LocalProxy
+from db_pool import ConnectionPool
+from query_metrics import QueryMetrics
+from page_queries import PageQueries
+from cache import TTLCache
+from fragment_cache import FileBackend, FragmentCache, MemoryBackend
+from pagination import Page, InvalidCursor, page_args, decode_id_cursor, time_seek
+from bulk_import import FIELDS as IMPORT_FIELDS, ImportFileError, read_rows, run_import
+import dispatch
+import batch_actions
+from etag import conditional_json
+from delta_sync import SYNC_ENTITIES, TokenExpired, changes as sync_changes, sync_args
+from live_feed import LiveFeed
+from telematics import AlarmIngestor
+from export import EXPORTS, export_query, csv_lines, csv_response, ndjson_lines, ndjson_response
 
-app = Flask(__name__)
-app.secret_key = os.getenv("APP_SECRET", "dev-secret")
 
-# SQL Server connection
-# Load environment variables from .env if present
-load_dotenv()
-SQL_SERVER = os.getenv("SQLSERVER_SERVER", "localhost")
-SQL_DB = os.getenv("SQLSERVER_DB", "LogisticsDB")
-SQL_USER = os.getenv("SQLSERVER_USER")
-SQL_PASSWORD = os.getenv("SQLSERVER_PASSWORD")
+# The app is built by create_app(): its config, connection pools, caches and
+# background workers are created there and kept in app.extensions. In the view
+# code below these names stand for the objects of the app serving the request.
+def _extension(name):
+    return LocalProxy(lambda: current_app.extensions[name])
 
-# Build connection string (SQL auth or Windows auth)
-if SQL_USER and SQL_PASSWORD:
-    CONN_STR = f"DRIVER={{ODBC Driver 17 for SQL Server}};SERVER={SQL_SERVER};DATABASE={SQL_DB};UID={SQL_USER};PWD={SQL_PASSWORD}"
-else:
-    # Windows Integrated Authentication
-    CONN_STR = f"DRIVER={{ODBC Driver 17 for SQL Server}};SERVER={SQL_SERVER};DATABASE={SQL_DB};Trusted_Connection=yes;"
+
+pool = _extension("pool")
+read_pool = _extension("read_pool")
+query_metrics = _extension("query_metrics")
+page_queries = _extension("page_queries")
+ref_cache = _extension("ref_cache")
+fragment_cache = _extension("fragment_cache")
+live_feed = _extension("live_feed")
+alarm_ingestor = _extension("alarm_ingestor")
+MAX_ALARMS_PER_REQUEST = 5000
+
+_routes = []
+
+
+def route(rule, **options):
+    """Same arguments as ``app.route``; init_routes() registers the view on an app."""
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
+
+
+def init_routes(app):
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+
+
+def load_config():
+    """Secret key and database targets from the environment (and .env)."""
+    # Load environment variables from .env if present
+    load_dotenv()
+    sql_server = os.getenv("SQLSERVER_SERVER", "localhost")
+    sql_db = os.getenv("SQLSERVER_DB", "LogisticsDB")
+    sql_user = os.getenv("SQLSERVER_USER")
+    sql_password = os.getenv("SQLSERVER_PASSWORD")
+
+    # Build connection string (SQL auth or Windows auth)
+    if sql_user and sql_password:
+        conn_str = f"DRIVER={{ODBC Driver 17 for SQL Server}};SERVER={sql_server};DATABASE={sql_db};UID={sql_user};PWD={sql_password}"
+    else:
+        # Windows Integrated Authentication
+        conn_str = f"DRIVER={{ODBC Driver 17 for SQL Server}};SERVER={sql_server};DATABASE={sql_db};Trusted_Connection=yes;"
+
+    # Read-only routes (reports, views, JSON feeds, exports; see @read_only) get
+    # their own pool and target: SQLSERVER_READ_CONN_STR (e.g. a replica DSN), or
+    # the primary with ApplicationIntent=ReadOnly when SQLSERVER_READ_INTENT=1 (an
+    # availability group listener then routes to a readable secondary), otherwise
+    # the primary itself. Those sessions read under SNAPSHOT isolation (row
+    # versions, no shared locks), so long report scans and the trigger-heavy
+    # writes stop blocking each other.
+    if os.getenv("SQLSERVER_READ_CONN_STR"):
+        read_conn_str = os.getenv("SQLSERVER_READ_CONN_STR")
+    elif os.getenv("SQLSERVER_READ_INTENT") == "1":
+        read_conn_str = conn_str.rstrip(";") + ";ApplicationIntent=ReadOnly"
+    else:
+        read_conn_str = conn_str
+    read_isolation = os.getenv("DB_READ_ISOLATION", "SNAPSHOT").upper()
+    if read_isolation not in ("SNAPSHOT", "READ COMMITTED"):
+        raise ValueError(f"DB_READ_ISOLATION 只能是 SNAPSHOT 或 READ COMMITTED：{read_isolation}")
+    return {
+        "SECRET_KEY": os.getenv("APP_SECRET", "dev-secret"),
+        "CONN_STR": conn_str,
+        "READ_CONN_STR": read_conn_str,
+        "READ_ISOLATION": read_isolation,
+    }
+
+
+def read_only(view):
+    """Declare a route read-only: its get_conn() comes from read_pool.
+
+    Place it directly under @route. Pages that also take a POST stay on
+    the primary so the redirect after a write shows that write.
+    """
+    view.read_only = True
+    return view
 
 
 def get_conn():
-    return pyodbc.connect(CONN_STR)
+    view = current_app.view_functions.get(request.endpoint) if has_request_context() else None
+    target = read_pool if getattr(view, "read_only", False) else pool
+    return query_metrics.wrap(target.request_conn())
+
 
+def exec_write(sql, params):
+    """EXEC one of the write procedures (sp_assign_order, sp_vehicle_depart, ...),
+    commit, and flash its Message; returns the ResultCode (0 on success)."""
+    conn = get_conn()
+    row = conn.execute(sql, params).fetchone()
+    conn.commit()
+    flash(row.Message, "success" if row.ResultCode == 0 else "error")
+    return row.ResultCode
 
-@app.route("/")
+
+def fleet_options():
+    return ref_cache.get(("fleets",), lambda: get_conn().execute(
+        "SELECT FleetId, Name FROM dbo.Fleets ORDER BY Name").fetchall())
+
+
+def driver_options():
+    return ref_cache.get(("drivers",), lambda: get_conn().execute(
+        "SELECT DriverId, Name FROM dbo.Drivers ORDER BY Name").fetchall())
+
+
+def vehicle_options():
+    return ref_cache.get(("vehicles",), lambda: get_conn().execute(
+        "SELECT VehicleId, PlateNo FROM dbo.Vehicles ORDER BY PlateNo").fetchall())
+
+
+@route("/stats")
+def stats():
+    return jsonify(pool=pool.stats(), read_pool=read_pool.stats(), ref_cache=ref_cache.stats(),
+                   fragment_cache=fragment_cache.stats(), live_feed=live_feed.stats(),
+                   telematics=alarm_ingestor.stats(), query_metrics=query_metrics.stats())
+
+
+@route("/metrics")
+def metrics():
+    pools = {"primary": pool.stats(), "read": read_pool.stats()}
+    gauges = [
+        "# HELP fleet_db_pool_connections Pooled connections by state.",
+        "# TYPE fleet_db_pool_connections gauge",
+    ]
+    for name, p in pools.items():
+        gauges += [f'fleet_db_pool_connections{{pool="{name}",state="idle"}} {p["idle"]}',
+                   f'fleet_db_pool_connections{{pool="{name}",state="in_use"}} {p["in_use"]}']
+    gauges += [
+        "# HELP fleet_db_pool_wait_seconds_total Time spent waiting for a pooled connection.",
+        "# TYPE fleet_db_pool_wait_seconds_total counter",
+    ]
+    gauges += [f'fleet_db_pool_wait_seconds_total{{pool="{name}"}} {p["wait_seconds_total"]}'
+               for name, p in pools.items()]
+    gauges += [
+        "# HELP fleet_db_pool_timeouts_total Checkouts that gave up waiting.",
+        "# TYPE fleet_db_pool_timeouts_total counter",
+    ]
+    gauges += [f'fleet_db_pool_timeouts_total{{pool="{name}"}} {p["timeouts"]}' for name, p in pools.items()]
+    fragments = fragment_cache.stats()
+    gauges += [
+        "# HELP fleet_fragment_cache_lookups_total Rendered fragment lookups by fragment and result.",
+        "# TYPE fleet_fragment_cache_lookups_total counter",
+    ]
+    for name, f in sorted(fragments["fragments"].items()):
+        gauges += [f'fleet_fragment_cache_lookups_total{{fragment="{name}",result="hit"}} {f["hits"]}',
+                   f'fleet_fragment_cache_lookups_total{{fragment="{name}",result="miss"}} {f["misses"]}']
+    gauges += [
+        "# HELP fleet_fragment_cache_bytes Bytes held by the fragment cache.",
+        "# TYPE fleet_fragment_cache_bytes gauge",
+        f'fleet_fragment_cache_bytes{{backend="{fragments["backend"]}"}} {fragments["bytes"]}',
+    ]
+    return Response(query_metrics.render(gauges), mimetype="text/plain; version=0.0.4")
+
+
+# Keyset pagination: every list page seeks past the last key of the previous
+# page (TOP (n + 1) ... WHERE key < cursor), so deep pages cost the same as
+# the first one and only one page of rows is held in memory.
+def _fleet_filter(column, conditions, params):
+    selected_fleet_id = request.args.get("fleet_id")
+    if selected_fleet_id:
+        try:
+            params.append(int(selected_fleet_id))
+            conditions.append(f"{column} = ?")
+        except ValueError:
+            flash("车队筛选参数无效", "error")
+            selected_fleet_id = None
+    return selected_fleet_id
+
+
+def _seek(cursor, decode, condition, conditions, params):
+    if not cursor:
+        return None
+    try:
+        key = decode(cursor)
+    except InvalidCursor:
+        flash("分页参数无效，已返回第一页", "error")
+        return None
+    params.extend([key] * condition.count("?"))
+    conditions.append(condition)
+    return cursor
+
+
+def _where(conditions):
+    return ("WHERE " + " AND ".join(conditions)) if conditions else ""
+
+
+def drivers_page(conn):
+    page_size, cursor = page_args(request.args)
+    conditions, params = [], [page_size + 1]
+    selected_fleet_id = _fleet_filter("d.FleetId", conditions, params)
+    cursor = _seek(cursor, decode_id_cursor, "d.DriverId < ?", conditions, params)
+    rows = conn.execute(
+        f"""
+        SELECT TOP (?) d.DriverId, d.EmployeeNo, d.Name, d.LicenseLevel, d.Phone,
+               d.FleetId, f.Name AS FleetName
+        FROM dbo.Drivers d
+        JOIN dbo.Fleets f ON f.FleetId = d.FleetId
+        {_where(conditions)}
+        ORDER BY d.DriverId DESC
+        """,
+        params,
+    ).fetchall()
+    return Page(rows, page_size, lambda r: (r.DriverId,), cursor, "drivers", fleet_id=selected_fleet_id)
+
+
+def vehicles_page(conn):
+    page_size, cursor = page_args(request.args)
+    conditions, params = [], [page_size + 1]
+    selected_fleet_id = _fleet_filter("v.FleetId", conditions, params)
+    cursor = _seek(cursor, decode_id_cursor, "v.VehicleId < ?", conditions, params)
+    rows = conn.execute(
+        f"""
+        SELECT TOP (?) v.VehicleId, v.PlateNo, v.MaxWeight, v.MaxVolume, v.Status, v.FleetId, f.Name AS FleetName,
+               ISNULL(l.ActiveOrders, 0) AS ActiveOrders
+        FROM dbo.Vehicles v
+        JOIN dbo.Fleets f ON f.FleetId = v.FleetId
+        LEFT JOIN dbo.VehicleLoad l WITH (NOEXPAND) ON l.VehicleId = v.VehicleId
+        {_where(conditions)}
+        ORDER BY v.VehicleId DESC
+        """,
+        params,
+    ).fetchall()
+    return Page(rows, page_size, lambda r: (r.VehicleId,), cursor, "vehicles", fleet_id=selected_fleet_id)
+
+
+@route("/")
 def index():
     return render_template("index.html")
 
 
 # Drivers CRUD (create minimal)
-@app.route("/drivers", methods=["GET", "POST"])
+@route("/drivers", methods=["GET", "POST"])
 def drivers():
     if request.method == "POST":
         employee_no = request.form.get("employee_no")
@@ -53,27 +279,21 @@ def drivers():
                         (employee_no, name, license_level, phone, int(fleet_id))
                     )
                     conn.commit()
+                    ref_cache.invalidate("drivers")
                     flash("司机已创建", "success")
             except pyodbc.Error as e:
                 flash(f"数据库错误：{e}", "error")
         return redirect(url_for("drivers"))
 
-    # GET: fetch drivers and fleets for dropdown
+    # GET: fetch one page of drivers and fleets for dropdown
     with get_conn() as conn:
-        drivers = conn.execute(
-            """
-            SELECT d.DriverId, d.EmployeeNo, d.Name, d.LicenseLevel, d.Phone,
-                   d.FleetId, f.Name AS FleetName
-            FROM dbo.Drivers d
-            JOIN dbo.Fleets f ON f.FleetId = d.FleetId
-            ORDER BY d.DriverId DESC
-            """
-        ).fetchall()
-        fleets = conn.execute("SELECT FleetId, Name FROM dbo.Fleets ORDER BY Name").fetchall()
-    return render_template("drivers.html", drivers=drivers, fleets=fleets, edit_driver=None)
+        page = drivers_page(conn)
+        fleets = fleet_options()
+    return render_template("drivers.html", drivers=page.rows, page=page, fleets=fleets,
+                           selected_fleet_id=page.filters.get("fleet_id"), edit_driver=None)
 
 
-@app.route("/drivers/edit/<int:driver_id>", methods=["GET", "POST"])
+@route("/drivers/edit/<int:driver_id>", methods=["GET", "POST"])
 def edit_driver(driver_id: int):
     if request.method == "POST":
         employee_no = request.form.get("employee_no")
@@ -98,14 +318,15 @@ def edit_driver(driver_id: int):
                         (employee_no, name, license_level, phone, int(fleet_id), driver_id),
                     )
                     conn.commit()
+                    ref_cache.invalidate("drivers")
                     flash("司机信息已更新", "success")
                     return redirect(url_for("drivers"))
             except pyodbc.Error as e:
                 flash(f"数据库错误：{e}", "error")
 
     # GET or failed POST: reload data with edit target
-    with get_conn() as conn:
-        edit_driver = conn.execute(
+    edit_driver, page, fleets = page_queries.run(
+        lambda: get_conn().execute(
             """
             SELECT d.DriverId, d.EmployeeNo, d.Name, d.LicenseLevel, d.Phone,
                    d.FleetId, f.Name AS FleetName
@@ -114,29 +335,24 @@ def edit_driver(driver_id: int):
             WHERE d.DriverId = ?
             """,
             (driver_id,),
-        ).fetchone()
-        drivers = conn.execute(
-            """
-            SELECT d.DriverId, d.EmployeeNo, d.Name, d.LicenseLevel, d.Phone,
-                   d.FleetId, f.Name AS FleetName
-            FROM dbo.Drivers d
-            JOIN dbo.Fleets f ON f.FleetId = d.FleetId
-            ORDER BY d.DriverId DESC
-            """
-        ).fetchall()
-        fleets = conn.execute("SELECT FleetId, Name FROM dbo.Fleets ORDER BY Name").fetchall()
+        ).fetchone(),
+        lambda: drivers_page(get_conn()),
+        fleet_options,
+    )
     if not edit_driver:
         flash("未找到该司机", "error")
         return redirect(url_for("drivers"))
-    return render_template("drivers.html", drivers=drivers, fleets=fleets, edit_driver=edit_driver)
+    return render_template("drivers.html", drivers=page.rows, page=page, fleets=fleets,
+                           selected_fleet_id=page.filters.get("fleet_id"), edit_driver=edit_driver)
 
 
-@app.route("/drivers/delete/<int:driver_id>", methods=["POST"])
+@route("/drivers/delete/<int:driver_id>", methods=["POST"])
 def delete_driver(driver_id: int):
     try:
         with get_conn() as conn:
             conn.execute("DELETE FROM dbo.Drivers WHERE DriverId = ?", (driver_id,))
             conn.commit()
+            ref_cache.invalidate("drivers")
             flash("司机已删除", "success")
     except pyodbc.Error as e:
         flash(f"删除失败，可能存在关联数据：{e}", "error")
@@ -144,7 +360,7 @@ def delete_driver(driver_id: int):
 
 
 # Vehicles CRUD (create minimal)
-@app.route("/vehicles", methods=["GET", "POST"])
+@route("/vehicles", methods=["GET", "POST"])
 def vehicles():
     if request.method == "POST":
         plate_no = request.form.get("plate_no")
@@ -166,92 +382,42 @@ def vehicles():
                         (int(fleet_id), plate_no, float(max_weight), float(max_volume))
                     )
                     conn.commit()
+                    ref_cache.invalidate("vehicles")
                     flash("车辆已创建", "success")
             except pyodbc.Error as e:
                 flash(f"数据库错误：{e}", "error")
         return redirect(url_for("vehicles"))
 
-    selected_fleet_id = request.args.get("fleet_id")
-    where_clause = ""
-    params = []
-    if selected_fleet_id:
-        try:
-            params.append(int(selected_fleet_id))
-            where_clause = "WHERE v.FleetId = ?"
-        except ValueError:
-            flash("车队筛选参数无效", "error")
-
     with get_conn() as conn:
-        vehicles = conn.execute(
-            f"""
-            SELECT v.VehicleId, v.PlateNo, v.MaxWeight, v.MaxVolume, v.Status, v.FleetId, f.Name AS FleetName,
-                   ISNULL(o.ActiveOrders, 0) AS ActiveOrders
-            FROM dbo.Vehicles v
-            JOIN dbo.Fleets f ON f.FleetId = v.FleetId
-            OUTER APPLY (
-                SELECT COUNT(*) AS ActiveOrders
-                FROM dbo.Orders o
-                WHERE o.VehicleId = v.VehicleId AND o.Status IN (N'新建', N'装货中', N'运输中')
-            ) o
-            {where_clause}
-            ORDER BY v.VehicleId DESC
-            """,
-            params,
-        ).fetchall()
-        fleets = conn.execute("SELECT FleetId, Name FROM dbo.Fleets ORDER BY Name").fetchall()
-    return render_template("vehicles.html", vehicles=vehicles, fleets=fleets, selected_fleet_id=selected_fleet_id, edit_vehicle=None)
+        page = vehicles_page(conn)
+        fleets = fleet_options()
+    return render_template("vehicles.html", vehicles=page.rows, page=page, fleets=fleets,
+                           selected_fleet_id=page.filters.get("fleet_id"), edit_vehicle=None)
 
 
-@app.route("/vehicles/depart/<int:vehicle_id>", methods=["POST"])
+@route("/vehicles/depart/<int:vehicle_id>", methods=["POST"])
 def vehicle_depart(vehicle_id: int):
     try:
-        with get_conn() as conn:
-            row = conn.execute(
-                "SELECT Status FROM dbo.Vehicles WHERE VehicleId = ?",
-                (vehicle_id,)
-            ).fetchone()
-            if not row:
-                flash("车辆不存在", "error")
-                return redirect(url_for("vehicles"))
-            if row[0] == "运输中":
-                flash("车辆已在运输中", "error")
-                return redirect(url_for("vehicles"))
-
-            active_orders = conn.execute(
-                """
-                SELECT COUNT(*) FROM dbo.Orders
-                WHERE VehicleId = ? AND Status IN (N'新建', N'装货中', N'运输中')
-                """,
-                (vehicle_id,),
-            ).fetchone()[0]
-            if active_orders == 0:
-                flash("该车辆没有待运单，无法发车", "error")
-                return redirect(url_for("vehicles"))
-
-            conn.execute(
-                "UPDATE dbo.Vehicles SET Status = N'运输中' WHERE VehicleId = ?",
-                (vehicle_id,)
-            )
-            conn.commit()
-            flash("车辆已发车，状态变更为运输中", "success")
+        exec_write("EXEC dbo.sp_vehicle_depart @VehicleId = ?", (vehicle_id,))
     except pyodbc.Error as e:
         flash(f"数据库错误：{e}", "error")
     return redirect(url_for("vehicles"))
 
 
-@app.route("/vehicles/delete/<int:vehicle_id>", methods=["POST"])
+@route("/vehicles/delete/<int:vehicle_id>", methods=["POST"])
 def delete_vehicle(vehicle_id: int):
     try:
         with get_conn() as conn:
             conn.execute("DELETE FROM dbo.Vehicles WHERE VehicleId = ?", (vehicle_id,))
             conn.commit()
+            ref_cache.invalidate("vehicles")
             flash("车辆已删除", "success")
     except pyodbc.Error as e:
         flash(f"删除失败，可能存在关联数据：{e}", "error")
     return redirect(url_for("vehicles"))
 
 
-@app.route("/vehicles/edit/<int:vehicle_id>", methods=["GET", "POST"])
+@route("/vehicles/edit/<int:vehicle_id>", methods=["GET", "POST"])
 def edit_vehicle(vehicle_id: int):
     if request.method == "POST":
         plate_no = request.form.get("plate_no")
@@ -276,6 +442,7 @@ def edit_vehicle(vehicle_id: int):
                         (plate_no, float(max_weight), float(max_volume), int(fleet_id), vehicle_id),
                     )
                     conn.commit()
+                    ref_cache.invalidate("vehicles")
                     flash("车辆信息已更新", "success")
                     return redirect(url_for("vehicles"))
             except pyodbc.Error as e:
@@ -283,57 +450,30 @@ def edit_vehicle(vehicle_id: int):
             except (TypeError, ValueError):
                 flash("输入格式无效", "error")
 
-    selected_fleet_id = request.args.get("fleet_id")
-    where_clause = ""
-    params = []
-    if selected_fleet_id:
-        try:
-            params.append(int(selected_fleet_id))
-            where_clause = "WHERE v.FleetId = ?"
-        except ValueError:
-            flash("车队筛选参数无效", "error")
-
-    with get_conn() as conn:
-        edit_vehicle = conn.execute(
+    edit_vehicle, page, fleets = page_queries.run(
+        lambda: get_conn().execute(
             """
             SELECT v.VehicleId, v.PlateNo, v.MaxWeight, v.MaxVolume, v.Status, v.FleetId, f.Name AS FleetName,
-                   ISNULL(o.ActiveOrders, 0) AS ActiveOrders
+                   ISNULL(l.ActiveOrders, 0) AS ActiveOrders
             FROM dbo.Vehicles v
             JOIN dbo.Fleets f ON f.FleetId = v.FleetId
-            OUTER APPLY (
-                SELECT COUNT(*) AS ActiveOrders
-                FROM dbo.Orders o
-                WHERE o.VehicleId = v.VehicleId AND o.Status IN (N'新建', N'装货中', N'运输中')
-            ) o
+            LEFT JOIN dbo.VehicleLoad l WITH (NOEXPAND) ON l.VehicleId = v.VehicleId
             WHERE v.VehicleId = ?
             """,
             (vehicle_id,),
-        ).fetchone()
-        vehicles = conn.execute(
-            f"""
-            SELECT v.VehicleId, v.PlateNo, v.MaxWeight, v.MaxVolume, v.Status, v.FleetId, f.Name AS FleetName,
-                   ISNULL(o.ActiveOrders, 0) AS ActiveOrders
-            FROM dbo.Vehicles v
-            JOIN dbo.Fleets f ON f.FleetId = v.FleetId
-            OUTER APPLY (
-                SELECT COUNT(*) AS ActiveOrders
-                FROM dbo.Orders o
-                WHERE o.VehicleId = v.VehicleId AND o.Status IN (N'新建', N'装货中', N'运输中')
-            ) o
-            {where_clause}
-            ORDER BY v.VehicleId DESC
-            """,
-            params,
-        ).fetchall()
-        fleets = conn.execute("SELECT FleetId, Name FROM dbo.Fleets ORDER BY Name").fetchall()
+        ).fetchone(),
+        lambda: vehicles_page(get_conn()),
+        fleet_options,
+    )
     if not edit_vehicle:
         flash("未找到该车辆", "error")
         return redirect(url_for("vehicles"))
-    return render_template("vehicles.html", vehicles=vehicles, fleets=fleets, selected_fleet_id=selected_fleet_id, edit_vehicle=edit_vehicle)
+    return render_template("vehicles.html", vehicles=page.rows, page=page, fleets=fleets,
+                           selected_fleet_id=page.filters.get("fleet_id"), edit_vehicle=edit_vehicle)
 
 
 # Assign order to vehicle
-@app.route("/orders/assign", methods=["GET", "POST"])
+@route("/orders/assign", methods=["GET", "POST"])
 def assign_order():
     if request.method == "POST":
         vehicle_id = request.form.get("vehicle_id")
@@ -341,31 +481,14 @@ def assign_order():
         weight = request.form.get("weight")
         volume = request.form.get("volume")
         destination = request.form.get("destination")
-        # Require driver selection
-        if not driver_id:
-            flash("必须选择司机", "error")
-            return redirect(url_for("assign_order"))
         try:
-            driver_id_int = int(driver_id)
-            with get_conn() as conn:
-                # Block assigning when vehicle already departed (运输中)
-                status_row = conn.execute(
-                    "SELECT Status FROM dbo.Vehicles WHERE VehicleId = ?",
-                    (int(vehicle_id),)
-                ).fetchone()
-                if not status_row:
-                    flash("车辆不存在", "error")
-                    return redirect(url_for("assign_order"))
-                if status_row[0] == "运输中":
-                    flash("车辆已发车，无法再添加运单", "error")
-                    return redirect(url_for("assign_order"))
-
-                conn.execute(
-                    "INSERT INTO dbo.Orders(VehicleId, DriverId, Weight, Volume, Destination, Status) VALUES (?, ?, ?, ?, ?, N'新建')",
-                    (int(vehicle_id), driver_id_int, float(weight), float(volume), destination)
-                )
-                conn.commit()
-                flash("运单已分配", "success")
+            # Checks (driver required, not departed, capacity) and the insert
+            # run in sp_assign_order with the vehicle row locked
+            exec_write(
+                """EXEC dbo.sp_assign_order @VehicleId = ?, @DriverId = ?, @Weight = ?, @Volume = ?,
+                       @Destination = ?, @RequireDriver = 1, @BlockDeparted = 1""",
+                (int(vehicle_id), int(driver_id) if driver_id else None, float(weight), float(volume), destination),
+            )
         except pyodbc.Error as e:
             msg = str(e)
             if "51000" in msg or "超出最大载重" in msg:
@@ -373,7 +496,7 @@ def assign_order():
             else:
                 flash(f"数据库错误：{e}", "error")
         except (TypeError, ValueError):
-            flash("司机选择无效", "error")
+            flash("车辆、司机、重量或体积无效", "error")
         return redirect(url_for("assign_order"))
 
     with get_conn() as conn:
@@ -381,52 +504,52 @@ def assign_order():
         vehicles = conn.execute(
             "SELECT VehicleId, PlateNo, Status, RemainingWeight FROM dbo.vw_fleet_vehicle_load WHERE Status IN (N'空闲', N'装货中') AND RemainingWeight > 0 ORDER BY PlateNo"
         ).fetchall()
-        drivers = conn.execute("SELECT DriverId, Name FROM dbo.Drivers ORDER BY Name").fetchall()
-    return render_template("assign_order.html", vehicles=vehicles, drivers=drivers)
+    return render_template("assign_order.html", vehicles=vehicles, drivers=driver_options())
 
 
-# Sign (complete) an order
-@app.route("/orders/sign", methods=["GET", "POST"])
+# Sign (complete) orders: one or many per POST, in a single UPDATE
+SIGN_REASONS = {"not_found": "未找到该运单", "bad_status": "状态为{status}，仅可签收 新建/装货中/运输中 的运单"}
+
+
+@route("/orders/sign", methods=["GET", "POST"])
 def sign_order():
     if request.method == "POST":
-        order_id = request.form.get("order_id")
+        # A row's own button posts order_id; the batch button posts the ticked order_ids
         try:
+            ids = batch_actions.parse_ids(request.form.getlist("order_id") or request.form.getlist("order_ids"))
             with get_conn() as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT Status FROM dbo.Orders WHERE OrderId = ?", (int(order_id),))
-                row = cursor.fetchone()
-                if not row:
-                    flash("未找到该运单", "error")
-                elif row[0] not in ["新建", "装货中", "运输中"]:
-                    flash("仅可签收状态为 新建/装货中/运输中的运单", "error")
-                else:
-                    cursor.execute(
-                        "UPDATE dbo.Orders SET Status = N'已完成' WHERE OrderId = ?",
-                        (int(order_id),)
-                    )
-                    conn.commit()
-                    flash("运单已签收，车辆状态将自动更新", "success")
+                outcomes = batch_actions.sign_orders(conn, ids)
+            flash(*batch_actions.summarize(outcomes, "已签收 {} 条运单，车辆状态将自动更新", SIGN_REASONS))
+        except ValueError as e:
+            flash(str(e), "error")
         except pyodbc.Error as e:
             flash(f"数据库错误：{e}", "error")
         return redirect(url_for("sign_order"))
 
+    page_size, cursor = page_args(request.args)
+    conditions, params = ["o.Status IN (N'新建', N'装货中', N'运输中')"], [page_size + 1]
+    selected_fleet_id = _fleet_filter("v.FleetId", conditions, params)
+    cursor = _seek(cursor, decode_id_cursor,
+                   time_seek("o", "dbo.Orders", "OrderDate", "OrderId"), conditions, params)
     with get_conn() as conn:
-        orders = conn.execute(
-            """
-            SELECT o.OrderId, o.Status, o.Weight, o.Volume, o.Destination, o.OrderDate,
+        rows = conn.execute(
+            f"""
+            SELECT TOP (?) o.OrderId, o.Status, o.Weight, o.Volume, o.Destination, o.OrderDate,
                    v.PlateNo, d.Name AS DriverName
             FROM dbo.Orders o
             JOIN dbo.Vehicles v ON v.VehicleId = o.VehicleId
             LEFT JOIN dbo.Drivers d ON d.DriverId = o.DriverId
-            WHERE o.Status IN (N'新建', N'装货中', N'运输中')
-            ORDER BY o.OrderDate DESC
-            """
+            {_where(conditions)}
+            ORDER BY o.OrderDate DESC, o.OrderId DESC
+            """,
+            params,
         ).fetchall()
-    return render_template("sign_order.html", orders=orders)
+    page = Page(rows, page_size, lambda r: (r.OrderId,), cursor, "sign_order", fleet_id=selected_fleet_id)
+    return render_template("sign_order.html", orders=page.rows, page=page)
 
 
 # Record exception
-@app.route("/exceptions", methods=["GET", "POST"])
+@route("/exceptions", methods=["GET", "POST"])
 def exceptions():
     if request.method == "POST":
         vehicle_id = request.form.get("vehicle_id")
@@ -435,81 +558,564 @@ def exceptions():
         phase = request.form.get("phase")
         fine = request.form.get("fine") or 0
         try:
-            with get_conn() as conn:
-                conn.execute(
-                    "INSERT INTO dbo.Exceptions(VehicleId, DriverId, ExceptionType, Phase, FineAmount) VALUES (?, ?, ?, ?, ?)",
-                    (int(vehicle_id), int(driver_id) if driver_id else None, exception_type, phase, float(fine))
-                )
-                conn.commit()
-                flash("异常已记录，车辆状态置为异常", "success")
+            exec_write(
+                """EXEC dbo.sp_record_exception @VehicleId = ?, @DriverId = ?, @ExceptionType = ?,
+                       @Phase = ?, @FineAmount = ?""",
+                (int(vehicle_id), int(driver_id) if driver_id else None, exception_type, phase, float(fine)),
+            )
         except pyodbc.Error as e:
             flash(f"数据库错误：{e}", "error")
+        except (TypeError, ValueError):
+            flash("车辆、司机或罚款金额无效", "error")
         return redirect(url_for("exceptions"))
 
-    with get_conn() as conn:
-        vehicles = conn.execute("SELECT VehicleId, PlateNo FROM dbo.Vehicles ORDER BY PlateNo").fetchall()
-        drivers = conn.execute("SELECT DriverId, Name FROM dbo.Drivers ORDER BY Name").fetchall()
-    return render_template("exceptions.html", vehicles=vehicles, drivers=drivers)
+    return render_template("exceptions.html", vehicles=vehicle_options(), drivers=driver_options())
+
+
+def report_period(args):
+    """Report period from the query string, as the EXEC argument list and its
+    values: an inclusive start/end date range, or a calendar year/month.
+    Returns None when neither is given; raises ValueError on bad input."""
+    start_date, end_date = args.get("start_date"), args.get("end_date")
+    if start_date and end_date:
+        return "@StartDate=?, @EndDate=?", (date.fromisoformat(start_date), date.fromisoformat(end_date))
+    year, month = args.get("year"), args.get("month")
+    if year and month:
+        return "@Year=?, @Month=?", (int(year), int(month))
+    return None
+
+
+def period_range(period_values):
+    """First and last day (inclusive) of a report period, as the report procedures take it."""
+    if isinstance(period_values[0], date):
+        return tuple(period_values)
+    start = date(*period_values, 1)
+    return start, (start + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+
+
+def period_closed(period_values):
+    """True when the report period ends before the current month began."""
+    return period_range(period_values)[1] < date.today().replace(day=1)
+
+
+# A write transaction still open may hold a RowVer below a MAX(RowVer) that is
+# already visible, and its commit would not move the MAX. While any is open,
+# the probes also return MIN_ACTIVE_ROWVERSION(), which moves when it commits
+# (with none open it is @@DBTS + 1, left out so unrelated writes keep the ETag).
+OPEN_WRITES_SQL = "CASE WHEN MIN_ACTIVE_ROWVERSION() <= @@DBTS THEN MIN_ACTIVE_ROWVERSION() END"
+
+# Version of a fleet report: the FleetDailyStats rows it sums (which move with
+# Orders and Exceptions, with vehicles changing fleet, and with late changes to
+# a closed month), seeking the primary key over the period
+REPORT_VERSION_SQL = f"""
+    SELECT MAX(RowVer), COUNT_BIG(*), {OPEN_WRITES_SQL}
+    FROM dbo.FleetDailyStats
+    WHERE FleetId = ? AND StatDate BETWEEN ? AND ?"""
 
 
 # Fleet monthly report
-@app.route("/reports/fleet_monthly")
+@route("/reports/fleet_monthly")
+@read_only
 def fleet_monthly():
     fleet_id = request.args.get("fleet_id")
-    year = request.args.get("year")
-    month = request.args.get("month")
     result = None
-    if fleet_id and year and month:
+    try:
+        period = report_period(request.args)
+    except ValueError:
+        flash("日期格式无效", "error")
+        period = None
+    if fleet_id and period:
+        # Summed from the FleetDailyStats rollup, so any range costs the same.
+        # The rendered result is cached under the version of the rows it sums.
+        period_args, period_values = period
+        fleet_id = int(fleet_id)
+
+        def render():
+            with get_conn() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f"EXEC dbo.sp_fleet_monthly_report @FleetId=?, {period_args}", (fleet_id, *period_values))
+                return render_template("_report_result.html", result=cursor.fetchone())
+
+        version = get_conn().execute(REPORT_VERSION_SQL, (fleet_id, *period_range(period_values))).fetchone()
+        result = fragment_cache.get("fleet_monthly", (fleet_id, period_args, *period_values), version, render,
+                                    closed=period_closed(period_values))
+    return render_template("report.html", fleets=fleet_options(), result=result)
+
+
+# Network report: every fleet (or every center) in one call, optionally as CSV
+@route("/reports/network_monthly")
+@read_only
+def network_monthly():
+    by_center = request.args.get("by") == "center"
+    rows = None
+    try:
+        period = report_period(request.args)
+    except ValueError:
+        flash("日期格式无效", "error")
+        period = None
+    if period:
+        period_args, period_values = period
+        sql = f"EXEC dbo.sp_network_monthly_report {period_args}, @ByCenter=?"
+        params = (*period_values, int(by_center))
+        if request.args.get("format") == "csv":
+            def lines():
+                cursor = get_conn().cursor()
+                cursor.execute(sql, params)
+                yield from csv_lines(cursor)
+            return csv_response(lines(), f"network_{'center' if by_center else 'fleet'}_report.csv")
         with get_conn() as conn:
-            cursor = conn.cursor()
-            cursor.execute("EXEC dbo.sp_fleet_monthly_report @FleetId=?, @Year=?, @Month=?", (int(fleet_id), int(year), int(month)))
-            result = cursor.fetchone()
+            rows = conn.execute(sql, params).fetchall()
+    return render_template("network_report.html", rows=rows, by_center=by_center)
+
+
+# Streamed full exports for the data warehouse: /export/orders?format=ndjson&after_id=...
+@route("/export/<entity>")
+@read_only
+def export_rows(entity):
+    if entity not in EXPORTS:
+        return jsonify(error=f"未知的导出类型：{entity}"), 404
+    try:
+        sql, params = export_query(entity, request.args)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    fmt = request.args.get("format", "csv")
+    if fmt not in ("csv", "ndjson"):
+        return jsonify(error="format 仅支持 csv / ndjson"), 400
+
+    def lines():
+        cursor = get_conn().cursor()
+        cursor.execute(sql, params)
+        yield from (ndjson_lines if fmt == "ndjson" else csv_lines)(cursor)
+
+    respond = ndjson_response if fmt == "ndjson" else csv_response
+    return respond(lines(), f"{entity}.{fmt}")
+
+
+# JSON endpoints for wallboards. Each answers If-None-Match with 304 from a
+# MAX(RowVer) probe, so an unchanged poll costs a few index seeks.
+VEHICLES_VERSION_SQL = f"""
+    SELECT (SELECT MAX(RowVer) FROM dbo.Vehicles), (SELECT COUNT_BIG(*) FROM dbo.Vehicles),
+           (SELECT MAX(RowVer) FROM dbo.Orders), {OPEN_WRITES_SQL}"""
+ORDERS_VERSION_SQL = f"""
+    SELECT (SELECT MAX(RowVer) FROM dbo.Orders), (SELECT MAX(RowVer) FROM dbo.Vehicles),
+           (SELECT MAX(RowVer) FROM dbo.Drivers), {OPEN_WRITES_SQL}"""
+# Rows also age out of the 7-day window, hence the count over the window
+ALERTS_VERSION_SQL = f"""
+    SELECT (SELECT MAX(RowVer) FROM dbo.Exceptions), (SELECT MAX(RowVer) FROM dbo.Vehicles),
+           (SELECT MAX(RowVer) FROM dbo.Drivers),
+           (SELECT COUNT_BIG(*) FROM dbo.Exceptions WHERE OccurTime >= DATEADD(DAY, -7, SYSDATETIME())),
+           {OPEN_WRITES_SQL}"""
+
+
+def _api_fleet_filter(column):
+    """Optional ``fleet_id`` filter for the JSON API; None when it is invalid."""
+    fleet_id = request.args.get("fleet_id")
+    if not fleet_id:
+        return [], []
+    try:
+        return [f"{column} = ?"], [int(fleet_id)]
+    except ValueError:
+        return None
+
+
+@route("/api/vehicles")
+@read_only
+def api_vehicles():
+    fleet = _api_fleet_filter("v.FleetId")
+    if fleet is None:
+        return jsonify(error="fleet_id 无效"), 400
+    conditions, params = fleet
+    with get_conn() as conn:
+        return conditional_json(
+            conn, VEHICLES_VERSION_SQL, (), ("vehicles", *params),
+            f"""SELECT v.VehicleId, v.PlateNo, v.FleetId, v.Status, v.MaxWeight, v.MaxVolume,
+                       ISNULL(l.AssignedWeight, 0) AS AssignedWeight, ISNULL(l.AssignedVolume, 0) AS AssignedVolume,
+                       CAST(ISNULL(l.ActiveOrders, 0) AS INT) AS ActiveOrders
+                FROM dbo.Vehicles v
+                LEFT JOIN dbo.VehicleLoad l WITH (NOEXPAND) ON l.VehicleId = v.VehicleId
+                {_where(conditions)}
+                ORDER BY v.VehicleId""",
+            params,
+        )
+
+
+@route("/api/orders/active")
+@read_only
+def api_active_orders():
+    fleet = _api_fleet_filter("v.FleetId")
+    if fleet is None:
+        return jsonify(error="fleet_id 无效"), 400
+    conditions, params = fleet
+    conditions.append("o.Status IN (N'新建', N'装货中', N'运输中')")
+    with get_conn() as conn:
+        return conditional_json(
+            conn, ORDERS_VERSION_SQL, (), ("orders", *params),
+            f"""SELECT o.OrderId, o.VehicleId, v.PlateNo, v.FleetId, o.DriverId, d.Name AS DriverName,
+                       o.Weight, o.Volume, o.Destination, o.OrderDate, o.Status
+                FROM dbo.Orders o
+                JOIN dbo.Vehicles v ON v.VehicleId = o.VehicleId
+                LEFT JOIN dbo.Drivers d ON d.DriverId = o.DriverId
+                {_where(conditions)}
+                ORDER BY o.OrderDate DESC, o.OrderId DESC""",
+            params,
+        )
+
+
+@route("/api/exceptions/alerts")
+@read_only
+def api_exception_alerts():
+    fleet = _api_fleet_filter("FleetId")
+    if fleet is None:
+        return jsonify(error="fleet_id 无效"), 400
+    conditions, params = fleet
     with get_conn() as conn:
-        fleets = conn.execute("SELECT FleetId, Name FROM dbo.Fleets ORDER BY Name").fetchall()
-    return render_template("report.html", fleets=fleets, result=result)
+        return conditional_json(
+            conn, ALERTS_VERSION_SQL, (), ("alerts", *params),
+            f"""SELECT ExceptionId, OccurTime, ExceptionType, Phase, FineAmount, Processed,
+                       VehicleId, PlateNo, VehicleStatus, DriverId, DriverName, EmployeeNo,
+                       FleetId, FleetName, CenterId, CenterName
+                FROM dbo.vw_week_exception_alerts
+                {_where(conditions)}
+                ORDER BY OccurTime DESC""",
+            params,
+        )
+
+
+# Delta sync for downstream systems: call /api/sync/orders?since=0 once, then
+# keep passing back the returned "next" token (again at once while has_more)
+@route("/api/sync/<entity>")
+def api_sync(entity):
+    if entity not in SYNC_ENTITIES:
+        return jsonify(error=f"未知的同步类型：{entity}"), 404
+    try:
+        since, limit = sync_args(request.args)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    try:
+        return jsonify(sync_changes(get_conn(), entity, since, limit))
+    except TokenExpired:
+        return jsonify(error="同步令牌已过期（删除记录已清理），请从 since=0 重新全量同步"), 410
+
+
+# Telematics gateways post alarms here: a JSON object, a JSON array, or NDJSON
+# (Content-Type: application/x-ndjson). 202 once buffered; 429 + Retry-After
+# when the buffer is full and some alarms were refused.
+@route("/api/telematics/alarms", methods=["POST"])
+def ingest_alarms():
+    try:
+        body = request.get_data(as_text=True)
+        if request.mimetype == "application/x-ndjson":
+            records = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            records = json.loads(body)
+    except (ValueError, UnicodeDecodeError):
+        return jsonify(error="请求体不是有效的 JSON / NDJSON"), 400
+    if isinstance(records, dict):
+        records = [records]
+    if not isinstance(records, list):
+        return jsonify(error="请求体应为报警对象或报警数组"), 400
+    if len(records) > MAX_ALARMS_PER_REQUEST:
+        return jsonify(error=f"单次最多提交 {MAX_ALARMS_PER_REQUEST} 条报警"), 413
+
+    result = alarm_ingestor.submit(records)
+    if result["refused"]:
+        return jsonify(result), 429, {"Retry-After": str(math.ceil(alarm_ingestor.window))}
+    return jsonify(result), 202
+
+
+# Live dispatch board: Server-Sent Events from the shared ChangeFeed poller
+@route("/live")
+def live():
+    return render_template("live.html", fleets=fleet_options(), selected_fleet_id=request.args.get("fleet_id", ""))
+
+
+@route("/events")
+def live_events():
+    fleet_id = request.args.get("fleet_id") or None
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        fleet_id = int(fleet_id) if fleet_id else None
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        return jsonify(error="fleet_id / Last-Event-ID 必须是整数"), 400
+
+    sub = live_feed.subscribe(fleet_id)
+    if sub is None:
+        response = jsonify(error="实时连接数已满，请稍后重试")
+        response.status_code = 503
+        response.headers["Retry-After"] = "30"
+        return response
+    replayed = ()
+    if last_id is not None:
+        # Not the request connection: that one would stay checked out for as
+        # long as the stream is open
+        conn = pool.checkout()
+        try:
+            replayed = live_feed.replay(conn, last_id, fleet_id)
+        except pyodbc.Error:
+            live_feed.unsubscribe(sub)
+            raise
+        finally:
+            pool.release(conn)
+    return Response(
+        stream_with_context(live_feed.stream(sub, replayed)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 # Weekly exception view
-@app.route("/views/week_exceptions")
+@route("/views/week_exceptions")
+@read_only
 def week_exceptions():
-    with get_conn() as conn:
-        rows = conn.execute("SELECT TOP 100 * FROM dbo.vw_week_exception_alerts ORDER BY OccurTime DESC").fetchall()
-    return render_template("week_exceptions.html", rows=rows)
+    def render():
+        with get_conn() as conn:
+            rows = conn.execute("SELECT TOP 100 * FROM dbo.vw_week_exception_alerts ORDER BY OccurTime DESC").fetchall()
+        return render_template("_week_exceptions_table.html", rows=rows)
+
+    # Rendered once per version of the alerts (same probe as the JSON ETag)
+    version = get_conn().execute(ALERTS_VERSION_SQL).fetchone()
+    return render_template("week_exceptions.html",
+                           table=fragment_cache.get("week_exceptions", (), version, render))
 
 
-# Exception processing (mark as processed)
-@app.route("/exceptions/process", methods=["GET", "POST"])
+# Exception processing (mark as processed): one or many per POST, in a single UPDATE
+PROCESS_REASONS = {"not_found": "未找到该异常", "bad_status": "{status}"}
+
+
+@route("/exceptions/process", methods=["GET", "POST"])
 def process_exceptions():
     if request.method == "POST":
-        exception_id = request.form.get("exception_id")
         try:
+            ids = batch_actions.parse_ids(
+                request.form.getlist("exception_id") or request.form.getlist("exception_ids"))
             with get_conn() as conn:
-                conn.execute(
-                    "UPDATE dbo.Exceptions SET Processed = 1, ProcessedTime = SYSDATETIME() WHERE ExceptionId = ?",
-                    (int(exception_id),)
-                )
-                conn.commit()
-                flash("异常已处理，车辆状态将自动恢复", "success")
+                outcomes = batch_actions.process_exceptions(conn, ids)
+            flash(*batch_actions.summarize(outcomes, "已处理 {} 条异常，车辆状态将自动恢复", PROCESS_REASONS))
+        except ValueError as e:
+            flash(str(e), "error")
         except pyodbc.Error as e:
             flash(f"数据库错误：{e}", "error")
         return redirect(url_for("process_exceptions"))
 
-    # GET: fetch unprocessed exceptions
+    # GET: fetch one page of unprocessed exceptions
+    page_size, cursor = page_args(request.args)
+    conditions, params = ["e.Processed = 0"], [page_size + 1]
+    selected_fleet_id = _fleet_filter("v.FleetId", conditions, params)
+    cursor = _seek(cursor, decode_id_cursor,
+                   time_seek("e", "dbo.Exceptions", "OccurTime", "ExceptionId"), conditions, params)
     with get_conn() as conn:
-        exceptions = conn.execute(
-            """SELECT e.ExceptionId, e.OccurTime, e.ExceptionType, e.Phase, e.FineAmount,
-                      v.PlateNo, v.Status AS VehicleStatus,
-                      d.Name AS DriverName
-               FROM dbo.Exceptions e
-               JOIN dbo.Vehicles v ON v.VehicleId = e.VehicleId
-               LEFT JOIN dbo.Drivers d ON d.DriverId = e.DriverId
-               WHERE e.Processed = 0
-               ORDER BY e.OccurTime DESC"""
+        rows = conn.execute(
+            f"""SELECT TOP (?) e.ExceptionId, e.OccurTime, e.ExceptionType, e.Phase, e.FineAmount,
+                       v.PlateNo, v.Status AS VehicleStatus,
+                       d.Name AS DriverName
+                FROM dbo.Exceptions e
+                JOIN dbo.Vehicles v ON v.VehicleId = e.VehicleId
+                LEFT JOIN dbo.Drivers d ON d.DriverId = e.DriverId
+                {_where(conditions)}
+                ORDER BY e.OccurTime DESC, e.ExceptionId DESC""",
+            params,
         ).fetchall()
-    return render_template("process_exceptions.html", exceptions=exceptions)
+    page = Page(rows, page_size, lambda r: (r.ExceptionId,), cursor, "process_exceptions",
+                fleet_id=selected_fleet_id)
+    return render_template("process_exceptions.html", exceptions=page.rows, page=page)
+
+
+# Import rules mirror the single-row vehicles / assign_order forms
+IMPORT_RULES = dict(vehicle_statuses=("空闲",), require_driver=True, block_departed=True)
+
+
+# Bulk import of drivers / vehicles / orders from an uploaded CSV or JSON file
+@route("/import", methods=["GET", "POST"])
+def bulk_import():
+    report = None
+    kind = request.form.get("kind") or request.args.get("kind") or "drivers"
+    if request.method == "POST":
+        upload = request.files.get("file")
+        if not upload or not upload.filename:
+            flash("请选择要导入的文件", "error")
+            return redirect(url_for("bulk_import", kind=kind))
+        try:
+            with get_conn() as conn:
+                report = run_import(conn, kind, read_rows(upload.stream, upload.filename), **IMPORT_RULES)
+        except ImportFileError as e:
+            flash(f"文件无法导入：{e}", "error")
+        except pyodbc.Error as e:
+            msg = str(e)
+            if "51000" in msg or "超出最大载重" in msg:
+                flash("超出最大载重：导入失败，已全部回滚", "error")
+            else:
+                flash(f"数据库错误：{e}", "error")
+        else:
+            if kind in ("drivers", "vehicles"):
+                ref_cache.invalidate(kind)
+            if report["failed"]:
+                flash(f"导入完成：{report['failed']} 行未通过校验", "error")
+            else:
+                flash("导入完成", "success")
+    return render_template("import.html", kinds=IMPORT_FIELDS, kind=kind, report=report)
+
+
+# Batch dispatch: pack an uploaded batch of orders onto the fleet's open vehicles
+DISPATCH_STATUSES = ("空闲", "装货中")
+
+
+@route("/orders/dispatch", methods=["GET", "POST"])
+def dispatch_orders():
+    fleet_id = request.form.get("fleet_id") or request.args.get("fleet_id")
+    result = errors = plan_text = None
+    if request.method == "POST":
+        try:
+            fleet_id = int(fleet_id)
+        except (TypeError, ValueError):
+            flash("请选择车队", "error")
+            return redirect(url_for("dispatch_orders"))
+
+        if request.form.get("plan"):
+            # Confirm a previewed plan: one set-based insert
+            try:
+                with get_conn() as conn:
+                    inserted = dispatch.apply_plan(conn, request.form["plan"], fleet_id, DISPATCH_STATUSES)
+                flash(f"已分配 {inserted} 个运单", "success")
+            except pyodbc.Error as e:
+                msg = str(e)
+                if "51000" in msg or "超出最大载重" in msg:
+                    flash("超出最大载重：车辆载重已变化，请重新预览", "error")
+                elif "51001" in msg:
+                    flash("车辆状态或剩余容积已变化，请重新预览", "error")
+                elif "51002" in msg:
+                    flash("司机不存在或不属于该车队", "error")
+                else:
+                    flash(f"数据库错误：{e}", "error")
+            return redirect(url_for("dispatch_orders", fleet_id=fleet_id))
+
+        upload = request.files.get("file")
+        if not upload or not upload.filename:
+            flash("请选择运单文件", "error")
+            return redirect(url_for("dispatch_orders", fleet_id=fleet_id))
+        try:
+            orders, errors = dispatch.parse_orders(
+                read_rows(upload.stream, upload.filename),
+                default_driver_id=request.form.get("driver_id"),
+                require_driver=IMPORT_RULES["require_driver"],
+            )
+        except ImportFileError as e:
+            flash(f"文件无法读取：{e}", "error")
+            return redirect(url_for("dispatch_orders", fleet_id=fleet_id))
+        with get_conn() as conn:
+            vehicles = dispatch.load_vehicles(conn, fleet_id, DISPATCH_STATUSES)
+        result = dispatch.plan(orders, vehicles)
+        plan_text = dispatch.plan_json(result)
+    return render_template("dispatch.html", fleets=fleet_options(), drivers=driver_options(),
+                           order_fields=dispatch.ORDER_FIELDS, fleet_id=fleet_id, result=result,
+                           errors=errors, plan=plan_text)
+
+
+def create_app(config=None):
+    """Application factory: build the app, its pools, caches and background
+    workers from load_config() and the environment, and register the routes.
+
+    ``config`` overrides single config keys. wsgi.py calls this in every
+    worker process: both pools are warmed up there, so no connection is shared
+    across a fork; the background workers open their connections on first use.
+    """
+    app = Flask(__name__)
+    app.config.update(load_config())
+    app.config.update(config or {})
+    conn_str = app.config["CONN_STR"]
+
+    # Connection pool: one pooled connection is reused for the whole request
+    pool = ConnectionPool(
+        conn_str,
+        min_size=int(os.getenv("DB_POOL_MIN", "1")),
+        max_size=int(os.getenv("DB_POOL_MAX", "10")),
+        timeout=float(os.getenv("DB_POOL_TIMEOUT", "5")),
+        max_lifetime=int(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+    )
+    pool.init_app(app)
+    read_isolation = app.config["READ_ISOLATION"]
+    read_pool = ConnectionPool(
+        app.config["READ_CONN_STR"],
+        min_size=int(os.getenv("DB_READ_POOL_MIN", "0")),
+        max_size=int(os.getenv("DB_READ_POOL_MAX", "10")),
+        timeout=float(os.getenv("DB_POOL_TIMEOUT", "5")),
+        max_lifetime=int(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+        on_connect=lambda conn: conn.execute(f"SET TRANSACTION ISOLATION LEVEL {read_isolation}"),
+        request_key="db_read_conn",
+    )
+    read_pool.init_app(app)
+
+    # Query metrics: request latency and statements per route, per-statement
+    # execute / fetch time and rows, scraped from /metrics
+    query_metrics = QueryMetrics(
+        slow_threshold=float(os.getenv("SLOW_QUERY_SECONDS", "0.5")),
+        max_statements=int(os.getenv("METRICS_MAX_STATEMENTS", "500")),
+    )
+    query_metrics.init_app(app)
+    # The slow-query logger is process-wide: attach the file handler once
+    slow_log = os.getenv("SLOW_QUERY_LOG")
+    slow_logger = logging.getLogger("fleet.slow_query")
+    if slow_log and not any(getattr(h, "baseFilename", None) == os.path.abspath(slow_log)
+                            for h in slow_logger.handlers):
+        slow_handler = logging.FileHandler(slow_log, encoding="utf-8")
+        slow_handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        slow_logger.addHandler(slow_handler)
+
+    # Reference data (fleet / driver / vehicle dropdowns) rarely changes: cache it
+    # in-process and drop the affected lookup from the write handlers.
+    # Only this process's copy is dropped: with several gunicorn workers the others
+    # keep their dropdowns for up to REF_CACHE_TTL seconds (lower it if that matters).
+    ref_cache = TTLCache(ttl=int(os.getenv("REF_CACHE_TTL", "300")))
+
+    # Rendered report / view fragments keyed by a data-version probe (see
+    # fragment_cache): per process, or in FRAGMENT_CACHE_DIR for every worker
+    fragment_max_bytes = int(float(os.getenv("FRAGMENT_CACHE_MAX_MB", "64")) * 1024 * 1024)
+    fragment_cache = FragmentCache(
+        FileBackend(os.getenv("FRAGMENT_CACHE_DIR"), fragment_max_bytes) if os.getenv("FRAGMENT_CACHE_DIR")
+        else MemoryBackend(fragment_max_bytes),
+        live_ttl=int(os.getenv("FRAGMENT_CACHE_LIVE_TTL", "300")),
+        closed_ttl=int(os.getenv("FRAGMENT_CACHE_CLOSED_TTL", "3600")),
+    )
+
+    # Independent queries of one page (edit forms: record + list + dropdowns) run
+    # side by side, each on its own pooled connection; bounded per process
+    page_queries = PageQueries(query_metrics, max_workers=int(os.getenv("PAGE_QUERY_WORKERS", "2")))
+
+    # Live feed: one poller thread on its own connection reads dbo.ChangeFeed and
+    # pushes vehicle status / exception events to every open /events stream
+    live_feed = LiveFeed(
+        lambda: pyodbc.connect(conn_str, autocommit=True),
+        interval=float(os.getenv("LIVE_FEED_INTERVAL", "1")),
+        queue_size=int(os.getenv("LIVE_FEED_QUEUE", "256")),
+        # Each open stream holds a server thread: by default at most half of them
+        max_subscribers=int(os.getenv("LIVE_FEED_MAX_SUBSCRIBERS") or max(int(os.getenv("WEB_THREADS", "8")) // 2, 1)),
+    )
+
+    # Telematics alarms: buffered and coalesced per (vehicle, type) for one window,
+    # then written in batches by a background thread on its own connection
+    alarm_ingestor = AlarmIngestor(
+        lambda: pyodbc.connect(conn_str),
+        window=float(os.getenv("TELEMATICS_WINDOW", "2")),
+        open_window=int(os.getenv("TELEMATICS_OPEN_WINDOW", "300")),
+        max_pending=int(os.getenv("TELEMATICS_MAX_PENDING", "20000")),
+    )
+
+    app.extensions.update(pool=pool, read_pool=read_pool, query_metrics=query_metrics, page_queries=page_queries,
+                          ref_cache=ref_cache, fragment_cache=fragment_cache, live_feed=live_feed,
+                          alarm_ingestor=alarm_ingestor)
+    init_routes(app)
+
+    for p in (pool, read_pool):
+        try:
+            p.fill()
+        except pyodbc.Error as e:
+            app.logger.warning("连接池预热失败：%s", e)
+    return app
 
 
 if __name__ == "__main__":
+    # Development server; production runs serve.py (waitress) or gunicorn
     # Allow changing port via environment variable to avoid conflicts
     port = int(os.getenv("PORT", "5000"))
-    app.run(host="0.0.0.0", port=port, debug=True)
+    app = create_app()
+    app.run(host="0.0.0.0", port=port, debug=os.getenv("FLASK_DEBUG") == "1", threaded=True)
@@ -0,0 +1,101 @@
+"""Delta sync: everything changed in a table since a client's version token.
+
+Drivers, Vehicles, Orders and Exceptions carry a ROWVERSION (``RowVer``) and
+deletes leave a row in ``dbo.SyncTombstones`` stamped from the same
+database-wide counter, so one integer token orders inserts, updates and
+deletes. Each call seeks the RowVer index from the token, so its cost follows
+the number of changes rather than the table size. Rows moved to the archive
+tables (sp_archive_closed_records) leave no tombstone: archiving is not a
+delete, and clients keep the rows they already have.
+
+Changes are only returned below MIN_ACTIVE_ROWVERSION(): a transaction still
+open may commit a lower version than rows already visible, and the token must
+not move past it.
+"""
+from etag import rows_json
+
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 5000
+
+# entity -> (table, key column, columns returned for inserts / updates)
+SYNC_ENTITIES = {
+    "drivers": ("dbo.Drivers", "DriverId",
+                "DriverId, EmployeeNo, Name, LicenseLevel, Phone, FleetId, CreatedAt"),
+    "vehicles": ("dbo.Vehicles", "VehicleId",
+                 "VehicleId, FleetId, PlateNo, MaxWeight, MaxVolume, Status, CreatedAt"),
+    "orders": ("dbo.Orders", "OrderId",
+               "OrderId, VehicleId, DriverId, Weight, Volume, Destination, OrderDate, Status"),
+    "exceptions": ("dbo.Exceptions", "ExceptionId",
+                   "ExceptionId, VehicleId, DriverId, OccurTime, ExceptionType, Phase, FineAmount, "
+                   "Processed, ProcessedTime"),
+}
+
+
+class TokenExpired(Exception):
+    """The token is older than the oldest tombstone still kept; resync from 0."""
+
+
+def sync_args(args):
+    """``since`` token and batch ``limit`` from the query string; ValueError on bad input."""
+    try:
+        since = int(args.get("since") or 0)
+        limit = int(args.get("limit") or DEFAULT_LIMIT)
+    except ValueError:
+        raise ValueError("since / limit 必须是整数")
+    if since < 0 or not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"since 不能为负，limit 须在 1–{MAX_LIMIT} 之间")
+    return since, limit
+
+
+def changes(conn, entity, since, limit=DEFAULT_LIMIT):
+    """One batch of changes to ``entity`` after version ``since``.
+
+    Returns a dict with ``upserts`` (current rows, each with its ``Version``),
+    ``deletes`` (``Version`` + ``EntityId``), the ``next`` token to send back
+    and ``has_more``. Pass ``since=0`` for a full initial load.
+    """
+    table, key, columns = SYNC_ENTITIES[entity]
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        SET NOCOUNT ON;
+        DECLARE @Since BINARY(8) = CAST(CAST(? AS BIGINT) AS BINARY(8));
+        DECLARE @Bound BINARY(8) = MIN_ACTIVE_ROWVERSION();
+
+        SELECT CAST(@Bound AS BIGINT) - 1 AS Bound, CAST(PurgedVer AS BIGINT) AS Purged
+        FROM dbo.SyncPurgeMark WHERE Id = 1;
+
+        SELECT TOP (?) CAST(RowVer AS BIGINT) AS Version, {columns}
+        FROM {table}
+        WHERE RowVer > @Since AND RowVer < @Bound
+        ORDER BY RowVer;
+
+        SELECT TOP (?) CAST(DeletedVer AS BIGINT) AS Version, EntityId
+        FROM dbo.SyncTombstones
+        WHERE Entity = ? AND DeletedVer > @Since AND DeletedVer < @Bound
+        ORDER BY DeletedVer;
+        """,
+        (since, limit + 1, limit + 1, entity),
+    )
+    bound, purged = cursor.fetchone()
+    if since and since < purged:
+        raise TokenExpired(entity)
+    cursor.nextset()
+    upserts = rows_json(cursor)
+    cursor.nextset()
+    deletes = rows_json(cursor)
+
+    # Both lists are in version order; keep the first ``limit`` of the merge
+    merged = sorted([(r["Version"], 0, r) for r in upserts] + [(d["Version"], 1, d) for d in deletes],
+                    key=lambda m: m[0])
+    has_more = len(merged) > limit
+    batch = merged[:limit]
+    return {
+        "entity": entity,
+        "key": key,
+        "since": since,
+        "next": batch[-1][0] if has_more else max(since, bound),
+        "has_more": has_more,
+        "upserts": [r for _, kind, r in batch if kind == 0],
+        "deletes": [d for _, kind, d in batch if kind == 1],
+    }
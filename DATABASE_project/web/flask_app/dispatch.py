@@ -0,0 +1,189 @@
+"""Batch dispatch: pack a batch of pending orders onto a fleet's open vehicles.
+
+The planner is a two-dimensional first-fit-decreasing over the remaining
+weight and volume read from ``vw_fleet_vehicle_load``. Amounts are kept in
+integer hundredths (the DECIMAL(12,2) scale of the columns) so the inner loop
+only compares ints. The resulting plan is written with one INSERT ... SELECT
+FROM OPENJSON, after weight and volume are re-checked under lock.
+"""
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+
+from bulk_import import ImportFileError
+
+ORDER_FIELDS = ("weight", "volume", "destination", "driver_id")
+
+
+def _cents(value):
+    return int((Decimal(str(value)) * 100).to_integral_value())
+
+
+def parse_orders(rows, default_driver_id=None, require_driver=True):
+    """Turn uploaded records into pending orders; returns (orders, errors).
+
+    Each order is a dict with ``row``, ``weight``/``volume`` in hundredths,
+    ``destination`` and ``driver_id``. ``errors`` is a list of (row, reason).
+    """
+    orders, errors = [], []
+    try:
+        for row_no, record in enumerate(rows, start=1):
+            _parse_one(row_no, record, default_driver_id, require_driver, orders, errors)
+    except (csv.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ImportFileError(str(e))
+    return orders, errors
+
+
+def _parse_one(row_no, record, default_driver_id, require_driver, orders, errors):
+    get = lambda f: str(record.get(f) or "").strip() if isinstance(record, dict) else ""
+    reasons = []
+    try:
+        weight, volume = _cents(get("weight")), _cents(get("volume"))
+        if weight <= 0 or volume <= 0:
+            reasons.append("重量和体积必须大于 0")
+    except (InvalidOperation, ValueError, OverflowError):
+        weight = volume = 0
+        reasons.append("重量或体积格式无效")
+    destination = get("destination")
+    if not destination:
+        reasons.append("目的地不能为空")
+    driver_id = get("driver_id") or default_driver_id
+    try:
+        driver_id = int(driver_id) if driver_id else None
+    except ValueError:
+        reasons.append("司机ID无效")
+    if require_driver and not driver_id:
+        reasons.append("必须选择司机")
+    if reasons:
+        errors.append((row_no, "；".join(reasons)))
+    else:
+        orders.append({"row": row_no, "weight": weight, "volume": volume,
+                       "destination": destination, "driver_id": driver_id})
+
+
+def load_vehicles(conn, fleet_id, statuses):
+    marks = ", ".join("?" * len(statuses))
+    return conn.execute(
+        f"""SELECT VehicleId, PlateNo, Status, RemainingWeight, RemainingVolume
+            FROM dbo.vw_fleet_vehicle_load
+            WHERE FleetId = ? AND Status IN ({marks})
+              AND RemainingWeight > 0 AND RemainingVolume > 0
+            ORDER BY CASE WHEN AssignedWeight > 0 THEN 0 ELSE 1 END, RemainingWeight DESC, VehicleId""",
+        (fleet_id, *statuses),
+    ).fetchall()
+
+
+def plan(orders, vehicles):
+    """First-fit decreasing on both capacities.
+
+    Orders are placed largest first, sized by their dominant share of the
+    fleet's total remaining weight / volume. Vehicles keep the order given by
+    :func:`load_vehicles` (already-loading ones first), so partly loaded
+    trucks are filled before empty ones are opened. Returns a dict with
+    ``assignments`` (order, vehicle slot), ``unassigned`` orders, the
+    per-vehicle ``slots`` and ``seconds`` spent planning.
+    """
+    started = time.perf_counter()
+    slots = [{"vehicle_id": v.VehicleId, "plate_no": v.PlateNo, "status": v.Status,
+              "weight": _cents(v.RemainingWeight), "volume": _cents(v.RemainingVolume),
+              "orders": 0, "used_weight": 0, "used_volume": 0} for v in vehicles]
+    total_w = sum(s["weight"] for s in slots) or 1
+    total_v = sum(s["volume"] for s in slots) or 1
+    ranked = sorted(orders, key=lambda o: max(o["weight"] / total_w, o["volume"] / total_v), reverse=True)
+
+    # Vehicles too full for the smallest order in either dimension leave the
+    # scan list, so the inner loop shrinks as the fleet fills up
+    min_w = min((o["weight"] for o in orders), default=0)
+    min_v = min((o["volume"] for o in orders), default=0)
+    open_slots = [s for s in slots if s["weight"] >= min_w and s["volume"] >= min_v]
+
+    assignments, unassigned = [], []
+    for order in ranked:
+        w, v = order["weight"], order["volume"]
+        for i, slot in enumerate(open_slots):
+            if slot["weight"] >= w and slot["volume"] >= v:
+                slot["weight"] -= w
+                slot["volume"] -= v
+                slot["used_weight"] += w
+                slot["used_volume"] += v
+                slot["orders"] += 1
+                assignments.append((order, slot))
+                if slot["weight"] < min_w or slot["volume"] < min_v:
+                    del open_slots[i]
+                break
+        else:
+            unassigned.append(order)
+    assignments.sort(key=lambda a: a[0]["row"])
+    unassigned.sort(key=lambda o: o["row"])
+    return {
+        "assignments": assignments,
+        "unassigned": unassigned,
+        "slots": [s for s in slots if s["orders"]],
+        "seconds": round(time.perf_counter() - started, 4),
+    }
+
+
+def plan_json(result):
+    """Serialize the assignments for the apply step (hidden form field)."""
+    return json.dumps([
+        {"vehicle_id": slot["vehicle_id"], "driver_id": order["driver_id"],
+         "weight": str(Decimal(order["weight"]) / 100), "volume": str(Decimal(order["volume"]) / 100),
+         "destination": order["destination"]}
+        for order, slot in result["assignments"]
+    ], ensure_ascii=False)
+
+
+def apply_plan(conn, plan_text, fleet_id, statuses):
+    """Insert every planned order in one statement; returns the row count.
+
+    Raises pyodbc.Error (51001/51002, or 51000 from TR_Orders_CheckWeight)
+    when the fleet changed since the plan was made; nothing is written then.
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SET NOCOUNT ON;
+        SET XACT_ABORT ON;
+        DECLARE @Plan TABLE (
+            VehicleId INT NOT NULL, DriverId INT NULL, Weight DECIMAL(12,2) NOT NULL,
+            Volume DECIMAL(12,2) NOT NULL, Destination NVARCHAR(200) NOT NULL
+        );
+        INSERT INTO @Plan (VehicleId, DriverId, Weight, Volume, Destination)
+        SELECT VehicleId, DriverId, Weight, Volume, Destination
+        FROM OPENJSON(?) WITH (
+            VehicleId INT '$.vehicle_id', DriverId INT '$.driver_id', Weight DECIMAL(12,2) '$.weight',
+            Volume DECIMAL(12,2) '$.volume', Destination NVARCHAR(200) '$.destination'
+        );
+
+        -- Volume is not enforced by any trigger: check it here, with the
+        -- vehicles locked until commit so a concurrent assignment cannot slip in
+        IF EXISTS (
+            SELECT 1
+            FROM (SELECT VehicleId, SUM(Volume) AS Volume FROM @Plan GROUP BY VehicleId) p
+            LEFT JOIN dbo.Vehicles v WITH (UPDLOCK, HOLDLOCK) ON v.VehicleId = p.VehicleId
+            LEFT JOIN dbo.VehicleLoad l WITH (NOEXPAND) ON l.VehicleId = p.VehicleId
+            WHERE v.VehicleId IS NULL OR v.FleetId <> ?
+               OR v.Status NOT IN (SELECT value FROM OPENJSON(?))
+               OR ISNULL(l.AssignedVolume, 0) + p.Volume > v.MaxVolume
+        )
+            THROW 51001, N'车辆状态或剩余容积已变化，请重新预览', 1;
+
+        IF EXISTS (
+            SELECT 1 FROM @Plan p
+            LEFT JOIN dbo.Drivers d ON d.DriverId = p.DriverId
+            WHERE p.DriverId IS NOT NULL AND (d.DriverId IS NULL OR d.FleetId <> ?)
+        )
+            THROW 51002, N'司机不存在或不属于该车队', 1;
+
+        -- Weight is re-checked once for the whole batch by TR_Orders_CheckWeight
+        INSERT INTO dbo.Orders (VehicleId, DriverId, Weight, Volume, Destination, Status)
+        SELECT VehicleId, DriverId, Weight, Volume, Destination, N'新建' FROM @Plan;
+
+        SELECT COUNT(*) FROM @Plan;
+        """,
+        (plan_text, fleet_id, json.dumps(list(statuses), ensure_ascii=False), fleet_id),
+    )
+    inserted = cursor.fetchone()[0]
+    conn.commit()
+    return inserted
@@ -0,0 +1,43 @@
+import hashlib
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask import Response, jsonify, request
+
+
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def rows_json(cursor):
+    """Fetch an executed cursor as a list of plain dicts (ISO dates, float decimals)."""
+    columns = [col[0] for col in cursor.description]
+    return [{c: _plain(v) for c, v in zip(columns, row)} for row in cursor.fetchall()]
+
+
+def data_etag(version, *scope):
+    """Strong ETag from a data-version probe row plus the request scope (filters)."""
+    parts = [v.hex() if isinstance(v, (bytes, bytearray)) else str(v) for v in (*version, *scope)]
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+
+def conditional_json(conn, probe_sql, probe_params, scope, query_sql, query_params):
+    """Answer a polling request from a cheap version probe.
+
+    ``probe_sql`` returns one row (MAX(RowVer), counts, the lowest RowVer of
+    a write still open...) that changes whenever the result of ``query_sql``
+    can change. When the client's
+    If-None-Match still matches, a 304 is returned without running the query.
+    """
+    etag = data_etag(conn.execute(probe_sql, probe_params).fetchone(), *scope)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(rows_json(conn.execute(query_sql, query_params)))
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
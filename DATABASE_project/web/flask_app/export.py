@@ -0,0 +1,121 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask import Response, stream_with_context
+
+FETCH_SIZE = 500
+
+# Full-table exports: (id column, time column, fleet column or None, base query).
+# Rows always come out in id order so a client can resume with ``after_id``.
+EXPORTS = {
+    "orders": ("o.OrderId", "o.OrderDate", "v.FleetId", """
+        SELECT o.OrderId, o.VehicleId, v.PlateNo, v.FleetId, o.DriverId, o.Weight, o.Volume,
+               o.Destination, o.OrderDate, o.Status
+        FROM dbo.Orders o
+        JOIN dbo.Vehicles v ON v.VehicleId = o.VehicleId"""),
+    "exceptions": ("e.ExceptionId", "e.OccurTime", "v.FleetId", """
+        SELECT e.ExceptionId, e.VehicleId, v.PlateNo, v.FleetId, e.DriverId, e.OccurTime,
+               e.ExceptionType, e.Phase, e.FineAmount, e.Processed, e.ProcessedTime
+        FROM dbo.Exceptions e
+        JOIN dbo.Vehicles v ON v.VehicleId = e.VehicleId"""),
+    "history": ("LogId", "ChangedAt", None, """
+        SELECT LogId, Entity, EntityId, Action, OldValue, NewValue, ChangedBy, ChangedAt
+        FROM dbo.History_Log"""),
+}
+
+
+def export_query(entity, args):
+    """Build the export SELECT for ``entity`` from the query string.
+
+    Filters: ``start_date`` / ``end_date`` (inclusive days), ``fleet_id`` and
+    ``after_id`` (resume after the last id received). Raises ValueError with a
+    message for bad input.
+    """
+    id_col, time_col, fleet_col, base = EXPORTS[entity]
+    conditions, params = [], []
+    try:
+        if args.get("start_date"):
+            conditions.append(f"{time_col} >= ?")
+            params.append(date.fromisoformat(args["start_date"]))
+        if args.get("end_date"):
+            conditions.append(f"{time_col} < DATEADD(DAY, 1, ?)")
+            params.append(date.fromisoformat(args["end_date"]))
+    except ValueError:
+        raise ValueError("日期格式无效（YYYY-MM-DD）")
+    if args.get("fleet_id"):
+        if fleet_col is None:
+            raise ValueError("该导出不支持按车队筛选")
+        try:
+            params.append(int(args["fleet_id"]))
+        except ValueError:
+            raise ValueError("fleet_id 无效")
+        conditions.append(f"{fleet_col} = ?")
+    if args.get("after_id"):
+        try:
+            params.append(int(args["after_id"]))
+        except ValueError:
+            raise ValueError("after_id 无效")
+        conditions.append(f"{id_col} > ?")
+    where = f"\n        WHERE {' AND '.join(conditions)}" if conditions else ""
+    return f"{base}{where}\n        ORDER BY {id_col}", params
+
+
+def csv_lines(cursor, fetch_size=FETCH_SIZE):
+    """Yield an executed cursor as CSV text, header first, ``fetch_size`` rows at a time.
+
+    The header is prefixed with a BOM so Excel opens the Chinese text as UTF-8.
+    """
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(col[0] for col in cursor.description)
+    yield "\ufeff" + buf.getvalue()
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            break
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(rows)
+        yield buf.getvalue()
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"not JSON serializable: {type(value).__name__}")
+
+
+def ndjson_lines(cursor, fetch_size=FETCH_SIZE):
+    """Yield an executed cursor as one JSON object per line."""
+    columns = [col[0] for col in cursor.description]
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            break
+        yield "".join(
+            json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=_json_value) + "\n"
+            for row in rows
+        )
+
+
+def _stream(lines, filename, mimetype):
+    # The request context (and with it the pooled connection in ``g``) stays
+    # open until the last chunk is sent
+    return Response(
+        stream_with_context(lines),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+def csv_response(lines, filename):
+    return _stream(lines, filename, "text/csv; charset=utf-8")
+
+
+def ndjson_response(lines, filename):
+    return _stream(lines, filename, "application/x-ndjson; charset=utf-8")
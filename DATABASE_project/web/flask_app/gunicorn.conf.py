@@ -0,0 +1,33 @@
+"""gunicorn settings: ``gunicorn -c gunicorn.conf.py wsgi:app``.
+
+The pages mostly wait on SQL Server, so each worker process runs several
+threads (gthread). Every process has its own connection pools, live-feed
+poller and telematics buffer: keep WEB_WORKERS x (DB_POOL_MAX +
+DB_READ_POOL_MAX) within what the database accepts, and DB_POOL_MAX at or
+above WEB_THREADS + PAGE_QUERY_WORKERS. An open /events stream holds one
+thread for as long as the browser stays connected; LIVE_FEED_MAX_SUBSCRIBERS
+(default WEB_THREADS / 2) caps them per worker, past it /events answers 503.
+The dropdown cache is per worker too: a write clears it only in the worker
+that handled it, the others catch up within REF_CACHE_TTL seconds.
+"""
+import multiprocessing
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_WORKERS", str(multiprocessing.cpu_count())))
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "8"))
+timeout = int(os.getenv("WEB_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then (jittered so they do not restart together)
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "10000"))
+max_requests_jitter = max_requests // 10
+# Import the app in every worker, not in the master: pools and background
+# threads must not be shared across the fork
+preload_app = False
+accesslog = "-"
@@ -0,0 +1,68 @@
+from flask import url_for
+
+PAGE_SIZE_DEFAULT = 50
+PAGE_SIZE_MAX = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def page_args(args):
+    """Read ``page_size`` and ``after`` from the query string.
+
+    The page size is clamped to 1..PAGE_SIZE_MAX; the cursor is returned
+    as the raw string and decoded by the caller for its key type.
+    """
+    try:
+        page_size = int(args.get("page_size") or PAGE_SIZE_DEFAULT)
+    except ValueError:
+        page_size = PAGE_SIZE_DEFAULT
+    page_size = max(1, min(page_size, PAGE_SIZE_MAX))
+    return page_size, args.get("after") or None
+
+
+def encode_cursor(*values):
+    return ",".join(str(v) for v in values)
+
+
+def decode_id_cursor(cursor):
+    """Cursor holding the integer key of the last row: ``"<id>"``.
+
+    Lists ordered by (time DESC, id DESC) use it too and read the boundary
+    time back on the server (``time_seek``): the DATETIME2(7) columns reach
+    Python with microseconds only, and a truncated time in the cursor would
+    skip every later row sharing the boundary timestamp.
+    """
+    try:
+        return int(cursor)
+    except (TypeError, ValueError):
+        raise InvalidCursor(cursor)
+
+
+def time_seek(alias, table, time_column, key_column):
+    """Keyset condition for a (time DESC, id DESC) list, past the row whose
+    key is the cursor; bind the cursor key to every ``?``."""
+    boundary = f"(SELECT {time_column} FROM {table} WHERE {key_column} = ?)"
+    return (f"({alias}.{time_column} < {boundary} OR "
+            f"({alias}.{time_column} = {boundary} AND {alias}.{key_column} < ?))")
+
+
+class Page:
+    """One keyset page. ``rows`` was fetched with ``TOP (page_size + 1)``;
+    the extra row only tells us whether a next page exists."""
+
+    def __init__(self, rows, page_size, key, cursor, endpoint, **filters):
+        self.has_next = len(rows) > page_size
+        self.rows = rows[:page_size]
+        self.page_size = page_size
+        self.cursor = cursor
+        self.next_cursor = encode_cursor(*key(self.rows[-1])) if self.has_next else None
+        self.endpoint = endpoint
+        self.filters = {k: v for k, v in filters.items() if v not in (None, "")}
+
+    def first_url(self):
+        return url_for(self.endpoint, page_size=self.page_size, **self.filters)
+
+    def next_url(self):
+        return url_for(self.endpoint, after=self.next_cursor, page_size=self.page_size, **self.filters)
@@ -29,8 +29,8 @@ if errorlevel 1 (
 )
 
 REM Run the application
-echo [INFO] Starting Flask application...
+echo [INFO] Starting application server (waitress)...
 echo [INFO] Please open your browser to: http://127.0.0.1:5000
-python app.py
+python serve.py
 
 pause
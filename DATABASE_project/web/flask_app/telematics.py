@@ -0,0 +1,268 @@
+"""Telematics alarm ingestion: coalesce in memory, write in batches.
+
+Vehicle gateways post 超速报警 / 车辆故障 alarms at high rates. Inserting
+each one would fire TR_Exceptions_AfterInsert_Status (and the rollup and
+change-feed triggers) per alarm and rewrite the same Vehicles row over and
+over. Instead alarms are kept in a buffer keyed by (vehicle, type): repeats
+within one ``window`` collapse into the first one. Every ``window`` seconds a
+background thread swaps the buffer out and writes it with one multi-row
+INSERT per ``chunk_size`` entries, so the triggers run once per batch and touch
+each vehicle once. The INSERT also skips alarms for which the vehicle already
+has an unprocessed exception of the same type from the last ``open_window``
+seconds, so a vehicle speeding for minutes yields one exception, not one per
+flush.
+
+The buffer holds at most ``max_pending`` keys. Alarms for keys already
+buffered are always accepted (they only bump a counter); new keys beyond the
+limit are refused so the gateway backs off (HTTP 429) instead of the process
+growing without bound. Buffered alarms live in memory only and are lost if
+the process stops before the next flush.
+"""
+import json
+import threading
+import time
+from datetime import datetime
+
+import pyodbc
+
+ALARM_TYPES = {
+    "超速报警": "超速报警", "speeding": "超速报警", "overspeed": "超速报警",
+    "车辆故障": "车辆故障", "fault": "车辆故障",
+}
+
+INSERT_SQL = """
+    SET NOCOUNT ON;
+    DECLARE @OpenWindow INT = ?;
+    DECLARE @Batch TABLE (
+        VehicleId INT NULL, PlateNo NVARCHAR(20) NULL, DriverId INT NULL,
+        ExceptionType NVARCHAR(50) NOT NULL, OccurTime DATETIME2 NOT NULL
+    );
+    INSERT INTO @Batch (VehicleId, PlateNo, DriverId, ExceptionType, OccurTime)
+    SELECT VehicleId, PlateNo, DriverId, ExceptionType, OccurTime
+    FROM OPENJSON(?) WITH (
+        VehicleId INT '$.vehicle_id', PlateNo NVARCHAR(20) '$.plate_no', DriverId INT '$.driver_id',
+        ExceptionType NVARCHAR(50) '$.type', OccurTime DATETIME2 '$.occurred_at'
+    );
+
+    UPDATE b SET b.VehicleId = v.VehicleId
+    FROM @Batch b JOIN dbo.Vehicles v ON v.PlateNo = b.PlateNo
+    WHERE b.VehicleId IS NULL;
+
+    -- An alarm keyed by plate and one keyed by id can name the same vehicle
+    ;WITH Resolved AS (
+        SELECT VehicleId, ExceptionType, MIN(OccurTime) AS OccurTime, MAX(DriverId) AS DriverId
+        FROM @Batch
+        WHERE VehicleId IS NOT NULL
+        GROUP BY VehicleId, ExceptionType
+    )
+    INSERT INTO dbo.Exceptions (VehicleId, DriverId, OccurTime, ExceptionType, Phase, FineAmount)
+    SELECT r.VehicleId,
+           COALESCE(d.DriverId, ao.DriverId),
+           r.OccurTime,
+           r.ExceptionType,
+           CASE WHEN l.ActiveOrders > 0 THEN N'运输中异常' ELSE N'空闲时异常' END,
+           0
+    FROM Resolved r
+    JOIN dbo.Vehicles v ON v.VehicleId = r.VehicleId
+    LEFT JOIN dbo.Drivers d ON d.DriverId = r.DriverId
+    LEFT JOIN dbo.VehicleLoad l WITH (NOEXPAND) ON l.VehicleId = r.VehicleId
+    OUTER APPLY (
+        SELECT TOP (1) o.DriverId
+        FROM dbo.Orders o
+        WHERE o.VehicleId = r.VehicleId AND o.DriverId IS NOT NULL
+          AND o.Status IN (N'新建', N'装货中', N'运输中')
+        ORDER BY o.OrderDate DESC
+    ) ao
+    -- Across flushes (and processes): an unprocessed exception of this type
+    -- raised within @OpenWindow seconds already covers the alarm
+    WHERE NOT EXISTS (
+        SELECT 1 FROM dbo.Exceptions e
+        WHERE e.VehicleId = r.VehicleId AND e.ExceptionType = r.ExceptionType AND e.Processed = 0
+          AND e.OccurTime >= DATEADD(SECOND, -@OpenWindow, r.OccurTime)
+    );
+    DECLARE @Inserted INT = @@ROWCOUNT;
+
+    SELECT @Inserted AS Inserted,
+           (SELECT COUNT(*) FROM @Batch b
+            WHERE NOT EXISTS (SELECT 1 FROM dbo.Vehicles v WHERE v.VehicleId = b.VehicleId)) AS UnknownVehicles;
+"""
+
+
+class AlarmError(ValueError):
+    """An alarm record that cannot be accepted (bad vehicle, type or time)."""
+
+
+def parse_alarm(record, received_at=None):
+    """Validate one posted alarm; returns (key, entry) or raises AlarmError."""
+    if not isinstance(record, dict):
+        raise AlarmError("每条报警必须是 JSON 对象")
+    raw_type = str(record.get("type") or "").strip()
+    alarm_type = ALARM_TYPES.get(raw_type) or ALARM_TYPES.get(raw_type.lower())
+    if not alarm_type:
+        raise AlarmError(f"不支持的报警类型：{record.get('type')}")
+    vehicle_id, plate_no = record.get("vehicle_id"), str(record.get("plate_no") or "").strip()
+    try:
+        vehicle_id = int(vehicle_id) if vehicle_id not in (None, "") else None
+        driver_id = int(record["driver_id"]) if record.get("driver_id") not in (None, "") else None
+    except (TypeError, ValueError):
+        raise AlarmError("vehicle_id / driver_id 必须是整数")
+    if vehicle_id is None and not plate_no:
+        raise AlarmError("缺少 vehicle_id 或 plate_no")
+    occurred = record.get("occurred_at")
+    try:
+        occurred_at = datetime.fromisoformat(occurred) if occurred else (received_at or datetime.now())
+    except (TypeError, ValueError):
+        raise AlarmError(f"occurred_at 格式无效：{occurred}")
+    if occurred_at.tzinfo is not None:
+        # Stored times are server-local; convert before dropping the offset.
+        occurred_at = occurred_at.astimezone().replace(tzinfo=None)
+    key = (vehicle_id if vehicle_id is not None else plate_no, alarm_type)
+    entry = {"vehicle_id": vehicle_id, "plate_no": plate_no or None, "driver_id": driver_id,
+             "type": alarm_type, "occurred_at": occurred_at.isoformat(), "count": 1}
+    return key, entry
+
+
+class AlarmIngestor:
+    """Bounded coalescing buffer plus the thread that flushes it.
+
+    ``connect`` opens the writer's own connection; the thread starts with the
+    first accepted alarm.
+    """
+
+    def __init__(self, connect, window=2.0, open_window=300, max_pending=20000, chunk_size=1000):
+        self.connect = connect
+        self.window = window
+        self.open_window = open_window
+        self.max_pending = max_pending
+        self.chunk_size = chunk_size
+
+        self._lock = threading.Lock()
+        self._pending = {}   # (vehicle id or plate, type) -> entry
+        self._thread = None
+
+        self._received = 0
+        self._coalesced = 0
+        self._refused = 0
+        self._flushes = 0
+        self._written = 0
+        self._skipped = 0
+        self._unknown_vehicles = 0
+        self._dropped = 0
+        self._errors = 0
+        self._last_flush_seconds = 0.0
+
+    def submit(self, records):
+        """Buffer parsed alarms; returns counts and the per-record errors.
+
+        ``refused`` counts new alarms turned away because the buffer is full.
+        """
+        received_at = datetime.now()
+        accepted = coalesced = refused = 0
+        errors = []
+        parsed = []
+        for n, record in enumerate(records, start=1):
+            try:
+                parsed.append(parse_alarm(record, received_at))
+            except AlarmError as e:
+                errors.append({"index": n, "error": str(e)})
+        with self._lock:
+            for key, entry in parsed:
+                current = self._pending.get(key)
+                if current is not None:
+                    self._merge(current, entry)
+                    coalesced += 1
+                elif len(self._pending) < self.max_pending:
+                    self._pending[key] = entry
+                    accepted += 1
+                else:
+                    refused += 1
+            self._received += accepted + coalesced
+            self._coalesced += coalesced
+            self._refused += refused
+            if self._thread is None and self._pending:
+                self._thread = threading.Thread(target=self._run, name="telematics", daemon=True)
+                self._thread.start()
+        return {"accepted": accepted, "coalesced": coalesced, "refused": refused,
+                "invalid": len(errors), "errors": errors[:20]}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "window_seconds": self.window,
+                "open_window_seconds": self.open_window,
+                "pending": len(self._pending),
+                "max_pending": self.max_pending,
+                "received": self._received,
+                "coalesced": self._coalesced,
+                "refused": self._refused,
+                "flushes": self._flushes,
+                "exceptions_written": self._written,
+                "skipped": self._skipped,
+                "unknown_vehicles": self._unknown_vehicles,
+                "dropped_after_error": self._dropped,
+                "errors": self._errors,
+                "last_flush_seconds": round(self._last_flush_seconds, 4),
+            }
+
+    @staticmethod
+    def _merge(current, entry):
+        current["count"] += entry["count"]
+        if entry["occurred_at"] < current["occurred_at"]:
+            current["occurred_at"] = entry["occurred_at"]
+        current["driver_id"] = current["driver_id"] or entry["driver_id"]
+
+    # -- writer -----------------------------------------------------------
+
+    def _run(self):
+        conn = None
+        while True:
+            time.sleep(self.window)
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                continue
+            started = time.perf_counter()
+            entries = list(batch.values())
+            done = inserted = unknown = 0
+            try:
+                if conn is None:
+                    conn = self.connect()
+                for i in range(0, len(entries), self.chunk_size):
+                    chunk = entries[i:i + self.chunk_size]
+                    row = conn.execute(INSERT_SQL, (self.open_window, json.dumps(chunk, ensure_ascii=False))).fetchone()
+                    conn.commit()
+                    done += len(chunk)
+                    inserted += row.Inserted
+                    unknown += row.UnknownVehicles
+            except pyodbc.Error:
+                with self._lock:
+                    self._errors += 1
+                self._requeue(entries[done:])
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except pyodbc.Error:
+                        pass
+                conn = None
+            with self._lock:
+                self._flushes += 1
+                self._written += inserted
+                self._unknown_vehicles += unknown
+                # Already covered by an open exception in the table, or the
+                # same vehicle posted both by id and by plate
+                self._skipped += done - inserted - unknown
+                self._last_flush_seconds = time.perf_counter() - started
+
+    def _requeue(self, entries):
+        # Put unwritten alarms back for the next flush; they merge with any
+        # new ones for the same key, and what no longer fits is dropped
+        with self._lock:
+            for entry in entries:
+                key = (entry["vehicle_id"] if entry["vehicle_id"] is not None else entry["plate_no"], entry["type"])
+                current = self._pending.get(key)
+                if current is not None:
+                    self._merge(current, entry)
+                elif len(self._pending) < self.max_pending:
+                    self._pending[key] = entry
+                else:
+                    self._dropped += 1
@@ -9,6 +9,9 @@ IF DB_ID('LogisticsDB') IS NULL
 GO
 USE LogisticsDB;
 GO
+-- Read-only routes use SNAPSHOT isolation (row versions instead of shared locks)
+ALTER DATABASE LogisticsDB SET ALLOW_SNAPSHOT_ISOLATION ON;
+GO
 
 PRINT N'正在创建表结构...';
 
@@ -43,6 +46,7 @@ CREATE TABLE dbo.Drivers (
     Phone NVARCHAR(30) NULL,
     FleetId INT NOT NULL,
     CreatedAt DATETIME2 NOT NULL DEFAULT SYSDATETIME(),
+    RowVer ROWVERSION NOT NULL,
     CONSTRAINT CK_Drivers_LicenseLevel CHECK (LicenseLevel IN (N'C1', N'C2', N'B1', N'B2', N'A1', N'A2')),
     CONSTRAINT FK_Drivers_Fleets FOREIGN KEY (FleetId)
         REFERENCES dbo.Fleets(FleetId) ON DELETE NO ACTION ON UPDATE NO ACTION
@@ -58,6 +62,7 @@ CREATE TABLE dbo.Vehicles (
     MaxVolume DECIMAL(12,2) NOT NULL,
     Status NVARCHAR(20) NOT NULL DEFAULT N'空闲',
     CreatedAt DATETIME2 NOT NULL DEFAULT SYSDATETIME(),
+    RowVer ROWVERSION NOT NULL,
     CONSTRAINT CK_Vehicles_Status CHECK (Status IN (N'空闲', N'运输中', N'维修中', N'异常')),
     CONSTRAINT FK_Vehicles_Fleets FOREIGN KEY (FleetId)
         REFERENCES dbo.Fleets(FleetId) ON DELETE NO ACTION ON UPDATE NO ACTION
@@ -74,6 +79,7 @@ CREATE TABLE dbo.Orders (
     Destination NVARCHAR(200) NOT NULL,
     OrderDate DATETIME2 NOT NULL DEFAULT SYSDATETIME(),
     Status NVARCHAR(20) NOT NULL DEFAULT N'新建',
+    RowVer ROWVERSION NOT NULL,
     CONSTRAINT CK_Orders_Status CHECK (Status IN (N'新建', N'装货中', N'运输中', N'已完成', N'取消')),
     CONSTRAINT FK_Orders_Vehicles FOREIGN KEY (VehicleId)
         REFERENCES dbo.Vehicles(VehicleId) ON DELETE NO ACTION ON UPDATE NO ACTION,
@@ -93,6 +99,7 @@ CREATE TABLE dbo.Exceptions (
     FineAmount DECIMAL(12,2) NOT NULL DEFAULT 0,
     Processed BIT NOT NULL DEFAULT 0,
     ProcessedTime DATETIME2 NULL,
+    RowVer ROWVERSION NOT NULL,
     CONSTRAINT CK_Exceptions_Type CHECK (ExceptionType IN (N'货物破损', N'车辆故障', N'严重延误', N'超速报警')),
     CONSTRAINT CK_Exceptions_Phase CHECK (Phase IN (N'运输中异常', N'空闲时异常')),
     CONSTRAINT FK_Exceptions_Vehicles FOREIGN KEY (VehicleId)
@@ -137,20 +144,199 @@ CREATE TABLE dbo.Users (
     CONSTRAINT CK_Users_Role CHECK (Role IN (N'Manager', N'Driver'))
 );
 
+-- FleetDailyStats (per-fleet daily rollup read by sp_fleet_monthly_report;
+-- maintained incrementally by the TR_*_FleetDailyStats triggers; RowVer
+-- versions the cached report of a fleet and period)
+IF OBJECT_ID('dbo.FleetDailyStats', 'U') IS NULL
+CREATE TABLE dbo.FleetDailyStats (
+    FleetId INT NOT NULL,
+    StatDate DATE NOT NULL,
+    TotalOrders INT NOT NULL DEFAULT 0,
+    NewOrders INT NOT NULL DEFAULT 0,
+    LoadingOrders INT NOT NULL DEFAULT 0,
+    InTransitOrders INT NOT NULL DEFAULT 0,
+    CompletedOrders INT NOT NULL DEFAULT 0,
+    CancelledOrders INT NOT NULL DEFAULT 0,
+    TotalExceptions INT NOT NULL DEFAULT 0,
+    TotalFineAmount DECIMAL(14,2) NOT NULL DEFAULT 0,
+    RowVer ROWVERSION NOT NULL,
+    CONSTRAINT PK_FleetDailyStats PRIMARY KEY (FleetId, StatDate),
+    CONSTRAINT FK_FleetDailyStats_Fleets FOREIGN KEY (FleetId)
+        REFERENCES dbo.Fleets(FleetId) ON DELETE NO ACTION ON UPDATE NO ACTION
+);
+
+-- Delta rows passed from the triggers to sp_apply_fleet_daily_delta
+IF TYPE_ID('dbo.FleetDailyDelta') IS NULL
+CREATE TYPE dbo.FleetDailyDelta AS TABLE (
+    FleetId INT NOT NULL,
+    StatDate DATE NOT NULL,
+    TotalOrders INT NOT NULL DEFAULT 0,
+    NewOrders INT NOT NULL DEFAULT 0,
+    LoadingOrders INT NOT NULL DEFAULT 0,
+    InTransitOrders INT NOT NULL DEFAULT 0,
+    CompletedOrders INT NOT NULL DEFAULT 0,
+    CancelledOrders INT NOT NULL DEFAULT 0,
+    TotalExceptions INT NOT NULL DEFAULT 0,
+    TotalFineAmount DECIMAL(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (FleetId, StatDate)
+);
+
+-- ChangeFeed (vehicle status and exception changes captured by the
+-- TR_*_ChangeFeed triggers; read by the web app's live feed poller)
+IF OBJECT_ID('dbo.ChangeFeed', 'U') IS NULL
+CREATE TABLE dbo.ChangeFeed (
+    FeedId BIGINT IDENTITY(1,1) PRIMARY KEY,
+    Kind NVARCHAR(30) NOT NULL,             -- vehicle_status / exception / exception_processed
+    FleetId INT NOT NULL,
+    VehicleId INT NOT NULL,
+    ExceptionId INT NULL,
+    OldValue NVARCHAR(50) NULL,
+    NewValue NVARCHAR(50) NULL,
+    ChangedAt DATETIME2 NOT NULL DEFAULT SYSDATETIME()
+);
+
+-- RowVer (data version for ETags / delta sync / cached reports) on databases created before it existed
+IF COL_LENGTH('dbo.Drivers', 'RowVer') IS NULL ALTER TABLE dbo.Drivers ADD RowVer ROWVERSION NOT NULL;
+IF COL_LENGTH('dbo.Vehicles', 'RowVer') IS NULL ALTER TABLE dbo.Vehicles ADD RowVer ROWVERSION NOT NULL;
+IF COL_LENGTH('dbo.Orders', 'RowVer') IS NULL ALTER TABLE dbo.Orders ADD RowVer ROWVERSION NOT NULL;
+IF COL_LENGTH('dbo.Exceptions', 'RowVer') IS NULL ALTER TABLE dbo.Exceptions ADD RowVer ROWVERSION NOT NULL;
+IF COL_LENGTH('dbo.FleetDailyStats', 'RowVer') IS NULL ALTER TABLE dbo.FleetDailyStats ADD RowVer ROWVERSION NOT NULL;
+GO
+
+-- Archive of closed records, filled by sp_archive_closed_records: completed /
+-- cancelled orders and processed exceptions past the retention period, so the
+-- hot tables only hold active work and recent history. Both are partitioned by
+-- calendar month on the date column (the job adds the monthly boundaries) and
+-- page-compressed. Reports read hot + archive through vw_orders_all /
+-- vw_exceptions_all; FleetDailyStats keeps counting archived rows.
+IF NOT EXISTS (SELECT 1 FROM sys.partition_functions WHERE name = 'pf_ArchiveMonth')
+    CREATE PARTITION FUNCTION pf_ArchiveMonth (DATETIME2) AS RANGE RIGHT FOR VALUES ();
+IF NOT EXISTS (SELECT 1 FROM sys.partition_schemes WHERE name = 'ps_ArchiveMonth')
+    CREATE PARTITION SCHEME ps_ArchiveMonth AS PARTITION pf_ArchiveMonth ALL TO ([PRIMARY]);
+GO
+
+IF OBJECT_ID('dbo.OrdersArchive', 'U') IS NULL
+CREATE TABLE dbo.OrdersArchive (
+    OrderId INT NOT NULL,
+    VehicleId INT NOT NULL,
+    DriverId INT NULL,
+    Weight DECIMAL(12,2) NOT NULL,
+    Volume DECIMAL(12,2) NOT NULL,
+    Destination NVARCHAR(200) NOT NULL,
+    OrderDate DATETIME2 NOT NULL,
+    Status NVARCHAR(20) NOT NULL,
+    ArchivedAt DATETIME2 NOT NULL DEFAULT SYSDATETIME(),
+    CONSTRAINT PK_OrdersArchive PRIMARY KEY (OrderDate, OrderId),
+    CONSTRAINT FK_OrdersArchive_Vehicles FOREIGN KEY (VehicleId)
+        REFERENCES dbo.Vehicles(VehicleId) ON DELETE NO ACTION ON UPDATE NO ACTION,
+    CONSTRAINT FK_OrdersArchive_Drivers FOREIGN KEY (DriverId)
+        REFERENCES dbo.Drivers(DriverId) ON DELETE NO ACTION ON UPDATE NO ACTION
+) ON ps_ArchiveMonth (OrderDate) WITH (DATA_COMPRESSION = PAGE);
+
+IF OBJECT_ID('dbo.ExceptionsArchive', 'U') IS NULL
+CREATE TABLE dbo.ExceptionsArchive (
+    ExceptionId INT NOT NULL,
+    VehicleId INT NOT NULL,
+    DriverId INT NULL,
+    OccurTime DATETIME2 NOT NULL,
+    ExceptionType NVARCHAR(50) NOT NULL,
+    Phase NVARCHAR(20) NOT NULL,
+    FineAmount DECIMAL(12,2) NOT NULL,
+    Processed BIT NOT NULL,
+    ProcessedTime DATETIME2 NULL,
+    ArchivedAt DATETIME2 NOT NULL DEFAULT SYSDATETIME(),
+    CONSTRAINT PK_ExceptionsArchive PRIMARY KEY (OccurTime, ExceptionId),
+    CONSTRAINT FK_ExceptionsArchive_Vehicles FOREIGN KEY (VehicleId)
+        REFERENCES dbo.Vehicles(VehicleId) ON DELETE NO ACTION ON UPDATE NO ACTION,
+    CONSTRAINT FK_ExceptionsArchive_Drivers FOREIGN KEY (DriverId)
+        REFERENCES dbo.Drivers(DriverId) ON DELETE NO ACTION ON UPDATE NO ACTION
+) ON ps_ArchiveMonth (OccurTime) WITH (DATA_COMPRESSION = PAGE);
+GO
+
 -- Indexes
 IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_Vehicles_PlateNo')
 CREATE UNIQUE INDEX IX_Vehicles_PlateNo ON dbo.Vehicles(PlateNo);
 IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_Orders_OrderDate')
 CREATE INDEX IX_Orders_OrderDate ON dbo.Orders(OrderDate);
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_Orders_Vehicle_Status')
+CREATE INDEX IX_Orders_Vehicle_Status ON dbo.Orders(VehicleId, Status);
 IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_Drivers_EmployeeNo')
 CREATE INDEX IX_Drivers_EmployeeNo ON dbo.Drivers(EmployeeNo);
 IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_Exceptions_OccurTime')
 CREATE INDEX IX_Exceptions_OccurTime ON dbo.Exceptions(OccurTime);
+-- MAX(RowVer) probes behind the JSON API ETags
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_Drivers_RowVer')
+CREATE INDEX IX_Drivers_RowVer ON dbo.Drivers(RowVer);
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_Vehicles_RowVer')
+CREATE INDEX IX_Vehicles_RowVer ON dbo.Vehicles(RowVer);
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_Orders_RowVer')
+CREATE INDEX IX_Orders_RowVer ON dbo.Orders(RowVer);
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_Exceptions_RowVer')
+CREATE INDEX IX_Exceptions_RowVer ON dbo.Exceptions(RowVer);
+-- Fleet-scoped lists and FleetId joins (drivers / vehicles pages, fleet filters, FK checks)
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_Drivers_FleetId')
+CREATE INDEX IX_Drivers_FleetId ON dbo.Drivers(FleetId) INCLUDE (EmployeeNo, Name);
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_Vehicles_FleetId')
+CREATE INDEX IX_Vehicles_FleetId ON dbo.Vehicles(FleetId) INCLUDE (PlateNo, Status, MaxWeight, MaxVolume);
+-- Active orders of a vehicle (sign list, /api/orders/active, telematics driver lookup)
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_Orders_Active_Vehicle')
+CREATE INDEX IX_Orders_Active_Vehicle ON dbo.Orders(VehicleId, OrderDate) INCLUDE (DriverId, Status, Weight, Volume, Destination)
+    WHERE Status IN (N'新建', N'装货中', N'运输中');
+-- Per-driver / per-vehicle history by date (driver performance report, fleet moves, FK checks)
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_Orders_Driver_OrderDate')
+CREATE INDEX IX_Orders_Driver_OrderDate ON dbo.Orders(DriverId, OrderDate) INCLUDE (Status, Weight, Volume);
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_Exceptions_Vehicle_OccurTime')
+CREATE INDEX IX_Exceptions_Vehicle_OccurTime ON dbo.Exceptions(VehicleId, OccurTime) INCLUDE (FineAmount);
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_Exceptions_Driver_OccurTime')
+CREATE INDEX IX_Exceptions_Driver_OccurTime ON dbo.Exceptions(DriverId, OccurTime)
+    INCLUDE (VehicleId, ExceptionType, Phase, FineAmount, Processed);
+-- Unprocessed exceptions newest first (exception processing list)
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_Exceptions_Unprocessed')
+CREATE INDEX IX_Exceptions_Unprocessed ON dbo.Exceptions(OccurTime)
+    INCLUDE (VehicleId, DriverId, ExceptionType, Phase, FineAmount) WHERE Processed = 0;
+-- ChangeFeed retention (sp_purge_change_feed)
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_ChangeFeed_ChangedAt')
+CREATE INDEX IX_ChangeFeed_ChangedAt ON dbo.ChangeFeed(ChangedAt);
+-- Archive indexes (partition-aligned): per-driver reports, fleet moves, FK checks
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_OrdersArchive_Driver_OrderDate')
+CREATE INDEX IX_OrdersArchive_Driver_OrderDate ON dbo.OrdersArchive(DriverId, OrderDate)
+    INCLUDE (Status, Weight, Volume) WITH (DATA_COMPRESSION = PAGE);
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_OrdersArchive_Vehicle_OrderDate')
+CREATE INDEX IX_OrdersArchive_Vehicle_OrderDate ON dbo.OrdersArchive(VehicleId, OrderDate)
+    INCLUDE (Status) WITH (DATA_COMPRESSION = PAGE);
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_ExceptionsArchive_Driver_OccurTime')
+CREATE INDEX IX_ExceptionsArchive_Driver_OccurTime ON dbo.ExceptionsArchive(DriverId, OccurTime)
+    INCLUDE (VehicleId, ExceptionType, Phase, FineAmount, Processed) WITH (DATA_COMPRESSION = PAGE);
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_ExceptionsArchive_Vehicle_OccurTime')
+CREATE INDEX IX_ExceptionsArchive_Vehicle_OccurTime ON dbo.ExceptionsArchive(VehicleId, OccurTime)
+    INCLUDE (FineAmount) WITH (DATA_COMPRESSION = PAGE);
 GO
 
 PRINT N'正在创建视图...';
 GO
 
+-- Indexed view: active load per vehicle (assigned weight/volume, active order count).
+-- SQL Server maintains it incrementally on every Orders write, so readers get an
+-- O(1) seek instead of re-aggregating dbo.Orders.
+SET ANSI_NULLS ON;
+SET QUOTED_IDENTIFIER ON;
+GO
+CREATE OR ALTER VIEW dbo.VehicleLoad
+WITH SCHEMABINDING
+AS
+SELECT o.VehicleId,
+       SUM(o.Weight) AS AssignedWeight,
+       SUM(o.Volume) AS AssignedVolume,
+       COUNT_BIG(*) AS ActiveOrders
+FROM dbo.Orders o
+WHERE o.Status IN (N'新建', N'装货中', N'运输中')
+GROUP BY o.VehicleId;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_VehicleLoad_VehicleId' AND object_id = OBJECT_ID('dbo.VehicleLoad'))
+    CREATE UNIQUE CLUSTERED INDEX IX_VehicleLoad_VehicleId ON dbo.VehicleLoad(VehicleId);
+GO
+
 -- View: Weekly exception alerts
 CREATE OR ALTER VIEW dbo.vw_week_exception_alerts AS
 SELECT e.ExceptionId, e.OccurTime, e.ExceptionType, e.Phase, e.FineAmount, e.Processed,
@@ -168,52 +354,432 @@ GO
 -- View: Fleet vehicle load summary
 CREATE OR ALTER VIEW dbo.vw_fleet_vehicle_load AS
 SELECT v.VehicleId, v.PlateNo, v.FleetId, v.Status,
-       ISNULL(ActiveLoad.TotalWeight, 0) AS AssignedWeight,
-       v.MaxWeight - ISNULL(ActiveLoad.TotalWeight, 0) AS RemainingWeight,
-       ISNULL(ActiveLoad.TotalVolume, 0) AS AssignedVolume,
-       v.MaxVolume - ISNULL(ActiveLoad.TotalVolume, 0) AS RemainingVolume
+       ISNULL(l.AssignedWeight, 0) AS AssignedWeight,
+       v.MaxWeight - ISNULL(l.AssignedWeight, 0) AS RemainingWeight,
+       ISNULL(l.AssignedVolume, 0) AS AssignedVolume,
+       v.MaxVolume - ISNULL(l.AssignedVolume, 0) AS RemainingVolume,
+       CAST(ISNULL(l.ActiveOrders, 0) AS INT) AS ActiveOrders
 FROM dbo.Vehicles v
-OUTER APPLY (
-    SELECT SUM(o.Weight) AS TotalWeight, SUM(o.Volume) AS TotalVolume
-    FROM dbo.Orders o
-    WHERE o.VehicleId = v.VehicleId AND o.Status IN (N'新建', N'装货中', N'运输中')
-) ActiveLoad;
+LEFT JOIN dbo.VehicleLoad l WITH (NOEXPAND) ON l.VehicleId = v.VehicleId;
+GO
+
+-- Views: hot + archived orders / exceptions, for reports over any period.
+-- Date and driver / vehicle predicates reach both sides of the UNION ALL, so
+-- each seeks its own index (and only the archive partitions in range).
+CREATE OR ALTER VIEW dbo.vw_orders_all AS
+SELECT OrderId, VehicleId, DriverId, Weight, Volume, Destination, OrderDate, Status
+FROM dbo.Orders
+UNION ALL
+SELECT OrderId, VehicleId, DriverId, Weight, Volume, Destination, OrderDate, Status
+FROM dbo.OrdersArchive;
+GO
+
+CREATE OR ALTER VIEW dbo.vw_exceptions_all AS
+SELECT ExceptionId, VehicleId, DriverId, OccurTime, ExceptionType, Phase, FineAmount, Processed, ProcessedTime
+FROM dbo.Exceptions
+UNION ALL
+SELECT ExceptionId, VehicleId, DriverId, OccurTime, ExceptionType, Phase, FineAmount, Processed, ProcessedTime
+FROM dbo.ExceptionsArchive;
 GO
 
 PRINT N'正在创建存储过程...';
 GO
 
 -- Stored Procedure: Monthly safety & efficiency report per fleet
+-- Sums FleetDailyStats rows, so the cost depends on the number of days asked
+-- for, not on the size of Orders / Exceptions. Pass @Year/@Month for a calendar
+-- month, or @StartDate/@EndDate (inclusive) for any range.
 CREATE OR ALTER PROCEDURE dbo.sp_fleet_monthly_report
     @FleetId INT,
-    @Year INT,
-    @Month INT
+    @Year INT = NULL,
+    @Month INT = NULL,
+    @StartDate DATE = NULL,
+    @EndDate DATE = NULL
 AS
 BEGIN
     SET NOCOUNT ON;
-    DECLARE @StartDate DATE = DATEFROMPARTS(@Year, @Month, 1);
-    DECLARE @EndDate DATE = EOMONTH(@StartDate);
+    IF @StartDate IS NULL OR @EndDate IS NULL
+    BEGIN
+        SET @StartDate = DATEFROMPARTS(@Year, @Month, 1);
+        SET @EndDate = EOMONTH(@StartDate);
+    END
 
-    ;WITH FleetVehicles AS (
-        SELECT VehicleId FROM dbo.Vehicles WHERE FleetId = @FleetId
-    )
-    SELECT 
+    SELECT
         @FleetId AS FleetId,
-        COUNT(*) AS TotalOrders,
-        SUM(CASE WHEN o.Status = N'已完成' THEN 1 ELSE 0 END) AS CompletedOrders,
-        SUM(CASE WHEN o.Status IN (N'新建', N'装货中', N'运输中') THEN 1 ELSE 0 END) AS ActiveOrders,
-        (SELECT COUNT(*) FROM dbo.Exceptions e JOIN FleetVehicles fv ON fv.VehicleId = e.VehicleId
-         WHERE e.OccurTime >= @StartDate AND e.OccurTime < DATEADD(DAY, 1, @EndDate)) AS TotalExceptions,
-        (SELECT ISNULL(SUM(e.FineAmount), 0) FROM dbo.Exceptions e JOIN FleetVehicles fv ON fv.VehicleId = e.VehicleId
-         WHERE e.OccurTime >= @StartDate AND e.OccurTime < DATEADD(DAY, 1, @EndDate)) AS TotalFineAmount,
-        CAST(NULL AS DECIMAL(5,2)) AS CompletionRate
+        ISNULL(SUM(TotalOrders), 0) AS TotalOrders,
+        ISNULL(SUM(CompletedOrders), 0) AS CompletedOrders,
+        ISNULL(SUM(NewOrders + LoadingOrders + InTransitOrders), 0) AS ActiveOrders,
+        ISNULL(SUM(TotalExceptions), 0) AS TotalExceptions,
+        ISNULL(SUM(TotalFineAmount), 0) AS TotalFineAmount,
+        CAST(CASE WHEN SUM(TotalOrders) > 0
+                  THEN 100.0 * SUM(CompletedOrders) / SUM(TotalOrders) END AS DECIMAL(5,2)) AS CompletionRate,
+        @StartDate AS StartDate,
+        @EndDate AS EndDate
+    FROM dbo.FleetDailyStats
+    WHERE FleetId = @FleetId
+      AND StatDate BETWEEN @StartDate AND @EndDate;
+END
+GO
+
+-- Stored Procedure: Rebuild FleetDailyStats from Orders / Exceptions (hot and archived)
+-- (first backfill, or repair). Dates are inclusive; without them every day is rebuilt.
+CREATE OR ALTER PROCEDURE dbo.sp_refresh_fleet_daily_stats
+    @StartDate DATE = NULL,
+    @EndDate DATE = NULL
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    DECLARE @From DATE = ISNULL(@StartDate, '00010101');
+    DECLARE @To DATE = ISNULL(@EndDate, '99991231');
+
+    BEGIN TRANSACTION;
+    -- TABLOCKX keeps the delta triggers out until the rebuilt rows are committed
+    DELETE FROM dbo.FleetDailyStats WITH (TABLOCKX)
+    WHERE StatDate BETWEEN @From AND @To;
+
+    INSERT INTO dbo.FleetDailyStats (FleetId, StatDate, TotalOrders, NewOrders, LoadingOrders, InTransitOrders,
+                                     CompletedOrders, CancelledOrders, TotalExceptions, TotalFineAmount)
+    SELECT FleetId, StatDate, SUM(TotalOrders), SUM(NewOrders), SUM(LoadingOrders), SUM(InTransitOrders),
+           SUM(CompletedOrders), SUM(CancelledOrders), SUM(TotalExceptions), SUM(TotalFineAmount)
+    FROM (
+        SELECT v.FleetId, CAST(o.OrderDate AS DATE) AS StatDate, 1 AS TotalOrders,
+               CASE WHEN o.Status = N'新建' THEN 1 ELSE 0 END AS NewOrders,
+               CASE WHEN o.Status = N'装货中' THEN 1 ELSE 0 END AS LoadingOrders,
+               CASE WHEN o.Status = N'运输中' THEN 1 ELSE 0 END AS InTransitOrders,
+               CASE WHEN o.Status = N'已完成' THEN 1 ELSE 0 END AS CompletedOrders,
+               CASE WHEN o.Status = N'取消' THEN 1 ELSE 0 END AS CancelledOrders,
+               0 AS TotalExceptions, CAST(0 AS DECIMAL(14,2)) AS TotalFineAmount
+        FROM dbo.vw_orders_all o
+        JOIN dbo.Vehicles v ON v.VehicleId = o.VehicleId
+        WHERE CAST(o.OrderDate AS DATE) BETWEEN @From AND @To
+        UNION ALL
+        SELECT v.FleetId, CAST(e.OccurTime AS DATE), 0, 0, 0, 0, 0, 0, 1, e.FineAmount
+        FROM dbo.vw_exceptions_all e
+        JOIN dbo.Vehicles v ON v.VehicleId = e.VehicleId
+        WHERE CAST(e.OccurTime AS DATE) BETWEEN @From AND @To
+    ) x
+    GROUP BY FleetId, StatDate;
+    COMMIT TRANSACTION;
+END
+GO
+
+-- Stored Procedure: Trim ChangeFeed. The live feed only replays recent events
+-- to reconnecting clients; the web app's poller calls this once an hour.
+CREATE OR ALTER PROCEDURE dbo.sp_purge_change_feed
+    @KeepHours INT = 24
+AS
+BEGIN
+    SET NOCOUNT ON;
+    DECLARE @Cutoff DATETIME2 = DATEADD(HOUR, -@KeepHours, SYSDATETIME());
+    -- Small batches keep each delete short next to the triggers' inserts
+    WHILE 1 = 1
+    BEGIN
+        DELETE TOP (5000) FROM dbo.ChangeFeed WHERE ChangedAt < @Cutoff;
+        IF @@ROWCOUNT < 5000 BREAK;
+    END
+END
+GO
+
+-- Stored Procedure: Add the monthly boundaries of pf_ArchiveMonth from the
+-- month of @From through the month after @Through. Boundaries past the
+-- archived data split empty partitions, which only changes metadata.
+CREATE OR ALTER PROCEDURE dbo.sp_extend_archive_partitions
+    @From DATETIME2,
+    @Through DATETIME2
+AS
+BEGIN
+    SET NOCOUNT ON;
+    DECLARE @Month DATETIME2 = DATEFROMPARTS(YEAR(@From), MONTH(@From), 1);
+    DECLARE @Last DATETIME2 = DATEADD(MONTH, 1, DATEFROMPARTS(YEAR(@Through), MONTH(@Through), 1));
+    WHILE @Month <= @Last
+    BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM sys.partition_range_values r
+            JOIN sys.partition_functions f ON f.function_id = r.function_id
+            WHERE f.name = 'pf_ArchiveMonth' AND CAST(r.value AS DATETIME2) = @Month)
+        BEGIN
+            ALTER PARTITION SCHEME ps_ArchiveMonth NEXT USED [PRIMARY];
+            ALTER PARTITION FUNCTION pf_ArchiveMonth() SPLIT RANGE (@Month);
+        END
+        SET @Month = DATEADD(MONTH, 1, @Month);
+    END
+END
+GO
+
+-- Stored Procedure: Move closed records older than @KeepDays to the archive:
+-- orders 已完成 / 取消 and processed exceptions. Each batch of @BatchSize rows
+-- is copied and deleted in its own short transaction, so the job can run next
+-- to the web app (daily, e.g. from SQL Server Agent or a scheduled sqlcmd).
+-- The delete triggers leave archived rows in FleetDailyStats and write no sync
+-- tombstones for them. Returns the number of rows moved.
+CREATE OR ALTER PROCEDURE dbo.sp_archive_closed_records
+    @KeepDays INT = 90,
+    @BatchSize INT = 5000
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    -- vw_week_exception_alerts lists (processed) exceptions of the last 7 days
+    IF @KeepDays < 7 OR @BatchSize < 1
+        THROW 51001, N'@KeepDays 不能小于 7，@BatchSize 须大于 0', 1;
+    DECLARE @Cutoff DATETIME2 = DATEADD(DAY, -@KeepDays, SYSDATETIME());
+    DECLARE @Orders INT = 0, @Exceptions INT = 0, @Rows INT;
+    DECLARE @Batch TABLE (Id INT PRIMARY KEY);
+
+    DECLARE @Oldest DATETIME2 = (
+        SELECT MIN(d) FROM (
+            SELECT MIN(OrderDate) FROM dbo.Orders WHERE Status IN (N'已完成', N'取消') AND OrderDate < @Cutoff
+            UNION ALL
+            SELECT MIN(OccurTime) FROM dbo.Exceptions WHERE Processed = 1 AND OccurTime < @Cutoff
+        ) x (d)
+    );
+    IF @Oldest IS NOT NULL
+        EXEC dbo.sp_extend_archive_partitions @From = @Oldest, @Through = @Cutoff;
+
+    WHILE @Oldest IS NOT NULL
+    BEGIN
+        DELETE FROM @Batch;
+        BEGIN TRANSACTION;
+        INSERT INTO @Batch (Id)
+        SELECT TOP (@BatchSize) OrderId FROM dbo.Orders WITH (UPDLOCK)
+        WHERE Status IN (N'已完成', N'取消') AND OrderDate < @Cutoff;
+        SET @Rows = @@ROWCOUNT;
+
+        INSERT INTO dbo.OrdersArchive (OrderId, VehicleId, DriverId, Weight, Volume, Destination, OrderDate, Status)
+        SELECT o.OrderId, o.VehicleId, o.DriverId, o.Weight, o.Volume, o.Destination, o.OrderDate, o.Status
+        FROM dbo.Orders o
+        JOIN @Batch b ON b.Id = o.OrderId;
+        DELETE o FROM dbo.Orders o JOIN @Batch b ON b.Id = o.OrderId;
+        COMMIT TRANSACTION;
+
+        SET @Orders += @Rows;
+        IF @Rows < @BatchSize BREAK;
+    END
+
+    WHILE @Oldest IS NOT NULL
+    BEGIN
+        DELETE FROM @Batch;
+        BEGIN TRANSACTION;
+        INSERT INTO @Batch (Id)
+        SELECT TOP (@BatchSize) ExceptionId FROM dbo.Exceptions WITH (UPDLOCK)
+        WHERE Processed = 1 AND OccurTime < @Cutoff;
+        SET @Rows = @@ROWCOUNT;
+
+        INSERT INTO dbo.ExceptionsArchive (ExceptionId, VehicleId, DriverId, OccurTime, ExceptionType, Phase,
+                                           FineAmount, Processed, ProcessedTime)
+        SELECT e.ExceptionId, e.VehicleId, e.DriverId, e.OccurTime, e.ExceptionType, e.Phase,
+               e.FineAmount, e.Processed, e.ProcessedTime
+        FROM dbo.Exceptions e
+        JOIN @Batch b ON b.Id = e.ExceptionId;
+        DELETE e FROM dbo.Exceptions e JOIN @Batch b ON b.Id = e.ExceptionId;
+        COMMIT TRANSACTION;
+
+        SET @Exceptions += @Rows;
+        IF @Rows < @BatchSize BREAK;
+    END
+
+    SELECT @Orders AS ArchivedOrders, @Exceptions AS ArchivedExceptions;
+END
+GO
+
+-- Write procedures used by the web pages. Each does its checks and its write
+-- in one call, with the vehicle row locked (UPDLOCK, HOLDLOCK) from the check
+-- to the commit, so two dispatchers acting on the same vehicle are serialized
+-- instead of both passing a stale check. Each answers with one row:
+--   ResultCode  0 成功 / 1 车辆或记录不存在 / 2 车辆状态不允许 / 3 司机无效
+--               4 超出最大载重 / 5 参数无效 / 6 没有待运单
+--   Message     text for the page
+-- A failed check writes nothing; the procedures only ever COMMIT, so they
+-- behave the same inside the caller's implicit transaction.
+
+-- Stored Procedure: Assign one order to a vehicle
+CREATE OR ALTER PROCEDURE dbo.sp_assign_order
+    @VehicleId INT,
+    @DriverId INT = NULL,
+    @Weight DECIMAL(12,2),
+    @Volume DECIMAL(12,2),
+    @Destination NVARCHAR(200),
+    @FleetId INT = NULL,            -- limit to one fleet (manager pages)
+    @RequireDriver BIT = 1,
+    @BlockDeparted BIT = 1
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    DECLARE @Result INT = 0, @Message NVARCHAR(200) = N'运单已分配';
+    DECLARE @Status NVARCHAR(20), @VehicleFleet INT, @MaxWeight DECIMAL(12,2);
+
+    BEGIN TRANSACTION;
+    SELECT @Status = Status, @VehicleFleet = FleetId, @MaxWeight = MaxWeight
+    FROM dbo.Vehicles WITH (UPDLOCK, HOLDLOCK)
+    WHERE VehicleId = @VehicleId;
+
+    IF @Weight IS NULL OR @Volume IS NULL OR @Weight <= 0 OR @Volume <= 0 OR NULLIF(LTRIM(@Destination), N'') IS NULL
+        SELECT @Result = 5, @Message = N'重量、体积须大于 0 且目的地不能为空';
+    ELSE IF @Status IS NULL OR (@FleetId IS NOT NULL AND @VehicleFleet <> @FleetId)
+        SELECT @Result = 1, @Message = N'车辆不存在';
+    ELSE IF @BlockDeparted = 1 AND @Status = N'运输中'
+        SELECT @Result = 2, @Message = N'车辆已发车，无法再添加运单';
+    ELSE IF @DriverId IS NULL AND @RequireDriver = 1
+        SELECT @Result = 3, @Message = N'必须选择司机';
+    ELSE IF @DriverId IS NOT NULL AND NOT EXISTS (
+        SELECT 1 FROM dbo.Drivers WHERE DriverId = @DriverId AND (@FleetId IS NULL OR FleetId = @FleetId))
+        SELECT @Result = 3, @Message = N'司机不存在或不属于该车队';
+    ELSE IF ISNULL((SELECT AssignedWeight FROM dbo.VehicleLoad WITH (NOEXPAND) WHERE VehicleId = @VehicleId), 0)
+            + @Weight > @MaxWeight
+        SELECT @Result = 4, @Message = N'超出最大载重：分配失败';
+
+    -- TR_Orders_CheckWeight still re-checks the weight on insert
+    IF @Result = 0
+        INSERT INTO dbo.Orders (VehicleId, DriverId, Weight, Volume, Destination, Status)
+        VALUES (@VehicleId, @DriverId, @Weight, @Volume, @Destination, N'新建');
+    COMMIT TRANSACTION;
+
+    SELECT @Result AS ResultCode, @Message AS Message;
+END
+GO
+
+-- Stored Procedure: Depart a vehicle (status -> 运输中) when it has active orders
+CREATE OR ALTER PROCEDURE dbo.sp_vehicle_depart
+    @VehicleId INT,
+    @FleetId INT = NULL
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    DECLARE @Result INT = 0, @Message NVARCHAR(200) = N'车辆已发车，状态变更为运输中';
+    DECLARE @Status NVARCHAR(20), @VehicleFleet INT;
+
+    BEGIN TRANSACTION;
+    SELECT @Status = Status, @VehicleFleet = FleetId
+    FROM dbo.Vehicles WITH (UPDLOCK, HOLDLOCK)
+    WHERE VehicleId = @VehicleId;
+
+    IF @Status IS NULL OR (@FleetId IS NOT NULL AND @VehicleFleet <> @FleetId)
+        SELECT @Result = 1, @Message = N'车辆不存在';
+    ELSE IF @Status = N'运输中'
+        SELECT @Result = 2, @Message = N'车辆已在运输中';
+    ELSE IF ISNULL((SELECT ActiveOrders FROM dbo.VehicleLoad WITH (NOEXPAND) WHERE VehicleId = @VehicleId), 0) = 0
+        SELECT @Result = 6, @Message = N'该车辆没有待运单，无法发车';
+
+    IF @Result = 0
+        UPDATE dbo.Vehicles SET Status = N'运输中' WHERE VehicleId = @VehicleId;
+    COMMIT TRANSACTION;
+
+    SELECT @Result AS ResultCode, @Message AS Message;
+END
+GO
+
+-- Stored Procedure: Record one exception (TR_Exceptions_AfterInsert_Status
+-- then marks the vehicle 异常)
+CREATE OR ALTER PROCEDURE dbo.sp_record_exception
+    @VehicleId INT,
+    @DriverId INT = NULL,
+    @ExceptionType NVARCHAR(50),
+    @Phase NVARCHAR(20),
+    @FineAmount DECIMAL(12,2) = 0,
+    @FleetId INT = NULL
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    DECLARE @Result INT = 0, @Message NVARCHAR(200) = N'异常已记录，车辆状态置为异常';
+    DECLARE @VehicleFleet INT;
+
+    BEGIN TRANSACTION;
+    SELECT @VehicleFleet = FleetId
+    FROM dbo.Vehicles WITH (UPDLOCK, HOLDLOCK)
+    WHERE VehicleId = @VehicleId;
+
+    IF @ExceptionType NOT IN (N'货物破损', N'车辆故障', N'严重延误', N'超速报警')
+       OR @Phase NOT IN (N'运输中异常', N'空闲时异常') OR ISNULL(@FineAmount, -1) < 0
+        SELECT @Result = 5, @Message = N'异常类型、阶段或罚款金额无效';
+    ELSE IF @VehicleFleet IS NULL OR (@FleetId IS NOT NULL AND @VehicleFleet <> @FleetId)
+        SELECT @Result = 1, @Message = N'车辆不存在';
+    ELSE IF @DriverId IS NOT NULL AND NOT EXISTS (
+        SELECT 1 FROM dbo.Drivers WHERE DriverId = @DriverId AND (@FleetId IS NULL OR FleetId = @FleetId))
+        SELECT @Result = 3, @Message = N'司机不存在或不属于该车队';
+
+    IF @Result = 0
+        INSERT INTO dbo.Exceptions (VehicleId, DriverId, ExceptionType, Phase, FineAmount)
+        VALUES (@VehicleId, @DriverId, @ExceptionType, @Phase, @FineAmount);
+    COMMIT TRANSACTION;
+
+    SELECT @Result AS ResultCode, @Message AS Message;
+END
+GO
+
+-- Stored Procedure: Sign off (complete) a batch of orders given as a JSON id
+-- array. One UPDATE for the batch, so TR_Orders_AfterUpdate_Status runs once;
+-- returns Id, Outcome (ok / not_found / bad_status) and Status per id.
+CREATE OR ALTER PROCEDURE dbo.sp_sign_orders
+    @Ids NVARCHAR(MAX),
+    @FleetId INT = NULL
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    DECLARE @Batch TABLE (Id INT PRIMARY KEY);
+    DECLARE @Done TABLE (Id INT PRIMARY KEY);
+    INSERT INTO @Batch (Id) SELECT DISTINCT CAST(value AS INT) FROM OPENJSON(@Ids);
+
+    UPDATE o
+    SET o.Status = N'已完成'
+    OUTPUT inserted.OrderId INTO @Done (Id)
     FROM dbo.Orders o
-    JOIN FleetVehicles fv ON fv.VehicleId = o.VehicleId
-    WHERE o.OrderDate >= @StartDate AND o.OrderDate < DATEADD(DAY, 1, @EndDate);
+    JOIN @Batch b ON b.Id = o.OrderId
+    JOIN dbo.Vehicles v ON v.VehicleId = o.VehicleId
+    WHERE o.Status IN (N'新建', N'装货中', N'运输中') AND (@FleetId IS NULL OR v.FleetId = @FleetId);
+
+    SELECT b.Id,
+           CASE WHEN d.Id IS NOT NULL THEN 'ok'
+                WHEN o.OrderId IS NULL OR v.FleetId <> @FleetId THEN 'not_found'
+                ELSE 'bad_status' END AS Outcome,
+           o.Status
+    FROM @Batch b
+    LEFT JOIN @Done d ON d.Id = b.Id
+    LEFT JOIN dbo.Orders o ON o.OrderId = b.Id
+    LEFT JOIN dbo.Vehicles v ON v.VehicleId = o.VehicleId
+    ORDER BY b.Id;
+END
+GO
+
+-- Stored Procedure: Mark a batch of exceptions processed (JSON id array);
+-- TR_Exceptions_AfterUpdate_Processed runs once for the batch
+CREATE OR ALTER PROCEDURE dbo.sp_process_exceptions
+    @Ids NVARCHAR(MAX),
+    @FleetId INT = NULL
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    DECLARE @Batch TABLE (Id INT PRIMARY KEY);
+    DECLARE @Done TABLE (Id INT PRIMARY KEY);
+    INSERT INTO @Batch (Id) SELECT DISTINCT CAST(value AS INT) FROM OPENJSON(@Ids);
+
+    UPDATE e
+    SET e.Processed = 1, e.ProcessedTime = SYSDATETIME()
+    OUTPUT inserted.ExceptionId INTO @Done (Id)
+    FROM dbo.Exceptions e
+    JOIN @Batch b ON b.Id = e.ExceptionId
+    JOIN dbo.Vehicles v ON v.VehicleId = e.VehicleId
+    WHERE e.Processed = 0 AND (@FleetId IS NULL OR v.FleetId = @FleetId);
+
+    SELECT b.Id,
+           CASE WHEN d.Id IS NOT NULL THEN 'ok'
+                WHEN e.ExceptionId IS NULL OR v.FleetId <> @FleetId THEN 'not_found'
+                ELSE 'bad_status' END AS Outcome,
+           CASE WHEN e.Processed = 1 THEN N'已处理' ELSE N'未处理' END AS Status
+    FROM @Batch b
+    LEFT JOIN @Done d ON d.Id = b.Id
+    LEFT JOIN dbo.Exceptions e ON e.ExceptionId = b.Id
+    LEFT JOIN dbo.Vehicles v ON v.VehicleId = e.VehicleId
+    ORDER BY b.Id;
 END
 GO
 
--- Stored Procedure: Driver Performance Tracking
+-- Stored Procedure: Driver Performance Tracking (hot and archived records)
 CREATE OR ALTER PROCEDURE dbo.sp_driver_performance_report
     @DriverId INT,
     @StartDate DATETIME2,
@@ -228,7 +794,7 @@ BEGIN
         SUM(CASE WHEN Status = N'已完成' THEN 1 ELSE 0 END) AS CompletedOrders,
         SUM(Weight) AS TotalWeight,
         SUM(Volume) AS TotalVolume
-    FROM dbo.Orders
+    FROM dbo.vw_orders_all
     WHERE DriverId = @DriverId 
       AND OrderDate BETWEEN @StartDate AND @EndDate;
 
@@ -241,13 +807,67 @@ BEGIN
         Phase,
         FineAmount,
         Processed
-    FROM dbo.Exceptions
+    FROM dbo.vw_exceptions_all
     WHERE DriverId = @DriverId
       AND OccurTime BETWEEN @StartDate AND @EndDate
     ORDER BY OccurTime DESC;
 END
 GO
 
+-- Stored Procedure: Leaderboard of every driver in a fleet over a date range
+-- (inclusive). Orders and exceptions, hot and archived, are each grouped once
+-- per driver, seeking IX_Orders_Driver_OrderDate / IX_Exceptions_Driver_OccurTime
+-- (and their archive counterparts) per driver, so the whole fleet costs one call
+-- instead of one report per driver. Drivers with no activity are listed with zeros.
+CREATE OR ALTER PROCEDURE dbo.sp_fleet_driver_leaderboard
+    @FleetId INT,
+    @StartDate DATE,
+    @EndDate DATE
+AS
+BEGIN
+    SET NOCOUNT ON;
+    DECLARE @From DATETIME2 = @StartDate;
+    DECLARE @To DATETIME2 = DATEADD(DAY, 1, CAST(@EndDate AS DATETIME2));
+
+    WITH DriverOrders AS (
+        SELECT o.DriverId,
+               COUNT(*) AS TotalOrders,
+               SUM(CASE WHEN o.Status = N'已完成' THEN 1 ELSE 0 END) AS CompletedOrders,
+               SUM(o.Weight) AS TotalWeight,
+               SUM(o.Volume) AS TotalVolume
+        FROM dbo.Drivers d
+        JOIN dbo.vw_orders_all o ON o.DriverId = d.DriverId
+        WHERE d.FleetId = @FleetId AND o.OrderDate >= @From AND o.OrderDate < @To
+        GROUP BY o.DriverId
+    ),
+    DriverExceptions AS (
+        SELECT e.DriverId,
+               COUNT(*) AS TotalExceptions,
+               SUM(CASE WHEN e.Processed = 0 THEN 1 ELSE 0 END) AS OpenExceptions,
+               SUM(e.FineAmount) AS TotalFineAmount
+        FROM dbo.Drivers d
+        JOIN dbo.vw_exceptions_all e ON e.DriverId = d.DriverId
+        WHERE d.FleetId = @FleetId AND e.OccurTime >= @From AND e.OccurTime < @To
+        GROUP BY e.DriverId
+    )
+    SELECT d.DriverId, d.EmployeeNo, d.Name,
+           ISNULL(o.TotalOrders, 0) AS TotalOrders,
+           ISNULL(o.CompletedOrders, 0) AS CompletedOrders,
+           CAST(CASE WHEN o.TotalOrders > 0 THEN 100.0 * o.CompletedOrders / o.TotalOrders END
+                AS DECIMAL(5,2)) AS CompletionRate,
+           ISNULL(o.TotalWeight, 0) AS TotalWeight,
+           ISNULL(o.TotalVolume, 0) AS TotalVolume,
+           ISNULL(e.TotalExceptions, 0) AS TotalExceptions,
+           ISNULL(e.OpenExceptions, 0) AS OpenExceptions,
+           ISNULL(e.TotalFineAmount, 0) AS TotalFineAmount
+    FROM dbo.Drivers d
+    LEFT JOIN DriverOrders o ON o.DriverId = d.DriverId
+    LEFT JOIN DriverExceptions e ON e.DriverId = d.DriverId
+    WHERE d.FleetId = @FleetId
+    ORDER BY d.DriverId;
+END
+GO
+
 PRINT N'正在创建触发器...';
 GO
 
@@ -259,23 +879,18 @@ AS
 BEGIN
     SET NOCOUNT ON;
     -- Validate against vehicle capacity
+    -- Current load comes from the VehicleLoad indexed view (one seek per vehicle)
     ;WITH NewByVehicle AS (
         SELECT VehicleId, SUM(Weight) AS NewWeight
         FROM inserted
         GROUP BY VehicleId
-    ), CurrLoad AS (
-        SELECT o.VehicleId, SUM(o.Weight) AS CurrWeight
-        FROM dbo.Orders o
-        WHERE o.Status IN (N'新建', N'装货中', N'运输中')
-          AND EXISTS (SELECT 1 FROM inserted i WHERE i.VehicleId = o.VehicleId)
-        GROUP BY o.VehicleId
     )
     SELECT v.VehicleId
     INTO #OverWeight
     FROM NewByVehicle n
     JOIN dbo.Vehicles v ON v.VehicleId = n.VehicleId
-    LEFT JOIN CurrLoad c ON c.VehicleId = n.VehicleId
-    WHERE (ISNULL(c.CurrWeight, 0) + n.NewWeight) > v.MaxWeight;
+    LEFT JOIN dbo.VehicleLoad l WITH (NOEXPAND) ON l.VehicleId = n.VehicleId
+    WHERE (ISNULL(l.AssignedWeight, 0) + n.NewWeight) > v.MaxWeight;
 
     IF EXISTS (SELECT 1 FROM #OverWeight)
     BEGIN
@@ -289,15 +904,14 @@ BEGIN
     SELECT VehicleId, DriverId, Weight, Volume, Destination, ISNULL(OrderDate, SYSDATETIME()), ISNULL(Status, N'新建')
     FROM inserted;
 
-    -- Set vehicle status to "运输中" when it has active orders
+    -- Set vehicle status to "运输中" when it has active orders.
+    -- Only the vehicles in this statement are touched; rows already 运输中 are skipped.
     UPDATE v
     SET v.Status = N'运输中'
     FROM dbo.Vehicles v
-    WHERE EXISTS (
-        SELECT 1 FROM dbo.Orders o
-        WHERE o.VehicleId = v.VehicleId
-          AND o.Status IN (N'新建', N'装货中', N'运输中')
-    );
+    JOIN (SELECT DISTINCT VehicleId FROM inserted) t ON t.VehicleId = v.VehicleId
+    JOIN dbo.VehicleLoad l WITH (NOEXPAND) ON l.VehicleId = v.VehicleId
+    WHERE v.Status <> N'运输中';
 END
 GO
 
@@ -308,38 +922,25 @@ AFTER UPDATE
 AS
 BEGIN
     SET NOCOUNT ON;
-    -- When orders become active, set vehicle to "运输中"
-    IF EXISTS (
-        SELECT 1 FROM inserted i
-        WHERE i.Status IN (N'新建', N'装货中', N'运输中')
-    )
-    BEGIN
-        UPDATE v
-        SET v.Status = N'运输中'
-        FROM dbo.Vehicles v
-        WHERE EXISTS (
-            SELECT 1 FROM inserted i WHERE i.VehicleId = v.VehicleId
-        );
-    END
+    IF NOT UPDATE(Status) RETURN;
 
-    -- When orders complete, if no active orders remain, set vehicle to "空闲"
-    IF EXISTS (
-        SELECT 1 FROM inserted i
-        WHERE i.Status = N'已完成'
+    -- One set-based pass over the vehicles of the updated orders:
+    --   orders became/remain active                  -> "运输中"
+    --   orders completed and no active orders remain -> "空闲"
+    ;WITH Touched AS (
+        SELECT i.VehicleId,
+               MAX(CASE WHEN i.Status IN (N'新建', N'装货中', N'运输中') THEN 1 ELSE 0 END) AS AnyActive,
+               MAX(CASE WHEN i.Status = N'已完成' THEN 1 ELSE 0 END) AS AnyCompleted
+        FROM inserted i
+        GROUP BY i.VehicleId
     )
-    BEGIN
-        UPDATE v
-        SET v.Status = N'空闲'
-        FROM dbo.Vehicles v
-        WHERE NOT EXISTS (
-            SELECT 1 FROM dbo.Orders o
-            WHERE o.VehicleId = v.VehicleId
-              AND o.Status IN (N'新建', N'装货中', N'运输中')
-        )
-        AND EXISTS (
-            SELECT 1 FROM inserted i WHERE i.VehicleId = v.VehicleId
-        );
-    END
+    UPDATE v
+    SET v.Status = CASE WHEN l.VehicleId IS NULL THEN N'空闲' ELSE N'运输中' END
+    FROM dbo.Vehicles v
+    JOIN Touched t ON t.VehicleId = v.VehicleId
+    LEFT JOIN dbo.VehicleLoad l WITH (NOEXPAND) ON l.VehicleId = v.VehicleId
+    WHERE (l.VehicleId IS NOT NULL AND t.AnyActive = 1 AND v.Status <> N'运输中')
+       OR (l.VehicleId IS NULL AND t.AnyCompleted = 1 AND v.Status <> N'空闲');
 END
 GO
 
@@ -353,7 +954,8 @@ BEGIN
     UPDATE v
     SET v.Status = N'异常'
     FROM dbo.Vehicles v
-    WHERE EXISTS (SELECT 1 FROM inserted i WHERE i.VehicleId = v.VehicleId);
+    JOIN (SELECT DISTINCT VehicleId FROM inserted) t ON t.VehicleId = v.VehicleId
+    WHERE v.Status <> N'异常';
 END
 GO
 
@@ -364,6 +966,8 @@ AFTER UPDATE
 AS
 BEGIN
     SET NOCOUNT ON;
+    IF NOT UPDATE(Processed) RETURN;
+
     -- Audit logs when processed changes
     INSERT INTO dbo.History_Log (Entity, EntityId, Action, OldValue, NewValue, ChangedBy)
     SELECT N'Exception', d.ExceptionId, N'Processed',
@@ -374,24 +978,17 @@ BEGIN
     JOIN inserted i ON i.ExceptionId = d.ExceptionId
     WHERE ISNULL(d.Processed, 0) <> ISNULL(i.Processed, 0);
 
-    -- When processed=1, restore vehicle status
-    IF EXISTS (
-        SELECT 1 FROM inserted i
-        WHERE i.Processed = 1
-    )
-    BEGIN
-        UPDATE v
-        SET v.Status = CASE
-            WHEN EXISTS (
-                SELECT 1 FROM dbo.Orders o
-                WHERE o.VehicleId = v.VehicleId
-                  AND o.Status IN (N'新建', N'装货中', N'运输中')
-            ) THEN N'运输中' ELSE N'空闲' END
-        FROM dbo.Vehicles v
-        WHERE EXISTS (
-            SELECT 1 FROM inserted i WHERE i.VehicleId = v.VehicleId AND i.Processed = 1
-        );
-    END
+    -- When processed flips to 1, restore the status of those vehicles only
+    UPDATE v
+    SET v.Status = CASE WHEN l.VehicleId IS NOT NULL THEN N'运输中' ELSE N'空闲' END
+    FROM dbo.Vehicles v
+    JOIN (
+        SELECT DISTINCT i.VehicleId
+        FROM inserted i
+        JOIN deleted d ON d.ExceptionId = i.ExceptionId
+        WHERE i.Processed = 1 AND ISNULL(d.Processed, 0) = 0
+    ) t ON t.VehicleId = v.VehicleId
+    LEFT JOIN dbo.VehicleLoad l WITH (NOEXPAND) ON l.VehicleId = v.VehicleId;
 END
 GO
 
@@ -402,6 +999,7 @@ AFTER UPDATE
 AS
 BEGIN
     SET NOCOUNT ON;
+    IF NOT UPDATE(LicenseLevel) RETURN;
     INSERT INTO dbo.History_Log (Entity, EntityId, Action, OldValue, NewValue, ChangedBy)
     SELECT N'Driver', d.DriverId, N'LicenseLevelChange',
            CONCAT(N'LicenseLevel(old)=', d.LicenseLevel),
@@ -413,6 +1011,188 @@ BEGIN
 END
 GO
 
+-- 6) FleetDailyStats upkeep: each trigger below turns its inserted/deleted
+--    rows into signed per-(fleet, day) deltas and hands them to this procedure
+CREATE OR ALTER PROCEDURE dbo.sp_apply_fleet_daily_delta
+    @Delta dbo.FleetDailyDelta READONLY
+AS
+BEGIN
+    SET NOCOUNT ON;
+    MERGE dbo.FleetDailyStats WITH (HOLDLOCK) AS t
+    USING (
+        SELECT * FROM @Delta
+        WHERE TotalOrders <> 0 OR NewOrders <> 0 OR LoadingOrders <> 0 OR InTransitOrders <> 0
+           OR CompletedOrders <> 0 OR CancelledOrders <> 0 OR TotalExceptions <> 0 OR TotalFineAmount <> 0
+    ) AS s
+    ON t.FleetId = s.FleetId AND t.StatDate = s.StatDate
+    WHEN MATCHED THEN UPDATE SET
+        TotalOrders = t.TotalOrders + s.TotalOrders,
+        NewOrders = t.NewOrders + s.NewOrders,
+        LoadingOrders = t.LoadingOrders + s.LoadingOrders,
+        InTransitOrders = t.InTransitOrders + s.InTransitOrders,
+        CompletedOrders = t.CompletedOrders + s.CompletedOrders,
+        CancelledOrders = t.CancelledOrders + s.CancelledOrders,
+        TotalExceptions = t.TotalExceptions + s.TotalExceptions,
+        TotalFineAmount = t.TotalFineAmount + s.TotalFineAmount
+    WHEN NOT MATCHED THEN
+        INSERT (FleetId, StatDate, TotalOrders, NewOrders, LoadingOrders, InTransitOrders,
+                CompletedOrders, CancelledOrders, TotalExceptions, TotalFineAmount)
+        VALUES (s.FleetId, s.StatDate, s.TotalOrders, s.NewOrders, s.LoadingOrders, s.InTransitOrders,
+                s.CompletedOrders, s.CancelledOrders, s.TotalExceptions, s.TotalFineAmount);
+END
+GO
+
+CREATE OR ALTER TRIGGER dbo.TR_Orders_FleetDailyStats
+ON dbo.Orders
+AFTER INSERT, UPDATE, DELETE
+AS
+BEGIN
+    SET NOCOUNT ON;
+    IF NOT EXISTS (SELECT 1 FROM inserted) AND NOT EXISTS (SELECT 1 FROM deleted) RETURN;
+    IF EXISTS (SELECT 1 FROM deleted) AND NOT (UPDATE(Status) OR UPDATE(VehicleId) OR UPDATE(OrderDate))
+       AND EXISTS (SELECT 1 FROM inserted) RETURN;
+
+    DECLARE @Delta dbo.FleetDailyDelta;
+    INSERT INTO @Delta (FleetId, StatDate, TotalOrders, NewOrders, LoadingOrders, InTransitOrders,
+                        CompletedOrders, CancelledOrders)
+    SELECT v.FleetId, x.StatDate,
+           SUM(x.Sign),
+           SUM(CASE WHEN x.Status = N'新建' THEN x.Sign ELSE 0 END),
+           SUM(CASE WHEN x.Status = N'装货中' THEN x.Sign ELSE 0 END),
+           SUM(CASE WHEN x.Status = N'运输中' THEN x.Sign ELSE 0 END),
+           SUM(CASE WHEN x.Status = N'已完成' THEN x.Sign ELSE 0 END),
+           SUM(CASE WHEN x.Status = N'取消' THEN x.Sign ELSE 0 END)
+    FROM (
+        SELECT VehicleId, CAST(OrderDate AS DATE) AS StatDate, Status, 1 AS Sign FROM inserted
+        UNION ALL
+        SELECT d.VehicleId, CAST(d.OrderDate AS DATE), d.Status, -1 FROM deleted d
+        -- Orders moved to the archive (sp_archive_closed_records) stay counted
+        WHERE NOT EXISTS (SELECT 1 FROM dbo.OrdersArchive a WHERE a.OrderDate = d.OrderDate AND a.OrderId = d.OrderId)
+    ) x
+    JOIN dbo.Vehicles v ON v.VehicleId = x.VehicleId
+    GROUP BY v.FleetId, x.StatDate;
+
+    EXEC dbo.sp_apply_fleet_daily_delta @Delta;
+END
+GO
+
+CREATE OR ALTER TRIGGER dbo.TR_Exceptions_FleetDailyStats
+ON dbo.Exceptions
+AFTER INSERT, UPDATE, DELETE
+AS
+BEGIN
+    SET NOCOUNT ON;
+    IF NOT EXISTS (SELECT 1 FROM inserted) AND NOT EXISTS (SELECT 1 FROM deleted) RETURN;
+    -- Processing an exception (Processed / ProcessedTime) does not change the rollup
+    IF EXISTS (SELECT 1 FROM deleted) AND NOT (UPDATE(FineAmount) OR UPDATE(VehicleId) OR UPDATE(OccurTime))
+       AND EXISTS (SELECT 1 FROM inserted) RETURN;
+
+    DECLARE @Delta dbo.FleetDailyDelta;
+    INSERT INTO @Delta (FleetId, StatDate, TotalExceptions, TotalFineAmount)
+    SELECT v.FleetId, x.StatDate, SUM(x.Sign), SUM(x.Sign * x.FineAmount)
+    FROM (
+        SELECT VehicleId, CAST(OccurTime AS DATE) AS StatDate, FineAmount, 1 AS Sign FROM inserted
+        UNION ALL
+        SELECT d.VehicleId, CAST(d.OccurTime AS DATE), d.FineAmount, -1 FROM deleted d
+        -- Exceptions moved to the archive (sp_archive_closed_records) stay counted
+        WHERE NOT EXISTS (SELECT 1 FROM dbo.ExceptionsArchive a
+                          WHERE a.OccurTime = d.OccurTime AND a.ExceptionId = d.ExceptionId)
+    ) x
+    JOIN dbo.Vehicles v ON v.VehicleId = x.VehicleId
+    GROUP BY v.FleetId, x.StatDate;
+
+    EXEC dbo.sp_apply_fleet_daily_delta @Delta;
+END
+GO
+
+-- Moving a vehicle to another fleet moves its history (archived included) in the rollup as well
+CREATE OR ALTER TRIGGER dbo.TR_Vehicles_FleetDailyStats
+ON dbo.Vehicles
+AFTER UPDATE
+AS
+BEGIN
+    SET NOCOUNT ON;
+    IF NOT UPDATE(FleetId) RETURN;
+
+    DECLARE @Delta dbo.FleetDailyDelta;
+    ;WITH Moved AS (
+        SELECT i.VehicleId, d.FleetId AS OldFleetId, i.FleetId AS NewFleetId
+        FROM inserted i
+        JOIN deleted d ON d.VehicleId = i.VehicleId
+        WHERE i.FleetId <> d.FleetId
+    ),
+    Facts AS (
+        SELECT m.OldFleetId, m.NewFleetId, CAST(o.OrderDate AS DATE) AS StatDate,
+               1 AS Orders, o.Status, 0 AS Exceptions, CAST(0 AS DECIMAL(14,2)) AS Fine
+        FROM Moved m JOIN dbo.vw_orders_all o ON o.VehicleId = m.VehicleId
+        UNION ALL
+        SELECT m.OldFleetId, m.NewFleetId, CAST(e.OccurTime AS DATE),
+               0, NULL, 1, e.FineAmount
+        FROM Moved m JOIN dbo.vw_exceptions_all e ON e.VehicleId = m.VehicleId
+    ),
+    Signed AS (
+        SELECT OldFleetId AS FleetId, StatDate, -1 AS Sign, Orders, Status, Exceptions, Fine FROM Facts
+        UNION ALL
+        SELECT NewFleetId, StatDate, 1, Orders, Status, Exceptions, Fine FROM Facts
+    )
+    INSERT INTO @Delta (FleetId, StatDate, TotalOrders, NewOrders, LoadingOrders, InTransitOrders,
+                        CompletedOrders, CancelledOrders, TotalExceptions, TotalFineAmount)
+    SELECT FleetId, StatDate,
+           SUM(Sign * Orders),
+           SUM(CASE WHEN Status = N'新建' THEN Sign ELSE 0 END),
+           SUM(CASE WHEN Status = N'装货中' THEN Sign ELSE 0 END),
+           SUM(CASE WHEN Status = N'运输中' THEN Sign ELSE 0 END),
+           SUM(CASE WHEN Status = N'已完成' THEN Sign ELSE 0 END),
+           SUM(CASE WHEN Status = N'取消' THEN Sign ELSE 0 END),
+           SUM(Sign * Exceptions),
+           SUM(Sign * Fine)
+    FROM Signed
+    GROUP BY FleetId, StatDate;
+
+    EXEC dbo.sp_apply_fleet_daily_delta @Delta;
+END
+GO
+
+-- 7) ChangeFeed capture for the live feed. Vehicle status is only changed by
+--    the triggers above (nested trigger calls, on by default) or the vehicle
+--    pages, so one trigger on Vehicles sees every status change.
+CREATE OR ALTER TRIGGER dbo.TR_Vehicles_ChangeFeed
+ON dbo.Vehicles
+AFTER INSERT, UPDATE
+AS
+BEGIN
+    SET NOCOUNT ON;
+    IF NOT UPDATE(Status) RETURN;
+
+    INSERT INTO dbo.ChangeFeed (Kind, FleetId, VehicleId, OldValue, NewValue)
+    SELECT N'vehicle_status', i.FleetId, i.VehicleId, d.Status, i.Status
+    FROM inserted i
+    LEFT JOIN deleted d ON d.VehicleId = i.VehicleId
+    WHERE d.VehicleId IS NULL OR d.Status <> i.Status;
+END
+GO
+
+CREATE OR ALTER TRIGGER dbo.TR_Exceptions_ChangeFeed
+ON dbo.Exceptions
+AFTER INSERT, UPDATE
+AS
+BEGIN
+    SET NOCOUNT ON;
+    INSERT INTO dbo.ChangeFeed (Kind, FleetId, VehicleId, ExceptionId, OldValue, NewValue)
+    SELECT CASE WHEN d.ExceptionId IS NULL THEN N'exception' ELSE N'exception_processed' END,
+           v.FleetId, i.VehicleId, i.ExceptionId, i.Phase, i.ExceptionType
+    FROM inserted i
+    JOIN dbo.Vehicles v ON v.VehicleId = i.VehicleId
+    LEFT JOIN deleted d ON d.ExceptionId = i.ExceptionId
+    WHERE d.ExceptionId IS NULL OR (i.Processed = 1 AND d.Processed = 0);
+END
+GO
+
+-- Backfill the rollup once for databases that already hold orders
+IF NOT EXISTS (SELECT 1 FROM dbo.FleetDailyStats)
+    EXEC dbo.sp_refresh_fleet_daily_stats;
+GO
+
 PRINT N'正在插入初始数据...';
 GO
 
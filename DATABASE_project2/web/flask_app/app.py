@@ -1,31 +1,218 @@
+import hmac
+import logging
 import os
-from flask import Flask, request, render_template, redirect, url_for, flash, session
+from flask import Flask, Response, current_app, has_request_context, request, render_template, redirect, url_for, flash, session, jsonify, stream_with_context
 import pyodbc
 from dotenv import load_dotenv
+from werkzeug.local import LocalProxy
+from db_pool import ConnectionPool
+from query_metrics import QueryMetrics
+from page_queries import PageQueries
+from cache import TTLCache
+from fragment_cache import FileBackend, FragmentCache, MemoryBackend
+from pagination import Page, InvalidCursor, page_args, decode_id_cursor, time_seek
+from bulk_import import FIELDS as IMPORT_FIELDS, ImportFileError, read_rows, run_import
+import dispatch
+import batch_actions
+import leaderboard
+from etag import conditional_json
+from live_feed import LiveFeed
 from functools import wraps
 from datetime import date, timedelta
 
-app = Flask(__name__)
-app.secret_key = os.getenv("APP_SECRET", "dev-secret")
 
-# SQL Server connection
-# Load environment variables from .env if present
-load_dotenv()
-SQL_SERVER = os.getenv("SQLSERVER_SERVER", "localhost")
-SQL_DB = os.getenv("SQLSERVER_DB", "LogisticsDB")
-SQL_USER = os.getenv("SQLSERVER_USER")
-SQL_PASSWORD = os.getenv("SQLSERVER_PASSWORD")
+# The app is built by create_app(): its config, connection pools, caches and
+# background workers are created there and kept in app.extensions. In the view
+# code below these names stand for the objects of the app serving the request.
+def _extension(name):
+    return LocalProxy(lambda: current_app.extensions[name])
 
-# Build connection string (SQL auth or Windows auth)
-if SQL_USER and SQL_PASSWORD:
-    CONN_STR = f"DRIVER={{ODBC Driver 17 for SQL Server}};SERVER={SQL_SERVER};DATABASE={SQL_DB};UID={SQL_USER};PWD={SQL_PASSWORD}"
-else:
-    # Windows Integrated Authentication
-    CONN_STR = f"DRIVER={{ODBC Driver 17 for SQL Server}};SERVER={SQL_SERVER};DATABASE={SQL_DB};Trusted_Connection=yes;"
+
+pool = _extension("pool")
+read_pool = _extension("read_pool")
+query_metrics = _extension("query_metrics")
+page_queries = _extension("page_queries")
+ref_cache = _extension("ref_cache")
+fragment_cache = _extension("fragment_cache")
+live_feed = _extension("live_feed")
+leaderboard_cache = _extension("leaderboard_cache")
+
+_routes = []
+
+
+def route(rule, **options):
+    """Same arguments as ``app.route``; init_routes() registers the view on an app."""
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
+
+
+def init_routes(app):
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+
+
+def load_config():
+    """Secret key and database targets from the environment (and .env)."""
+    # Load environment variables from .env if present
+    load_dotenv()
+    sql_server = os.getenv("SQLSERVER_SERVER", "localhost")
+    sql_db = os.getenv("SQLSERVER_DB", "LogisticsDB")
+    sql_user = os.getenv("SQLSERVER_USER")
+    sql_password = os.getenv("SQLSERVER_PASSWORD")
+
+    # Build connection string (SQL auth or Windows auth)
+    if sql_user and sql_password:
+        conn_str = f"DRIVER={{ODBC Driver 17 for SQL Server}};SERVER={sql_server};DATABASE={sql_db};UID={sql_user};PWD={sql_password}"
+    else:
+        # Windows Integrated Authentication
+        conn_str = f"DRIVER={{ODBC Driver 17 for SQL Server}};SERVER={sql_server};DATABASE={sql_db};Trusted_Connection=yes;"
+
+    # Read-only routes (reports, views, JSON feeds; see @read_only) get
+    # their own pool and target: SQLSERVER_READ_CONN_STR (e.g. a replica DSN), or
+    # the primary with ApplicationIntent=ReadOnly when SQLSERVER_READ_INTENT=1 (an
+    # availability group listener then routes to a readable secondary), otherwise
+    # the primary itself. Those sessions read under SNAPSHOT isolation (row
+    # versions, no shared locks), so long report scans and the trigger-heavy
+    # writes stop blocking each other.
+    if os.getenv("SQLSERVER_READ_CONN_STR"):
+        read_conn_str = os.getenv("SQLSERVER_READ_CONN_STR")
+    elif os.getenv("SQLSERVER_READ_INTENT") == "1":
+        read_conn_str = conn_str.rstrip(";") + ";ApplicationIntent=ReadOnly"
+    else:
+        read_conn_str = conn_str
+    read_isolation = os.getenv("DB_READ_ISOLATION", "SNAPSHOT").upper()
+    if read_isolation not in ("SNAPSHOT", "READ COMMITTED"):
+        raise ValueError(f"DB_READ_ISOLATION 只能是 SNAPSHOT 或 READ COMMITTED：{read_isolation}")
+    return {
+        "SECRET_KEY": os.getenv("APP_SECRET", "dev-secret"),
+        "CONN_STR": conn_str,
+        "READ_CONN_STR": read_conn_str,
+        "READ_ISOLATION": read_isolation,
+        "METRICS_TOKEN": os.getenv("METRICS_TOKEN"),
+    }
+
+
+def read_only(view):
+    """Declare a route read-only: its get_conn() comes from read_pool.
+
+    Place it directly under @route. Pages that also take a POST stay on
+    the primary so the redirect after a write shows that write.
+    """
+    view.read_only = True
+    return view
 
 
 def get_conn():
-    return pyodbc.connect(CONN_STR)
+    view = current_app.view_functions.get(request.endpoint) if has_request_context() else None
+    target = read_pool if getattr(view, "read_only", False) else pool
+    return query_metrics.wrap(target.request_conn())
+
+
+def exec_write(sql, params):
+    """EXEC one of the write procedures (sp_assign_order, sp_record_exception, ...),
+    commit, and flash its Message; returns the ResultCode (0 on success)."""
+    conn = get_conn()
+    row = conn.execute(sql, params).fetchone()
+    conn.commit()
+    flash(row.Message, "success" if row.ResultCode == 0 else "error")
+    return row.ResultCode
+
+
+def fleet_options(fleet_id):
+    return ref_cache.get(("fleets", fleet_id), lambda: get_conn().execute(
+        "SELECT FleetId, Name FROM dbo.Fleets WHERE FleetId = ?", (fleet_id,)).fetchall())
+
+
+def driver_options(fleet_id):
+    return ref_cache.get(("drivers", fleet_id), lambda: get_conn().execute(
+        "SELECT DriverId, Name, EmployeeNo FROM dbo.Drivers WHERE FleetId = ? ORDER BY Name", (fleet_id,)).fetchall())
+
+
+def vehicle_options(fleet_id):
+    return ref_cache.get(("vehicles", fleet_id), lambda: get_conn().execute(
+        "SELECT VehicleId, PlateNo FROM dbo.Vehicles WHERE FleetId = ? ORDER BY PlateNo", (fleet_id,)).fetchall())
+
+
+# /stats and /metrics expose SQL text and pool / cache internals: a signed-in
+# manager may read them, and so may a scraper sending
+# "Authorization: Bearer <METRICS_TOKEN>" (no token set: managers only).
+def monitoring_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if session.get('role') == 'Manager' and 'user_id' in session:
+            return f(*args, **kwargs)
+        auth = request.headers.get("Authorization", "")
+        token = current_app.config["METRICS_TOKEN"]
+        if token and auth.startswith("Bearer ") and hmac.compare_digest(
+                auth[len("Bearer "):].encode(), token.encode()):
+            return f(*args, **kwargs)
+        return Response("Forbidden\n", status=403, mimetype="text/plain")
+    return decorated_function
+
+
+@route("/stats")
+@monitoring_required
+def stats():
+    return jsonify(pool=pool.stats(), read_pool=read_pool.stats(), ref_cache=ref_cache.stats(),
+                   leaderboard_cache=leaderboard_cache.stats(), fragment_cache=fragment_cache.stats(),
+                   live_feed=live_feed.stats(),
+                   query_metrics=query_metrics.stats())
+
+
+@route("/metrics")
+@monitoring_required
+def metrics():
+    pools = {"primary": pool.stats(), "read": read_pool.stats()}
+    gauges = [
+        "# HELP fleet_db_pool_connections Pooled connections by state.",
+        "# TYPE fleet_db_pool_connections gauge",
+    ]
+    for name, p in pools.items():
+        gauges += [f'fleet_db_pool_connections{{pool="{name}",state="idle"}} {p["idle"]}',
+                   f'fleet_db_pool_connections{{pool="{name}",state="in_use"}} {p["in_use"]}']
+    gauges += [
+        "# HELP fleet_db_pool_wait_seconds_total Time spent waiting for a pooled connection.",
+        "# TYPE fleet_db_pool_wait_seconds_total counter",
+    ]
+    gauges += [f'fleet_db_pool_wait_seconds_total{{pool="{name}"}} {p["wait_seconds_total"]}'
+               for name, p in pools.items()]
+    gauges += [
+        "# HELP fleet_db_pool_timeouts_total Checkouts that gave up waiting.",
+        "# TYPE fleet_db_pool_timeouts_total counter",
+    ]
+    gauges += [f'fleet_db_pool_timeouts_total{{pool="{name}"}} {p["timeouts"]}' for name, p in pools.items()]
+    fragments = fragment_cache.stats()
+    gauges += [
+        "# HELP fleet_fragment_cache_lookups_total Rendered fragment lookups by fragment and result.",
+        "# TYPE fleet_fragment_cache_lookups_total counter",
+    ]
+    for name, f in sorted(fragments["fragments"].items()):
+        gauges += [f'fleet_fragment_cache_lookups_total{{fragment="{name}",result="hit"}} {f["hits"]}',
+                   f'fleet_fragment_cache_lookups_total{{fragment="{name}",result="miss"}} {f["misses"]}']
+    gauges += [
+        "# HELP fleet_fragment_cache_bytes Bytes held by the fragment cache.",
+        "# TYPE fleet_fragment_cache_bytes gauge",
+        f'fleet_fragment_cache_bytes{{backend="{fragments["backend"]}"}} {fragments["bytes"]}',
+    ]
+    return Response(query_metrics.render(gauges), mimetype="text/plain; version=0.0.4")
+
+
+# Keyset pagination: every list page seeks past the last key of the previous
+# page (TOP (n + 1) ... WHERE key < cursor), so deep pages cost the same as
+# the first one and only one page of rows is held in memory.
+def _seek(cursor, decode, condition, conditions, params):
+    if not cursor:
+        return None
+    try:
+        key = decode(cursor)
+    except InvalidCursor:
+        flash("分页参数无效，已返回第一页", "error")
+        return None
+    params.extend([key] * condition.count("?"))
+    conditions.append(condition)
+    return cursor
 
 # Login Decorator
 def login_required(f):
@@ -45,12 +232,12 @@ def manager_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-@app.route("/")
+@route("/")
 @login_required
 def index():
     return render_template("index.html")
 
-@app.route("/login", methods=["GET", "POST"])
+@route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
         username = request.form.get("username")
@@ -79,13 +266,13 @@ def login():
                 flash("用户名或密码错误", "error")
     return render_template("login.html")
 
-@app.route("/logout")
+@route("/logout")
 def logout():
     session.clear()
     flash("已退出登录", "success")
     return redirect(url_for('login'))
 
-@app.route("/drivers", methods=["GET", "POST"])
+@route("/drivers", methods=["GET", "POST"])
 @login_required
 @manager_required
 def drivers():
@@ -110,20 +297,28 @@ def drivers():
                         (employee_no, name, license_level, phone, fleet_id)
                     )
                     conn.commit()
+                    ref_cache.invalidate("drivers", fleet_id)
                     flash("司机已创建", "success")
             except pyodbc.Error as e:
                 flash(f"数据库错误：{e}", "error")
         return redirect(url_for("drivers"))
 
-    # GET: fetch drivers for manager's fleet
+    # GET: fetch one page of drivers for manager's fleet
+    page_size, cursor = page_args(request.args)
+    conditions, params = ["FleetId = ?"], [page_size + 1, fleet_id]
+    cursor = _seek(cursor, decode_id_cursor, "DriverId < ?", conditions, params)
     with get_conn() as conn:
-        drivers = conn.execute("SELECT DriverId, EmployeeNo, Name, LicenseLevel, Phone, FleetId FROM dbo.Drivers WHERE FleetId = ? ORDER BY DriverId DESC", (fleet_id,)).fetchall()
+        rows = conn.execute(
+            f"SELECT TOP (?) DriverId, EmployeeNo, Name, LicenseLevel, Phone, FleetId FROM dbo.Drivers WHERE {' AND '.join(conditions)} ORDER BY DriverId DESC",
+            params,
+        ).fetchall()
+        page = Page(rows, page_size, lambda r: (r.DriverId,), cursor, "drivers")
         # Manager only sees their fleet, so no need to select fleet
-        fleets = conn.execute("SELECT FleetId, Name FROM dbo.Fleets WHERE FleetId = ?", (fleet_id,)).fetchall()
-    return render_template("drivers.html", drivers=drivers, fleets=fleets)
+        fleets = fleet_options(fleet_id)
+    return render_template("drivers.html", drivers=page.rows, page=page, fleets=fleets)
 
 
-@app.route("/vehicles", methods=["GET", "POST"])
+@route("/vehicles", methods=["GET", "POST"])
 @login_required
 @manager_required
 def vehicles():
@@ -151,18 +346,26 @@ def vehicles():
                         (fleet_id, plate_no, float(max_weight), float(max_volume), status)
                     )
                     conn.commit()
+                    ref_cache.invalidate("vehicles", fleet_id)
                     flash("车辆已创建", "success")
             except pyodbc.Error as e:
                 flash(f"数据库错误：{e}", "error")
         return redirect(url_for("vehicles"))
 
+    page_size, cursor = page_args(request.args)
+    conditions, params = ["FleetId = ?"], [page_size + 1, fleet_id]
+    cursor = _seek(cursor, decode_id_cursor, "VehicleId < ?", conditions, params)
     with get_conn() as conn:
-        vehicles = conn.execute("SELECT VehicleId, PlateNo, MaxWeight, MaxVolume, Status, FleetId FROM dbo.Vehicles WHERE FleetId = ? ORDER BY VehicleId DESC", (fleet_id,)).fetchall()
-        fleets = conn.execute("SELECT FleetId, Name FROM dbo.Fleets WHERE FleetId = ?", (fleet_id,)).fetchall()
-    return render_template("vehicles.html", vehicles=vehicles, fleets=fleets)
+        rows = conn.execute(
+            f"SELECT TOP (?) VehicleId, PlateNo, MaxWeight, MaxVolume, Status, FleetId FROM dbo.Vehicles WHERE {' AND '.join(conditions)} ORDER BY VehicleId DESC",
+            params,
+        ).fetchall()
+        page = Page(rows, page_size, lambda r: (r.VehicleId,), cursor, "vehicles")
+        fleets = fleet_options(fleet_id)
+    return render_template("vehicles.html", vehicles=page.rows, page=page, fleets=fleets)
 
 
-@app.route("/orders/assign", methods=["GET", "POST"])
+@route("/orders/assign", methods=["GET", "POST"])
 @login_required
 @manager_required
 def assign_order():
@@ -175,19 +378,22 @@ def assign_order():
         volume = request.form.get("volume")
         destination = request.form.get("destination")
         try:
-            with get_conn() as conn:
-                conn.execute(
-                    "INSERT INTO dbo.Orders(VehicleId, DriverId, Weight, Volume, Destination, Status) VALUES (?, ?, ?, ?, ?, N'新建')",
-                    (int(vehicle_id), int(driver_id) if driver_id else None, float(weight), float(volume), destination)
-                )
-                conn.commit()
-                flash("运单已分配", "success")
+            # Checks (vehicle and driver in this fleet, capacity) and the insert
+            # run in sp_assign_order with the vehicle row locked
+            exec_write(
+                """EXEC dbo.sp_assign_order @VehicleId = ?, @DriverId = ?, @Weight = ?, @Volume = ?,
+                       @Destination = ?, @FleetId = ?, @RequireDriver = 0, @BlockDeparted = 0""",
+                (int(vehicle_id), int(driver_id) if driver_id else None, float(weight), float(volume),
+                 destination, fleet_id),
+            )
         except pyodbc.Error as e:
             msg = str(e)
             if "51000" in msg or "超出最大载重" in msg:
                 flash("超出最大载重：分配失败", "error")
             else:
                 flash(f"数据库错误：{e}", "error")
+        except (TypeError, ValueError):
+            flash("车辆、司机、重量或体积无效", "error")
         return redirect(url_for("assign_order"))
 
     with get_conn() as conn:
@@ -196,12 +402,11 @@ def assign_order():
             "SELECT VehicleId, PlateNo, Status, RemainingWeight FROM dbo.vw_fleet_vehicle_load WHERE Status = N'空闲' AND RemainingWeight > 0 AND FleetId = ? ORDER BY PlateNo",
             (fleet_id,)
         ).fetchall()
-        # Only show drivers in manager's fleet
-        drivers = conn.execute("SELECT DriverId, Name FROM dbo.Drivers WHERE FleetId = ? ORDER BY Name", (fleet_id,)).fetchall()
-    return render_template("assign_order.html", vehicles=vehicles, drivers=drivers)
+    # Only show drivers in manager's fleet
+    return render_template("assign_order.html", vehicles=vehicles, drivers=driver_options(fleet_id))
 
 
-@app.route("/exceptions", methods=["GET", "POST"])
+@route("/exceptions", methods=["GET", "POST"])
 @login_required
 @manager_required
 def exceptions():
@@ -214,99 +419,203 @@ def exceptions():
         phase = request.form.get("phase")
         fine = request.form.get("fine") or 0
         try:
-            with get_conn() as conn:
-                conn.execute(
-                    "INSERT INTO dbo.Exceptions(VehicleId, DriverId, ExceptionType, Phase, FineAmount) VALUES (?, ?, ?, ?, ?)",
-                    (int(vehicle_id), int(driver_id) if driver_id else None, exception_type, phase, float(fine))
-                )
-                conn.commit()
-                flash("异常已记录，车辆状态置为异常", "success")
+            exec_write(
+                """EXEC dbo.sp_record_exception @VehicleId = ?, @DriverId = ?, @ExceptionType = ?,
+                       @Phase = ?, @FineAmount = ?, @FleetId = ?""",
+                (int(vehicle_id), int(driver_id) if driver_id else None, exception_type, phase, float(fine), fleet_id),
+            )
         except pyodbc.Error as e:
             flash(f"数据库错误：{e}", "error")
+        except (TypeError, ValueError):
+            flash("车辆、司机或罚款金额无效", "error")
         return redirect(url_for("exceptions"))
 
-    with get_conn() as conn:
-        vehicles = conn.execute("SELECT VehicleId, PlateNo FROM dbo.Vehicles WHERE FleetId = ? ORDER BY PlateNo", (fleet_id,)).fetchall()
-        drivers = conn.execute("SELECT DriverId, Name FROM dbo.Drivers WHERE FleetId = ? ORDER BY Name", (fleet_id,)).fetchall()
-    return render_template("exceptions.html", vehicles=vehicles, drivers=drivers)
+    return render_template("exceptions.html", vehicles=vehicle_options(fleet_id), drivers=driver_options(fleet_id))
+
+
+def period_range(period_values):
+    """First and last day (inclusive) of a report period, as the report procedures take it."""
+    if isinstance(period_values[0], date):
+        return tuple(period_values)
+    start = date(*period_values, 1)
+    return start, (start + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+
 
+def period_closed(period_values):
+    """True when the report period ends before the current month began."""
+    return period_range(period_values)[1] < date.today().replace(day=1)
 
-@app.route("/reports/fleet_monthly")
+
+# A write transaction still open may hold a RowVer below a MAX(RowVer) that is
+# already visible, and its commit would not move the MAX. While any is open,
+# the probes also return MIN_ACTIVE_ROWVERSION(), which moves when it commits
+# (with none open it is @@DBTS + 1, left out so unrelated writes keep the ETag).
+OPEN_WRITES_SQL = "CASE WHEN MIN_ACTIVE_ROWVERSION() <= @@DBTS THEN MIN_ACTIVE_ROWVERSION() END"
+
+# Version of a fleet report: the FleetDailyStats rows it sums (which move with
+# Orders and Exceptions, with vehicles changing fleet, and with late changes to
+# a closed month), seeking the primary key over the period
+REPORT_VERSION_SQL = f"""
+    SELECT MAX(RowVer), COUNT_BIG(*), {OPEN_WRITES_SQL}
+    FROM dbo.FleetDailyStats
+    WHERE FleetId = ? AND StatDate BETWEEN ? AND ?"""
+
+
+@route("/reports/fleet_monthly")
+@read_only
 @login_required
 @manager_required
 def fleet_monthly():
     fleet_id = session.get('fleet_id')
     year = request.args.get("year")
     month = request.args.get("month")
-    result = None
-    if year and month:
-        with get_conn() as conn:
-            cursor = conn.cursor()
-            cursor.execute("EXEC dbo.sp_fleet_monthly_report @FleetId=?, @Year=?, @Month=?", (fleet_id, int(year), int(month)))
-            result = cursor.fetchone()
-    
+    start_date = request.args.get("start_date")
+    end_date = request.args.get("end_date")
+    result = period = None
+    if start_date and end_date:
+        # Arbitrary range (inclusive), summed from the FleetDailyStats rollup
+        try:
+            period = "@StartDate=?, @EndDate=?", (date.fromisoformat(start_date), date.fromisoformat(end_date))
+        except ValueError:
+            flash("日期格式无效", "error")
+    elif year and month:
+        period = "@Year=?, @Month=?", (int(year), int(month))
+    if period:
+        # The rendered result is cached per fleet, under the version of the rows it sums
+        period_args, period_values = period
+
+        def render():
+            with get_conn() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f"EXEC dbo.sp_fleet_monthly_report @FleetId=?, {period_args}", (fleet_id, *period_values))
+                return render_template("_report_result.html", result=cursor.fetchone())
+
+        version = get_conn().execute(REPORT_VERSION_SQL, (fleet_id, *period_range(period_values))).fetchone()
+        result = fragment_cache.get("fleet_monthly", (fleet_id, period_args, *period_values), version, render,
+                                    closed=period_closed(period_values))
+
     # Manager only sees their fleet
-    with get_conn() as conn:
-        fleets = conn.execute("SELECT FleetId, Name FROM dbo.Fleets WHERE FleetId = ?", (fleet_id,)).fetchall()
-        
-    return render_template("report.html", fleets=fleets, result=result)
+    return render_template("report.html", fleets=fleet_options(fleet_id), result=result)
+
+
+# Live dispatch board: Server-Sent Events from the shared ChangeFeed poller,
+# limited to the manager's fleet
+@route("/live")
+@login_required
+@manager_required
+def live():
+    return render_template("live.html")
+
+
+@route("/events")
+@login_required
+@manager_required
+def live_events():
+    fleet_id = session.get('fleet_id')
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        return jsonify(error="Last-Event-ID 必须是整数"), 400
 
+    sub = live_feed.subscribe(fleet_id)
+    if sub is None:
+        response = jsonify(error="实时连接数已满，请稍后重试")
+        response.status_code = 503
+        response.headers["Retry-After"] = "30"
+        return response
+    replayed = ()
+    if last_id is not None:
+        # Not the request connection: that one would stay checked out for as
+        # long as the stream is open
+        conn = pool.checkout()
+        try:
+            replayed = live_feed.replay(conn, last_id, fleet_id)
+        except pyodbc.Error:
+            live_feed.unsubscribe(sub)
+            raise
+        finally:
+            pool.release(conn)
+    return Response(
+        stream_with_context(live_feed.stream(sub, replayed)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-@app.route("/views/week_exceptions")
+
+@route("/views/week_exceptions")
+@read_only
 @login_required
 @manager_required
 def week_exceptions():
     fleet_id = session.get('fleet_id')
-    with get_conn() as conn:
-        # Filter view by fleet? The view might not have FleetId.
-        # Let's check if view has FleetId. If not, we might need to join.
-        # Assuming view has VehicleId, we can join Vehicles.
-        rows = conn.execute("""
-            SELECT TOP 100 w.* 
-            FROM dbo.vw_week_exception_alerts w
-            JOIN dbo.Vehicles v ON w.VehicleId = v.VehicleId
-            WHERE v.FleetId = ?
-            ORDER BY w.OccurTime DESC
-        """, (fleet_id,)).fetchall()
-    return render_template("week_exceptions.html", rows=rows)
-
-
-@app.route("/exceptions/process", methods=["GET", "POST"])
+
+    def render():
+        with get_conn() as conn:
+            # Filter view by fleet? The view might not have FleetId.
+            # Let's check if view has FleetId. If not, we might need to join.
+            # Assuming view has VehicleId, we can join Vehicles.
+            rows = conn.execute("""
+                SELECT TOP 100 w.* 
+                FROM dbo.vw_week_exception_alerts w
+                JOIN dbo.Vehicles v ON w.VehicleId = v.VehicleId
+                WHERE v.FleetId = ?
+                ORDER BY w.OccurTime DESC
+            """, (fleet_id,)).fetchall()
+        return render_template("_week_exceptions_table.html", rows=rows)
+
+    # Rendered once per fleet and version of the alerts (same probe as the JSON ETag)
+    version = get_conn().execute(ALERTS_VERSION_SQL).fetchone()
+    return render_template("week_exceptions.html",
+                           table=fragment_cache.get("week_exceptions", (fleet_id,), version, render))
+
+
+# Exception processing: one or many per POST, in a single UPDATE limited to the fleet
+PROCESS_REASONS = {"not_found": "未找到该异常", "bad_status": "{status}"}
+
+
+@route("/exceptions/process", methods=["GET", "POST"])
 @login_required
 @manager_required
 def process_exceptions():
     fleet_id = session.get('fleet_id')
     
     if request.method == "POST":
-        exception_id = request.form.get("exception_id")
+        # A row's own button posts exception_id; the batch button posts the ticked exception_ids
         try:
+            ids = batch_actions.parse_ids(
+                request.form.getlist("exception_id") or request.form.getlist("exception_ids"))
             with get_conn() as conn:
-                conn.execute(
-                    "UPDATE dbo.Exceptions SET Processed = 1, ProcessedTime = SYSDATETIME() WHERE ExceptionId = ?",
-                    (int(exception_id),)
-                )
-                conn.commit()
-                flash("异常已处理，车辆状态将自动恢复", "success")
+                outcomes = batch_actions.process_exceptions(conn, ids, fleet_id)
+            flash(*batch_actions.summarize(outcomes, "已处理 {} 条异常，车辆状态将自动恢复", PROCESS_REASONS))
+        except ValueError as e:
+            flash(str(e), "error")
         except pyodbc.Error as e:
             flash(f"数据库错误：{e}", "error")
         return redirect(url_for("process_exceptions"))
 
-    # GET: fetch unprocessed exceptions for manager's fleet
+    # GET: fetch one page of unprocessed exceptions for manager's fleet
+    page_size, cursor = page_args(request.args)
+    conditions, params = ["e.Processed = 0", "v.FleetId = ?"], [page_size + 1, fleet_id]
+    cursor = _seek(cursor, decode_id_cursor,
+                   time_seek("e", "dbo.Exceptions", "OccurTime", "ExceptionId"), conditions, params)
     with get_conn() as conn:
-        exceptions = conn.execute(
-            """SELECT e.ExceptionId, e.OccurTime, e.ExceptionType, e.Phase, e.FineAmount,
-                      v.PlateNo, v.Status AS VehicleStatus,
-                      d.Name AS DriverName
-               FROM dbo.Exceptions e
-               JOIN dbo.Vehicles v ON v.VehicleId = e.VehicleId
-               LEFT JOIN dbo.Drivers d ON d.DriverId = e.DriverId
-               WHERE e.Processed = 0 AND v.FleetId = ?
-               ORDER BY e.OccurTime DESC""",
-            (fleet_id,)
+        rows = conn.execute(
+            f"""SELECT TOP (?) e.ExceptionId, e.OccurTime, e.ExceptionType, e.Phase, e.FineAmount,
+                       v.PlateNo, v.Status AS VehicleStatus,
+                       d.Name AS DriverName
+                FROM dbo.Exceptions e
+                JOIN dbo.Vehicles v ON v.VehicleId = e.VehicleId
+                LEFT JOIN dbo.Drivers d ON d.DriverId = e.DriverId
+                WHERE {' AND '.join(conditions)}
+                ORDER BY e.OccurTime DESC, e.ExceptionId DESC""",
+            params,
         ).fetchall()
-    return render_template("process_exceptions.html", exceptions=exceptions)
+    page = Page(rows, page_size, lambda r: (r.ExceptionId,), cursor, "process_exceptions")
+    return render_template("process_exceptions.html", exceptions=page.rows, page=page)
 
-@app.route("/reports/driver_performance")
+@route("/reports/driver_performance")
+@read_only
 @login_required
 def driver_performance():
     role = session.get('role')
@@ -318,35 +627,39 @@ def driver_performance():
     end_date = request.args.get("end_date") or date.today().isoformat()
     
     drivers_list = []
-    stats = None
-    exceptions = []
-    
-    with get_conn() as conn:
-        if role == 'Manager':
-            # Manager can select any driver in their fleet
-            drivers_list = conn.execute("SELECT DriverId, Name, EmployeeNo FROM dbo.Drivers WHERE FleetId = ? ORDER BY Name", (fleet_id,)).fetchall()
-            if not target_driver_id and drivers_list:
-                target_driver_id = drivers_list[0].DriverId
-        else:
-            # Driver can only see themselves
-            target_driver_id = related_id
-            
+
+    def report(driver_fleet_id):
+        # Execute Stored Procedure, in one batch after the fleet check: for a
+        # driver of another fleet only the check runs and no result set comes back
+        cursor = get_conn().cursor()
+        cursor.execute(
+            """IF EXISTS (SELECT 1 FROM dbo.Drivers WHERE DriverId = ? AND (? IS NULL OR FleetId = ?))
+               EXEC dbo.sp_driver_performance_report @DriverId=?, @StartDate=?, @EndDate=?""",
+            (target_driver_id, driver_fleet_id, driver_fleet_id, target_driver_id, start_date, end_date))
+        if cursor.description is None:
+            return None
+        summary = cursor.fetchone()
+        return summary, (cursor.fetchall() if cursor.nextset() else [])
+
+    if role == 'Manager':
+        # Manager can select any driver in their fleet
         if target_driver_id:
-            # Verify permission if manager tries to access driver from another fleet
-            if role == 'Manager':
-                check = conn.execute("SELECT 1 FROM dbo.Drivers WHERE DriverId = ? AND FleetId = ?", (target_driver_id, fleet_id)).fetchone()
-                if not check:
-                    flash("无权查看该司机信息", "error")
-                    return redirect(url_for('index'))
-            
-            # Execute Stored Procedure
-            cursor = conn.cursor()
-            cursor.execute("EXEC dbo.sp_driver_performance_report @DriverId=?, @StartDate=?, @EndDate=?", (target_driver_id, start_date, end_date))
-            stats = cursor.fetchone()
-            
-            if cursor.nextset():
-                exceptions = cursor.fetchall()
-                
+            # The report checks the fleet itself, so it can run next to the dropdown query
+            drivers_list, result = page_queries.run(lambda: driver_options(fleet_id), lambda: report(fleet_id))
+        else:
+            drivers_list = driver_options(fleet_id)
+            target_driver_id = drivers_list[0].DriverId if drivers_list else None
+            result = report(fleet_id) if target_driver_id else (None, [])
+        if result is None:
+            # Driver from another fleet (or no such driver)
+            flash("无权查看该司机信息", "error")
+            return redirect(url_for('index'))
+    else:
+        # Driver can only see themselves
+        target_driver_id = related_id
+        result = report(None) if target_driver_id else (None, [])
+    stats, exceptions = result or (None, [])
+
     return render_template("driver_performance.html", 
                            drivers=drivers_list, 
                            selected_driver_id=int(target_driver_id) if target_driver_id else None,
@@ -355,7 +668,302 @@ def driver_performance():
                            stats=stats,
                            exceptions=exceptions)
 
+
+# Every driver of the manager's fleet side by side: one grouped query per
+# period (dbo.sp_fleet_driver_leaderboard), sorted and ranked per request
+@route("/reports/driver_leaderboard")
+@read_only
+@login_required
+@manager_required
+def driver_leaderboard():
+    fleet_id = session.get('fleet_id')
+    start_date = request.args.get("start_date") or (date.today() - timedelta(days=30)).isoformat()
+    end_date = request.args.get("end_date") or date.today().isoformat()
+    sort, order = leaderboard.sort_args(request.args)
+    ranked = []
+    try:
+        start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    except ValueError:
+        flash("日期格式无效", "error")
+    else:
+        if start > end:
+            flash("开始日期不能晚于结束日期", "error")
+        else:
+            rows = leaderboard_cache.get(("leaderboard", fleet_id, start, end),
+                                         lambda: leaderboard.load(get_conn(), fleet_id, start, end))
+            ranked = leaderboard.rank(rows, sort, order)
+    return render_template("driver_leaderboard.html", ranked=ranked, sort=sort, order=order,
+                           sort_keys=leaderboard.SORT_KEYS, start_date=start_date, end_date=end_date)
+
+
+# Import rules mirror the single-row vehicles / assign_order forms
+IMPORT_RULES = dict(vehicle_statuses=("空闲", "运输中", "维修中", "异常"),
+                    require_driver=False, block_departed=False)
+
+
+# Bulk import into the manager's own fleet from an uploaded CSV or JSON file
+@route("/import", methods=["GET", "POST"])
+@login_required
+@manager_required
+def bulk_import():
+    fleet_id = session.get('fleet_id')
+    report = None
+    kind = request.form.get("kind") or request.args.get("kind") or "drivers"
+    if request.method == "POST":
+        upload = request.files.get("file")
+        if not upload or not upload.filename:
+            flash("请选择要导入的文件", "error")
+            return redirect(url_for("bulk_import", kind=kind))
+        try:
+            with get_conn() as conn:
+                report = run_import(conn, kind, read_rows(upload.stream, upload.filename),
+                                    fleet_id=fleet_id, **IMPORT_RULES)
+        except ImportFileError as e:
+            flash(f"文件无法导入：{e}", "error")
+        except pyodbc.Error as e:
+            msg = str(e)
+            if "51000" in msg or "超出最大载重" in msg:
+                flash("超出最大载重：导入失败，已全部回滚", "error")
+            else:
+                flash(f"数据库错误：{e}", "error")
+        else:
+            if kind in ("drivers", "vehicles"):
+                ref_cache.invalidate(kind, fleet_id)
+            if report["failed"]:
+                flash(f"导入完成：{report['failed']} 行未通过校验", "error")
+            else:
+                flash("导入完成", "success")
+    return render_template("import.html", kinds=IMPORT_FIELDS, kind=kind, report=report)
+
+
+# JSON endpoints for wallboards, limited to the user's fleet. Each answers
+# If-None-Match with 304 from a MAX(RowVer) probe, so an unchanged poll costs a
+# few index seeks.
+VEHICLES_VERSION_SQL = f"""
+    SELECT (SELECT MAX(RowVer) FROM dbo.Vehicles), (SELECT COUNT_BIG(*) FROM dbo.Vehicles),
+           (SELECT MAX(RowVer) FROM dbo.Orders), {OPEN_WRITES_SQL}"""
+ORDERS_VERSION_SQL = f"""
+    SELECT (SELECT MAX(RowVer) FROM dbo.Orders), (SELECT MAX(RowVer) FROM dbo.Vehicles),
+           (SELECT MAX(RowVer) FROM dbo.Drivers), {OPEN_WRITES_SQL}"""
+# Rows also age out of the 7-day window, hence the count over the window
+ALERTS_VERSION_SQL = f"""
+    SELECT (SELECT MAX(RowVer) FROM dbo.Exceptions), (SELECT MAX(RowVer) FROM dbo.Vehicles),
+           (SELECT MAX(RowVer) FROM dbo.Drivers),
+           (SELECT COUNT_BIG(*) FROM dbo.Exceptions WHERE OccurTime >= DATEADD(DAY, -7, SYSDATETIME())),
+           {OPEN_WRITES_SQL}"""
+
+
+@route("/api/vehicles")
+@read_only
+@login_required
+@manager_required
+def api_vehicles():
+    fleet_id = session.get('fleet_id')
+    with get_conn() as conn:
+        return conditional_json(
+            conn, VEHICLES_VERSION_SQL, (), ("vehicles", fleet_id),
+            """SELECT v.VehicleId, v.PlateNo, v.FleetId, v.Status, v.MaxWeight, v.MaxVolume,
+                      ISNULL(l.AssignedWeight, 0) AS AssignedWeight, ISNULL(l.AssignedVolume, 0) AS AssignedVolume,
+                      CAST(ISNULL(l.ActiveOrders, 0) AS INT) AS ActiveOrders
+               FROM dbo.Vehicles v
+               LEFT JOIN dbo.VehicleLoad l WITH (NOEXPAND) ON l.VehicleId = v.VehicleId
+               WHERE v.FleetId = ?
+               ORDER BY v.VehicleId""",
+            (fleet_id,),
+        )
+
+
+@route("/api/orders/active")
+@read_only
+@login_required
+@manager_required
+def api_active_orders():
+    fleet_id = session.get('fleet_id')
+    with get_conn() as conn:
+        return conditional_json(
+            conn, ORDERS_VERSION_SQL, (), ("orders", fleet_id),
+            """SELECT o.OrderId, o.VehicleId, v.PlateNo, v.FleetId, o.DriverId, d.Name AS DriverName,
+                      o.Weight, o.Volume, o.Destination, o.OrderDate, o.Status
+               FROM dbo.Orders o
+               JOIN dbo.Vehicles v ON v.VehicleId = o.VehicleId
+               LEFT JOIN dbo.Drivers d ON d.DriverId = o.DriverId
+               WHERE v.FleetId = ? AND o.Status IN (N'新建', N'装货中', N'运输中')
+               ORDER BY o.OrderDate DESC, o.OrderId DESC""",
+            (fleet_id,),
+        )
+
+
+@route("/api/exceptions/alerts")
+@read_only
+@login_required
+@manager_required
+def api_exception_alerts():
+    fleet_id = session.get('fleet_id')
+    with get_conn() as conn:
+        return conditional_json(
+            conn, ALERTS_VERSION_SQL, (), ("alerts", fleet_id),
+            """SELECT ExceptionId, OccurTime, ExceptionType, Phase, FineAmount, Processed,
+                      VehicleId, PlateNo, VehicleStatus, DriverId, DriverName, EmployeeNo,
+                      FleetId, FleetName, CenterId, CenterName
+               FROM dbo.vw_week_exception_alerts
+               WHERE FleetId = ?
+               ORDER BY OccurTime DESC""",
+            (fleet_id,),
+        )
+
+
+# Batch dispatch: pack an uploaded batch of orders onto the fleet's idle vehicles
+DISPATCH_STATUSES = ("空闲",)
+
+
+@route("/orders/dispatch", methods=["GET", "POST"])
+@login_required
+@manager_required
+def dispatch_orders():
+    fleet_id = session.get('fleet_id')
+    result = errors = plan_text = None
+    if request.method == "POST":
+        if request.form.get("plan"):
+            # Confirm a previewed plan: one set-based insert
+            try:
+                with get_conn() as conn:
+                    inserted = dispatch.apply_plan(conn, request.form["plan"], fleet_id, DISPATCH_STATUSES)
+                flash(f"已分配 {inserted} 个运单", "success")
+            except pyodbc.Error as e:
+                msg = str(e)
+                if "51000" in msg or "超出最大载重" in msg:
+                    flash("超出最大载重：车辆载重已变化，请重新预览", "error")
+                elif "51001" in msg:
+                    flash("车辆状态或剩余容积已变化，请重新预览", "error")
+                elif "51002" in msg:
+                    flash("司机不存在或不属于该车队", "error")
+                else:
+                    flash(f"数据库错误：{e}", "error")
+            return redirect(url_for("dispatch_orders"))
+
+        upload = request.files.get("file")
+        if not upload or not upload.filename:
+            flash("请选择运单文件", "error")
+            return redirect(url_for("dispatch_orders"))
+        try:
+            orders, errors = dispatch.parse_orders(
+                read_rows(upload.stream, upload.filename),
+                default_driver_id=request.form.get("driver_id"),
+                require_driver=IMPORT_RULES["require_driver"],
+            )
+        except ImportFileError as e:
+            flash(f"文件无法读取：{e}", "error")
+            return redirect(url_for("dispatch_orders"))
+        with get_conn() as conn:
+            vehicles = dispatch.load_vehicles(conn, fleet_id, DISPATCH_STATUSES)
+        result = dispatch.plan(orders, vehicles)
+        plan_text = dispatch.plan_json(result)
+    return render_template("dispatch.html", drivers=driver_options(fleet_id),
+                           order_fields=dispatch.ORDER_FIELDS, result=result,
+                           errors=errors, plan=plan_text)
+
+
+def create_app(config=None):
+    """Application factory: build the app, its pools, caches and background
+    workers from load_config() and the environment, and register the routes.
+
+    ``config`` overrides single config keys. wsgi.py calls this in every
+    worker process: both pools are warmed up there, so no connection is shared
+    across a fork; the background workers open their connections on first use.
+    """
+    app = Flask(__name__)
+    app.config.update(load_config())
+    app.config.update(config or {})
+    conn_str = app.config["CONN_STR"]
+
+    # Connection pool: one pooled connection is reused for the whole request
+    pool = ConnectionPool(
+        conn_str,
+        min_size=int(os.getenv("DB_POOL_MIN", "1")),
+        max_size=int(os.getenv("DB_POOL_MAX", "10")),
+        timeout=float(os.getenv("DB_POOL_TIMEOUT", "5")),
+        max_lifetime=int(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+    )
+    pool.init_app(app)
+    read_isolation = app.config["READ_ISOLATION"]
+    read_pool = ConnectionPool(
+        app.config["READ_CONN_STR"],
+        min_size=int(os.getenv("DB_READ_POOL_MIN", "0")),
+        max_size=int(os.getenv("DB_READ_POOL_MAX", "10")),
+        timeout=float(os.getenv("DB_POOL_TIMEOUT", "5")),
+        max_lifetime=int(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+        on_connect=lambda conn: conn.execute(f"SET TRANSACTION ISOLATION LEVEL {read_isolation}"),
+        request_key="db_read_conn",
+    )
+    read_pool.init_app(app)
+
+    # Query metrics: request latency and statements per route, per-statement
+    # execute / fetch time and rows, scraped from /metrics
+    query_metrics = QueryMetrics(
+        slow_threshold=float(os.getenv("SLOW_QUERY_SECONDS", "0.5")),
+        max_statements=int(os.getenv("METRICS_MAX_STATEMENTS", "500")),
+    )
+    query_metrics.init_app(app)
+    # The slow-query logger is process-wide: attach the file handler once
+    slow_log = os.getenv("SLOW_QUERY_LOG")
+    slow_logger = logging.getLogger("fleet.slow_query")
+    if slow_log and not any(getattr(h, "baseFilename", None) == os.path.abspath(slow_log)
+                            for h in slow_logger.handlers):
+        slow_handler = logging.FileHandler(slow_log, encoding="utf-8")
+        slow_handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        slow_logger.addHandler(slow_handler)
+
+    # Reference data (fleet / driver / vehicle dropdowns) rarely changes: cache it
+    # in-process per manager fleet and drop the affected lookup from the write handlers.
+    # Only this process's copy is dropped: with several gunicorn workers the others
+    # keep their dropdowns for up to REF_CACHE_TTL seconds (lower it if that matters).
+    ref_cache = TTLCache(ttl=int(os.getenv("REF_CACHE_TTL", "300")))
+
+    # Driver leaderboard rows per (fleet, period): kept briefly so re-sorting the
+    # board or coming back to it does not regroup Orders / Exceptions
+    leaderboard_cache = TTLCache(ttl=int(os.getenv("LEADERBOARD_CACHE_TTL", "60")),
+                                 max_entries=int(os.getenv("LEADERBOARD_CACHE_MAX", "200")))
+
+    # Rendered report / view fragments keyed by fleet and a data-version probe (see
+    # fragment_cache): per process, or in FRAGMENT_CACHE_DIR for every worker
+    fragment_max_bytes = int(float(os.getenv("FRAGMENT_CACHE_MAX_MB", "64")) * 1024 * 1024)
+    fragment_cache = FragmentCache(
+        FileBackend(os.getenv("FRAGMENT_CACHE_DIR"), fragment_max_bytes) if os.getenv("FRAGMENT_CACHE_DIR")
+        else MemoryBackend(fragment_max_bytes),
+        live_ttl=int(os.getenv("FRAGMENT_CACHE_LIVE_TTL", "300")),
+        closed_ttl=int(os.getenv("FRAGMENT_CACHE_CLOSED_TTL", "3600")),
+    )
+
+    # Independent queries of one page (driver report: fleet check + report) run
+    # side by side, each on its own pooled connection; bounded per process
+    page_queries = PageQueries(query_metrics, max_workers=int(os.getenv("PAGE_QUERY_WORKERS", "2")))
+
+    # Live feed: one poller thread on its own connection reads dbo.ChangeFeed and
+    # pushes vehicle status / exception events to every open /events stream
+    live_feed = LiveFeed(
+        lambda: pyodbc.connect(conn_str, autocommit=True),
+        interval=float(os.getenv("LIVE_FEED_INTERVAL", "1")),
+        queue_size=int(os.getenv("LIVE_FEED_QUEUE", "256")),
+        # Each open stream holds a server thread: by default at most half of them
+        max_subscribers=int(os.getenv("LIVE_FEED_MAX_SUBSCRIBERS") or max(int(os.getenv("WEB_THREADS", "8")) // 2, 1)),
+    )
+
+    app.extensions.update(pool=pool, read_pool=read_pool, query_metrics=query_metrics, page_queries=page_queries,
+                          ref_cache=ref_cache, leaderboard_cache=leaderboard_cache, fragment_cache=fragment_cache,
+                          live_feed=live_feed)
+    init_routes(app)
+
+    for p in (pool, read_pool):
+        try:
+            p.fill()
+        except pyodbc.Error as e:
+            app.logger.warning("连接池预热失败：%s", e)
+    return app
+
+
 if __name__ == "__main__":
+    # Development server; production runs serve.py (waitress) or gunicorn
     # Allow changing port via environment variable to avoid conflicts
     port = int(os.getenv("PORT", "5000"))
-    app.run(host="0.0.0.0", port=port, debug=True)
+    app = create_app()
+    app.run(host="0.0.0.0", port=port, debug=os.getenv("FLASK_DEBUG") == "1", threaded=True)
@@ -0,0 +1,69 @@
+"""Multi-select actions: sign off orders / process exceptions in one statement.
+
+The selected ids go to SQL Server as one JSON array. dbo.sp_sign_orders and
+dbo.sp_process_exceptions change every eligible row with a single UPDATE, so
+TR_Orders_AfterUpdate_Status and TR_Exceptions_AfterUpdate_Processed run once
+for the whole batch instead of once per click, and report an outcome for
+every id.
+"""
+import json
+
+MAX_BATCH = 1000
+
+
+def parse_ids(values):
+    """Distinct positive ints from form values; ValueError on anything else."""
+    ids = []
+    for value in values:
+        try:
+            i = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"无效的ID：{value}")
+        if i <= 0:
+            raise ValueError(f"无效的ID：{value}")
+        ids.append(i)
+    ids = sorted(set(ids))
+    if not ids:
+        raise ValueError("请至少选择一条记录")
+    if len(ids) > MAX_BATCH:
+        raise ValueError(f"单次最多处理 {MAX_BATCH} 条")
+    return ids
+
+
+def _run(conn, procedure, ids, fleet_id):
+    cursor = conn.cursor()
+    cursor.execute(f"EXEC {procedure} @Ids = ?, @FleetId = ?", (json.dumps(ids), fleet_id))
+    outcomes = [(row.Id, row.Outcome, row.Status) for row in cursor.fetchall()]
+    conn.commit()
+    return outcomes
+
+
+def sign_orders(conn, ids, fleet_id=None):
+    """Complete the active orders among ``ids`` (dbo.sp_sign_orders).
+
+    Returns (id, outcome, status) per id, outcome being ``ok``, ``not_found``
+    (missing, or outside ``fleet_id`` when given) or ``bad_status``.
+    """
+    return _run(conn, "dbo.sp_sign_orders", ids, fleet_id)
+
+
+def process_exceptions(conn, ids, fleet_id=None):
+    """Mark the unprocessed exceptions among ``ids`` as processed
+    (dbo.sp_process_exceptions).
+
+    Returns (id, outcome, status) per id like :func:`sign_orders`;
+    ``bad_status`` here means already processed.
+    """
+    return _run(conn, "dbo.sp_process_exceptions", ids, fleet_id)
+
+
+def summarize(outcomes, done_text, reasons, show=10):
+    """Flash text and category for a batch: count done, list the failures."""
+    done = sum(1 for _, outcome, _ in outcomes if outcome == "ok")
+    failed = [(i, outcome, status) for i, outcome, status in outcomes if outcome != "ok"]
+    text = done_text.format(done)
+    if failed:
+        details = "；".join(f"#{i} {reasons[outcome].format(status=status)}" for i, outcome, status in failed[:show])
+        more = " …" if len(failed) > show else ""
+        text += f"；{len(failed)} 条未处理：{details}{more}"
+    return text, "success" if done else "error"
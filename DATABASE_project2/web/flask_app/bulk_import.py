@@ -0,0 +1,367 @@
+"""Bulk import of drivers, vehicles and orders from CSV / JSON files.
+
+Rows are streamed into a session temp table with ``fast_executemany``,
+validated in one set-based pass (the same rules the single-row forms and
+TR_Orders_CheckWeight apply), then merged into the target table inside a
+single transaction. Rows that fail validation are reported, not imported.
+
+Command line::
+
+    python bulk_import.py drivers drivers.csv
+    python bulk_import.py orders orders.ndjson --fleet-id 1
+"""
+import csv
+import io
+import json
+import os
+import time
+
+import pyodbc
+
+LICENSE_LEVELS = ("C1", "C2", "B1", "B2", "A1", "A2")
+BATCH_SIZE = 5000
+# Staged values are cut one character past this, so the width checks still
+# report them as too long instead of the insert failing the whole file
+STAGE_WIDTH = 200
+
+# Accepted columns per import kind; the names match the form fields
+FIELDS = {
+    "drivers": ("employee_no", "name", "license_level", "phone", "fleet_id"),
+    "vehicles": ("plate_no", "max_weight", "max_volume", "fleet_id", "status"),
+    "orders": ("vehicle_id", "driver_id", "weight", "volume", "destination"),
+}
+
+# Free-text fields -> (label, target column width); the others are checked
+# against a list, a pattern or a conversion
+WIDTHS = {
+    "drivers": {"employee_no": ("工号", 20), "name": ("姓名", 100), "phone": ("电话", 30)},
+    "vehicles": {},
+    "orders": {"destination": ("目的地", 200)},
+}
+
+
+class ImportFileError(ValueError):
+    """The file itself cannot be imported (unknown kind, bad format...)."""
+
+
+def read_rows(stream, filename):
+    """Yield one dict per record from a binary stream.
+
+    ``.csv`` is read with a header row; ``.ndjson`` / ``.jsonl`` one object
+    per line; ``.json`` must hold a list of objects.
+    """
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        yield from csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+    elif name.endswith((".ndjson", ".jsonl")):
+        for line in io.TextIOWrapper(stream, encoding="utf-8-sig"):
+            if line.strip():
+                yield json.loads(line)
+    elif name.endswith(".json"):
+        data = json.load(io.TextIOWrapper(stream, encoding="utf-8-sig"))
+        if not isinstance(data, list):
+            raise ImportFileError("JSON 文件内容必须是对象数组")
+        yield from data
+    else:
+        raise ImportFileError("仅支持 .csv / .json / .ndjson 文件")
+
+
+def _clean(value, max_chars):
+    if value is None:
+        return None
+    value = str(value).strip()[:max_chars]
+    return value or None
+
+
+def _stage(cursor, kind, rows, fleet_id):
+    fields = FIELDS[kind]
+    cursor.execute("IF OBJECT_ID('tempdb..#ImportStage') IS NOT NULL DROP TABLE #ImportStage")
+    cursor.execute(
+        "CREATE TABLE #ImportStage (RowNo INT PRIMARY KEY, "
+        + ", ".join(f"{f} NVARCHAR({2 * (STAGE_WIDTH + 1)}) NULL" for f in fields)
+        + ", Error NVARCHAR(1000) NULL, Action NVARCHAR(10) NULL)"
+    )
+    insert_sql = (
+        f"INSERT INTO #ImportStage (RowNo, {', '.join(fields)}) "
+        f"VALUES ({', '.join('?' * (len(fields) + 1))})"
+    )
+    cursor.fast_executemany = True
+    total, batch = 0, []
+    try:
+        for row_no, record in enumerate(rows, start=1):
+            if not isinstance(record, dict):
+                raise ImportFileError(f"第 {row_no} 行不是对象")
+            values = [_clean(record.get(f), STAGE_WIDTH + 1) for f in fields]
+            if fleet_id is not None and "fleet_id" in fields:
+                # Fleet-scoped import: every row goes to the caller's fleet
+                values[fields.index("fleet_id")] = str(fleet_id)
+            batch.append([row_no] + values)
+            if len(batch) >= BATCH_SIZE:
+                cursor.executemany(insert_sql, batch)
+                total += len(batch)
+                batch = []
+    except (csv.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ImportFileError(str(e))
+    if batch:
+        cursor.executemany(insert_sql, batch)
+        total += len(batch)
+    cursor.fast_executemany = False
+    return total
+
+
+def _set_errors(cursor, checks_sql, params=()):
+    """Append the messages produced by ``checks_sql`` (a SELECT of RowNo, Msg)."""
+    cursor.execute(
+        f"""
+        ;WITH Failed AS ({checks_sql})
+        UPDATE s
+        SET Error = CONCAT(s.Error + N'；', f.Msg)
+        FROM #ImportStage s
+        JOIN (
+            SELECT RowNo, STRING_AGG(Msg, N'；') AS Msg
+            FROM Failed WHERE Msg IS NOT NULL
+            GROUP BY RowNo
+        ) f ON f.RowNo = s.RowNo
+        """,
+        params,
+    )
+
+
+def _check_widths(cursor, kind):
+    """Flag values longer than their target column (in UTF-16 units, as NVARCHAR counts)."""
+    checks = [f"SELECT RowNo, N'{label}过长（最多 {width} 个字符）' AS Msg FROM #ImportStage "
+              f"WHERE DATALENGTH({field}) / 2 > {width}"
+              for field, (label, width) in WIDTHS[kind].items()]
+    if checks:
+        _set_errors(cursor, " UNION ALL ".join(checks))
+
+
+def _import_drivers(cursor, fleet_id):
+    levels = ", ".join(f"N'{lvl}'" for lvl in LICENSE_LEVELS)
+    _set_errors(cursor, f"""
+        SELECT s.RowNo, x.Msg
+        FROM #ImportStage s
+        LEFT JOIN dbo.Fleets f ON f.FleetId = TRY_CONVERT(INT, s.fleet_id)
+        LEFT JOIN dbo.Drivers d ON d.EmployeeNo = s.employee_no
+        CROSS APPLY (VALUES
+            (CASE WHEN s.employee_no IS NULL OR s.name IS NULL OR s.license_level IS NULL OR s.fleet_id IS NULL
+                  THEN N'必填项不能为空' END),
+            (CASE WHEN s.license_level COLLATE Latin1_General_BIN NOT IN ({levels})
+                  THEN N'驾照等级不合法（允许：C1/C2/B1/B2/A1/A2）' END),
+            (CASE WHEN s.fleet_id IS NOT NULL AND f.FleetId IS NULL THEN N'车队不存在' END),
+            (CASE WHEN ? IS NOT NULL AND d.FleetId <> ? THEN N'工号已属于其他车队' END)
+        ) x(Msg)
+        UNION ALL
+        SELECT RowNo, N'文件内工号重复' FROM (
+            SELECT RowNo, ROW_NUMBER() OVER (PARTITION BY employee_no ORDER BY RowNo) AS n
+            FROM #ImportStage WHERE employee_no IS NOT NULL
+        ) dup WHERE n > 1
+    """, (fleet_id, fleet_id))
+    cursor.execute("""
+        CREATE TABLE #ImportResult (RowNo INT, Action NVARCHAR(10));
+        MERGE dbo.Drivers AS t
+        USING (
+            SELECT RowNo, employee_no, name, license_level, phone, TRY_CONVERT(INT, fleet_id) AS fleet_id
+            FROM #ImportStage WHERE Error IS NULL
+        ) AS s
+        ON t.EmployeeNo = s.employee_no
+        WHEN MATCHED THEN
+            UPDATE SET Name = s.name, LicenseLevel = s.license_level, Phone = s.phone, FleetId = s.fleet_id
+        WHEN NOT MATCHED THEN
+            INSERT (EmployeeNo, Name, LicenseLevel, Phone, FleetId)
+            VALUES (s.employee_no, s.name, s.license_level, s.phone, s.fleet_id)
+        OUTPUT s.RowNo, $action INTO #ImportResult (RowNo, Action);
+    """)
+    _apply_results(cursor)
+
+
+def _import_vehicles(cursor, fleet_id, statuses):
+    allowed = ", ".join(f"N'{s}'" for s in statuses)
+    _set_errors(cursor, f"""
+        SELECT s.RowNo, x.Msg
+        FROM #ImportStage s
+        LEFT JOIN dbo.Fleets f ON f.FleetId = TRY_CONVERT(INT, s.fleet_id)
+        LEFT JOIN dbo.Vehicles v ON v.PlateNo = s.plate_no
+        CROSS APPLY (VALUES
+            (CASE WHEN s.plate_no IS NULL OR s.max_weight IS NULL OR s.max_volume IS NULL OR s.fleet_id IS NULL
+                  THEN N'必填项不能为空' END),
+            (CASE WHEN UPPER(s.plate_no) COLLATE Latin1_General_BIN
+                       NOT LIKE N'[A-Z][A-Z0-9][A-Z0-9][A-Z0-9][A-Z0-9][A-Z0-9]'
+                  THEN N'车牌格式不合法（示例：A12345）' END),
+            (CASE WHEN s.max_weight IS NOT NULL AND TRY_CONVERT(DECIMAL(12,2), s.max_weight) IS NULL
+                  THEN N'载重上限格式无效' END),
+            (CASE WHEN s.max_volume IS NOT NULL AND TRY_CONVERT(DECIMAL(12,2), s.max_volume) IS NULL
+                  THEN N'容积上限格式无效' END),
+            (CASE WHEN ISNULL(s.status, N'空闲') NOT IN ({allowed}) THEN N'车辆状态不合法' END),
+            (CASE WHEN s.fleet_id IS NOT NULL AND f.FleetId IS NULL THEN N'车队不存在' END),
+            (CASE WHEN ? IS NOT NULL AND v.FleetId <> ? THEN N'车牌已属于其他车队' END)
+        ) x(Msg)
+        UNION ALL
+        SELECT RowNo, N'文件内车牌重复' FROM (
+            SELECT RowNo, ROW_NUMBER() OVER (PARTITION BY plate_no ORDER BY RowNo) AS n
+            FROM #ImportStage WHERE plate_no IS NOT NULL
+        ) dup WHERE n > 1
+    """, (fleet_id, fleet_id))
+    cursor.execute("""
+        CREATE TABLE #ImportResult (RowNo INT, Action NVARCHAR(10));
+        MERGE dbo.Vehicles AS t
+        USING (
+            SELECT RowNo, plate_no, TRY_CONVERT(DECIMAL(12,2), max_weight) AS max_weight,
+                   TRY_CONVERT(DECIMAL(12,2), max_volume) AS max_volume, TRY_CONVERT(INT, fleet_id) AS fleet_id,
+                   ISNULL(status, N'空闲') AS status
+            FROM #ImportStage WHERE Error IS NULL
+        ) AS s
+        ON t.PlateNo = s.plate_no
+        WHEN MATCHED THEN
+            UPDATE SET MaxWeight = s.max_weight, MaxVolume = s.max_volume, FleetId = s.fleet_id
+        WHEN NOT MATCHED THEN
+            INSERT (FleetId, PlateNo, MaxWeight, MaxVolume, Status)
+            VALUES (s.fleet_id, s.plate_no, s.max_weight, s.max_volume, s.status)
+        OUTPUT s.RowNo, $action INTO #ImportResult (RowNo, Action);
+    """)
+    _apply_results(cursor)
+
+
+def _import_orders(cursor, fleet_id, require_driver, block_departed):
+    _set_errors(cursor, """
+        SELECT s.RowNo, x.Msg
+        FROM #ImportStage s
+        LEFT JOIN dbo.Vehicles v ON v.VehicleId = TRY_CONVERT(INT, s.vehicle_id)
+        LEFT JOIN dbo.Drivers d ON d.DriverId = TRY_CONVERT(INT, s.driver_id)
+        CROSS APPLY (VALUES
+            (CASE WHEN s.vehicle_id IS NULL OR s.weight IS NULL OR s.volume IS NULL OR s.destination IS NULL
+                  THEN N'必填项不能为空' END),
+            (CASE WHEN ? = 1 AND s.driver_id IS NULL THEN N'必须选择司机' END),
+            (CASE WHEN s.weight IS NOT NULL AND TRY_CONVERT(DECIMAL(12,2), s.weight) IS NULL THEN N'重量格式无效' END),
+            (CASE WHEN s.volume IS NOT NULL AND TRY_CONVERT(DECIMAL(12,2), s.volume) IS NULL THEN N'体积格式无效' END),
+            (CASE WHEN TRY_CONVERT(DECIMAL(12,2), s.weight) <= 0 OR TRY_CONVERT(DECIMAL(12,2), s.volume) <= 0
+                  THEN N'重量和体积必须大于 0' END),
+            (CASE WHEN s.vehicle_id IS NOT NULL AND (v.VehicleId IS NULL OR v.FleetId <> ISNULL(?, v.FleetId))
+                  THEN N'车辆不存在' END),
+            (CASE WHEN s.driver_id IS NOT NULL AND (d.DriverId IS NULL OR d.FleetId <> ISNULL(?, d.FleetId))
+                  THEN N'司机不存在' END),
+            (CASE WHEN ? = 1 AND v.Status = N'运输中' THEN N'车辆已发车，无法再添加运单' END)
+        ) x(Msg)
+    """, (int(require_driver), fleet_id, fleet_id, int(block_departed)))
+    _check_capacity(cursor)
+    # One statement: TR_Orders_CheckWeight fires once for the whole batch
+    cursor.execute("""
+        INSERT INTO dbo.Orders (VehicleId, DriverId, Weight, Volume, Destination, Status)
+        SELECT TRY_CONVERT(INT, vehicle_id), TRY_CONVERT(INT, driver_id), TRY_CONVERT(DECIMAL(12,2), weight),
+               TRY_CONVERT(DECIMAL(12,2), volume), destination, N'新建'
+        FROM #ImportStage
+        WHERE Error IS NULL
+        ORDER BY RowNo;
+        UPDATE #ImportStage SET Action = N'INSERT' WHERE Error IS NULL;
+    """)
+
+
+def _check_capacity(cursor):
+    """Capacity rule of TR_Orders_CheckWeight, applied in file order per vehicle.
+
+    Only accepted rows add to a vehicle's load, so a rejected row does not
+    push the rows after it over the limit (capacity 10 with rows of 8, 5, 1:
+    only the 5 is rejected). That is a sequential pass, done here over the
+    staged rows rather than as a windowed SUM.
+    """
+    loads, rejected = {}, []
+    for r in cursor.execute("""
+        SELECT s.RowNo, v.VehicleId, v.MaxWeight, ISNULL(l.AssignedWeight, 0) AS AssignedWeight,
+               TRY_CONVERT(DECIMAL(12,2), s.weight) AS Weight
+        FROM #ImportStage s
+        JOIN dbo.Vehicles v ON v.VehicleId = TRY_CONVERT(INT, s.vehicle_id)
+        LEFT JOIN dbo.VehicleLoad l WITH (NOEXPAND) ON l.VehicleId = v.VehicleId
+        WHERE s.Error IS NULL
+        ORDER BY s.RowNo
+    """):
+        load = loads.get(r.VehicleId, r.AssignedWeight) + r.Weight
+        if load > r.MaxWeight:
+            rejected.append((r.RowNo,))
+        else:
+            loads[r.VehicleId] = load
+    if rejected:
+        cursor.fast_executemany = True
+        cursor.executemany("UPDATE #ImportStage SET Error = N'超出最大载重' WHERE RowNo = ?", rejected)
+        cursor.fast_executemany = False
+
+
+def _apply_results(cursor):
+    cursor.execute("""
+        UPDATE s SET Action = r.Action
+        FROM #ImportStage s JOIN #ImportResult r ON r.RowNo = s.RowNo;
+        DROP TABLE #ImportResult;
+    """)
+
+
+def run_import(conn, kind, rows, fleet_id=None, vehicle_statuses=("空闲",),
+               require_driver=True, block_departed=True):
+    """Stage, validate and merge ``rows``; commit once and return a report.
+
+    ``fleet_id`` scopes the import to one fleet (DATABASE_project2 managers).
+    The remaining flags mirror the per-app form rules.
+    """
+    if kind not in FIELDS:
+        raise ImportFileError(f"不支持的导入类型：{kind}")
+    started = time.perf_counter()
+    cursor = conn.cursor()
+    try:
+        total = _stage(cursor, kind, rows, fleet_id)
+        _check_widths(cursor, kind)
+        if kind == "drivers":
+            _import_drivers(cursor, fleet_id)
+        elif kind == "vehicles":
+            _import_vehicles(cursor, fleet_id, vehicle_statuses)
+        else:
+            _import_orders(cursor, fleet_id, require_driver, block_departed)
+        counts = {r[0]: r[1] for r in cursor.execute(
+            "SELECT ISNULL(Action, N'ERROR'), COUNT(*) FROM #ImportStage GROUP BY ISNULL(Action, N'ERROR')"
+        ).fetchall()}
+        errors = [(r.RowNo, r.Error) for r in cursor.execute(
+            "SELECT RowNo, Error FROM #ImportStage WHERE Error IS NOT NULL ORDER BY RowNo"
+        ).fetchall()]
+        cursor.execute("DROP TABLE #ImportStage")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        try:
+            cursor.execute("IF OBJECT_ID('tempdb..#ImportStage') IS NOT NULL DROP TABLE #ImportStage")
+            cursor.execute("IF OBJECT_ID('tempdb..#ImportResult') IS NOT NULL DROP TABLE #ImportResult")
+        except pyodbc.Error:
+            pass
+        raise
+    elapsed = time.perf_counter() - started
+    return {
+        "kind": kind,
+        "total": total,
+        "inserted": counts.get("INSERT", 0),
+        "updated": counts.get("UPDATE", 0),
+        "failed": counts.get("ERROR", 0),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": int(total / elapsed) if elapsed > 0 else total,
+    }
+
+
+def main(argv=None):
+    import argparse
+    from app import IMPORT_RULES, load_config
+
+    parser = argparse.ArgumentParser(description="批量导入司机 / 车辆 / 运单")
+    parser.add_argument("kind", choices=sorted(FIELDS))
+    parser.add_argument("path")
+    parser.add_argument("--fleet-id", type=int, default=None, help="只导入到指定车队")
+    args = parser.parse_args(argv)
+
+    conn = pyodbc.connect(load_config()["CONN_STR"])
+    try:
+        with open(args.path, "rb") as f:
+            report = run_import(conn, args.kind, read_rows(f, os.path.basename(args.path)),
+                                fleet_id=args.fleet_id, **IMPORT_RULES)
+    finally:
+        conn.close()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,89 @@
+import threading
+import time
+
+
+class TTLCache:
+    """In-process cache for small reference lookups (dropdowns etc.).
+
+    Keys are tuples whose first element names the lookup, e.g. ``("fleets",)``
+    or ``("drivers", fleet_id)``. Entries expire after ``ttl`` seconds and can
+    be dropped explicitly with :meth:`invalidate` after a write. With
+    ``max_entries`` set, storing past the limit first drops expired entries,
+    then those closest to expiry.
+
+    A loader runs outside the lock; if the key is invalidated meanwhile, its
+    value (possibly read before the write) is returned but not stored.
+    """
+
+    def __init__(self, ttl=300, max_entries=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._data = {}  # key -> (expires_at, value)
+        self._generations = {}  # invalidated prefix -> times invalidated
+        self._cleared = 0
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def get(self, key, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry and entry[0] > now:
+                self._hits += 1
+                return entry[1]
+            self._misses += 1
+            generation = self._generation(key)
+        value = loader()
+        with self._lock:
+            if self._generation(key) != generation:
+                return value
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            if self.max_entries is not None and len(self._data) > self.max_entries:
+                self._evict()
+        return value
+
+    def _generation(self, key):
+        # Grows whenever key or one of its prefixes is invalidated
+        return self._cleared + sum(self._generations.get(key[:n], 0) for n in range(1, len(key) + 1))
+
+    def _evict(self):
+        now = time.monotonic()
+        for k in [k for k, (expires_at, _) in self._data.items() if expires_at <= now]:
+            del self._data[k]
+        excess = len(self._data) - self.max_entries
+        if excess > 0:
+            for k in sorted(self._data, key=lambda k: self._data[k][0])[:excess]:
+                del self._data[k]
+
+    def invalidate(self, name, *scope):
+        """Drop every entry of lookup ``name``; with ``scope`` only the entries
+        whose key continues with those values."""
+        prefix = (name,) + scope
+        with self._lock:
+            self._generations[prefix] = self._generations.get(prefix, 0) + 1
+            stale = [k for k in self._data if k[:len(prefix)] == prefix]
+            for k in stale:
+                del self._data[k]
+            self._invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._cleared += 1
+            self._invalidations += len(self._data)
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "ttl_seconds": self.ttl,
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self._invalidations,
+                "round_trips_saved": self._hits,
+            }
@@ -0,0 +1,221 @@
+import threading
+import time
+from collections import deque
+
+import pyodbc
+from flask import g
+
+
+class PoolExhausted(Exception):
+    """Raised when no connection could be checked out within the timeout."""
+
+
+class ConnectionPool:
+    """A small thread-safe pool of pyodbc connections.
+
+    Connections are validated with a ping on checkout and recycled once they
+    are older than ``max_lifetime`` seconds. Inside a Flask request the same
+    connection is reused through ``g`` and returned by the teardown handler.
+
+    ``on_connect`` runs once on every new connection (session settings such
+    as the isolation level); ``request_key`` names the ``g`` slot, so two
+    pools can serve the same request.
+    """
+
+    def __init__(self, conn_str, min_size=1, max_size=10, timeout=5.0,
+                 max_lifetime=1800, ping_sql="SELECT 1", on_connect=None, request_key="db_conn"):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("invalid pool size")
+        self.conn_str = conn_str
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.ping_sql = ping_sql
+        self.on_connect = on_connect
+        self.request_key = request_key
+
+        self._cond = threading.Condition()
+        self._idle = deque()   # (conn, created_at), most recently used on the right
+        self._born = {}        # id(conn) -> created_at for checked-out connections
+        self._size = 0         # open connections, idle + checked out
+
+        self._checkouts = 0
+        self._created = 0
+        self._recycled = 0
+        self._ping_failures = 0
+        self._exhausted = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    # -- raw pool API -----------------------------------------------------
+
+    def fill(self):
+        """Open connections until ``min_size`` is reached."""
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def checkout(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        conn = created_at = None
+        waited = False
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, created_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                if not waited:
+                    waited = True
+                    self._exhausted += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolExhausted(f"no connection available within {self.timeout}s")
+                self._cond.wait(remaining)
+
+        try:
+            if conn is not None and not self._usable(conn, created_at):
+                conn = None
+            if conn is None:
+                conn = self._connect()
+                created_at = time.monotonic()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        wait = time.monotonic() - start
+        with self._cond:
+            self._born[id(conn)] = created_at
+            self._checkouts += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+        return conn
+
+    def release(self, conn, discard=False):
+        with self._cond:
+            created_at = self._born.pop(id(conn), None)
+        if created_at is None:
+            return
+        if not discard:
+            try:
+                conn.rollback()
+            except pyodbc.Error:
+                discard = True
+        if not discard and self._expired(created_at):
+            discard = True
+            with self._cond:
+                self._recycled += 1
+        if discard:
+            self._close(conn)
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append((conn, created_at))
+            self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close(conn)
+
+    def stats(self):
+        with self._cond:
+            checkouts = self._checkouts
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": len(self._born),
+                "checkouts": checkouts,
+                "connections_created": self._created,
+                "connections_recycled": self._recycled,
+                "ping_failures": self._ping_failures,
+                "exhausted": self._exhausted,
+                "timeouts": self._timeouts,
+                "wait_seconds_total": round(self._wait_total, 6),
+                "wait_seconds_avg": round(self._wait_total / checkouts, 6) if checkouts else 0.0,
+                "wait_seconds_max": round(self._wait_max, 6),
+            }
+
+    # -- Flask integration ------------------------------------------------
+
+    def init_app(self, app):
+        app.teardown_appcontext(self._teardown)
+
+    def request_conn(self):
+        """Connection bound to the current request, checked out on first use."""
+        conn = g.get(self.request_key)
+        if conn is None:
+            conn = self.checkout()
+            setattr(g, self.request_key, conn)
+        return conn
+
+    def _teardown(self, exc):
+        conn = g.pop(self.request_key, None)
+        if conn is not None:
+            self.release(conn)
+
+    # -- internals --------------------------------------------------------
+
+    def _connect(self):
+        conn = pyodbc.connect(self.conn_str)
+        if self.on_connect is not None:
+            try:
+                self.on_connect(conn)
+            except Exception:
+                self._close(conn)
+                raise
+        with self._cond:
+            self._created += 1
+        return conn
+
+    def _expired(self, created_at):
+        return self.max_lifetime and time.monotonic() - created_at >= self.max_lifetime
+
+    def _usable(self, conn, created_at):
+        if self._expired(created_at):
+            with self._cond:
+                self._recycled += 1
+            self._close(conn)
+            return False
+        try:
+            conn.execute(self.ping_sql).fetchone()
+            return True
+        except pyodbc.Error:
+            with self._cond:
+                self._ping_failures += 1
+            self._close(conn)
+            return False
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except pyodbc.Error:
+            pass
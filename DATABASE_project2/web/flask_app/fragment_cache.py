@@ -0,0 +1,221 @@
+"""Rendered fragment cache for report and view pages.
+
+A fragment is the HTML a page renders from its query results (a report's
+figures, an alert table). It is cached under its name, its scope (fleet,
+period, ...) and a data-version stamp: the MAX(RowVer) probe row of the
+tables it reads, as for the JSON ETags. A write moves the version, so the
+next request renders afresh under a new key and the old entry just ages out;
+no write handler has to invalidate anything. A fragment over a closed period
+is versioned the same way (a late sign-off still changes it), but its version
+rarely moves, so it is kept for a longer TTL.
+
+Only the fragment is shared: the page around it (navigation, flashed
+messages, session) is still rendered per request. Backends:
+
+* ``MemoryBackend``: an LRU in this process, bounded by the stored bytes.
+* ``FileBackend``: one file per entry in a directory every worker process
+  reads; on a tmpfs path such as /dev/shm it is shared memory in effect.
+"""
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import suppress
+
+from markupsafe import Markup
+
+from etag import data_etag
+
+
+class MemoryBackend:
+    """LRU of this process; storing past ``max_bytes`` drops the least recently used."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # key -> (expires_at, value), least recently used first
+        self._bytes = 0
+        self._evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                self._drop(key)
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._data)))
+                self._evictions += 1
+
+    def _drop(self, key):
+        self._bytes -= len(self._data.pop(key)[1])
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "memory", "entries": len(self._data), "bytes": self._bytes,
+                    "max_bytes": self.max_bytes, "evictions": self._evictions}
+
+
+class FileBackend:
+    """One file per entry under ``directory``, shared by every worker process.
+
+    A file holds its expiry (wall-clock time, comparable across processes)
+    and the value. Writes go to a temp file renamed into place, so a reader
+    never sees half an entry. A hit touches the file; storing past
+    ``max_bytes`` removes expired files, then the least recently touched.
+    """
+
+    _HEADER = struct.Struct("<d")
+    _SUFFIX = ".frag"
+
+    def __init__(self, directory, max_bytes):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._evictions = 0  # this process only
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self._SUFFIX)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        (expires_at,) = self._HEADER.unpack_from(data)
+        if expires_at <= time.time():
+            with suppress(OSError):
+                os.remove(path)
+            return None
+        with suppress(OSError):
+            os.utime(path)
+        return data[self._HEADER.size:]
+
+    def set(self, key, value, ttl):
+        if len(value) > self.max_bytes:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self._HEADER.pack(time.time() + ttl))
+                f.write(value)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            with suppress(OSError):
+                os.remove(tmp)
+            raise
+        self._trim()
+
+    def _entries(self):
+        entries = []
+        for e in os.scandir(self.directory):
+            if e.name.endswith(self._SUFFIX):
+                with suppress(FileNotFoundError):  # removed by another process meanwhile
+                    st = e.stat()
+                    entries.append((st.st_mtime, st.st_size, e.path))
+        return entries
+
+    def _trim(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+        now = time.time()
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            with suppress(OSError):
+                with open(path, "rb") as f:
+                    expired = self._HEADER.unpack(f.read(self._HEADER.size))[0] <= now
+                os.remove(path)
+                total -= size
+                if not expired:
+                    self._evictions += 1
+
+    def clear(self):
+        for _, _, path in self._entries():
+            with suppress(OSError):
+                os.remove(path)
+
+    def stats(self):
+        entries = self._entries()
+        return {"backend": "file", "directory": self.directory, "entries": len(entries),
+                "bytes": sum(size for _, size, _ in entries), "max_bytes": self.max_bytes,
+                "evictions": self._evictions}
+
+
+class FragmentCache:
+    """Rendered fragments keyed by name, scope and data version, on ``backend``.
+
+    Entries live ``live_ttl`` seconds (a fresh version gets a fresh key
+    anyway; the TTL only clears out the superseded ones), those of a closed
+    period ``closed_ttl`` seconds. Hits and misses are counted per fragment name
+    in this process.
+    """
+
+    def __init__(self, backend, live_ttl=300, closed_ttl=3600):
+        self.backend = backend
+        self.live_ttl = live_ttl
+        self.closed_ttl = closed_ttl
+        self._lock = threading.Lock()
+        self._counts = {}  # name -> [hits, misses]
+
+    def get(self, name, scope, version, render, closed=False):
+        """Fragment ``name`` for ``scope`` at data ``version`` (a probe row),
+        from the cache or from ``render()``, which returns the HTML.
+
+        ``closed`` marks a period that is over: stored for ``closed_ttl``.
+        """
+        key = f"{name}-{data_etag(version, *scope)}"
+        value = self.backend.get(key)
+        with self._lock:
+            self._counts.setdefault(name, [0, 0])[value is None] += 1
+        if value is not None:
+            return Markup(value.decode())
+        html = render()
+        self.backend.set(key, html.encode(), self.closed_ttl if closed else self.live_ttl)
+        return Markup(html)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            counts = {name: tuple(c) for name, c in self._counts.items()}
+        fragments = {}
+        for name, (hits, misses) in counts.items():
+            fragments[name] = {"hits": hits, "misses": misses,
+                               "hit_rate": round(hits / (hits + misses), 4)}
+        hits = sum(c[0] for c in counts.values())
+        lookups = hits + sum(c[1] for c in counts.values())
+        return {
+            **self.backend.stats(),
+            "live_ttl_seconds": self.live_ttl,
+            "closed_ttl_seconds": self.closed_ttl,
+            "hits": hits,
+            "misses": lookups - hits,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "fragments": fragments,
+        }
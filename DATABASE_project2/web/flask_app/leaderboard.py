@@ -0,0 +1,55 @@
+"""Fleet driver leaderboard: every driver of a fleet over a period in one call.
+
+dbo.sp_fleet_driver_leaderboard groups Orders and Exceptions per driver once,
+instead of one sp_driver_performance_report round trip per driver. Sorting
+and ranking happen here, so the cached rows serve every sort order.
+"""
+
+# sort key -> (column, header, higher is better)
+SORT_KEYS = {
+    "completed": ("CompletedOrders", "已完成", True),
+    "orders": ("TotalOrders", "总运单", True),
+    "completion_rate": ("CompletionRate", "完成率", True),
+    "weight": ("TotalWeight", "总重量", True),
+    "volume": ("TotalVolume", "总体积", True),
+    "exceptions": ("TotalExceptions", "异常数", False),
+    "fines": ("TotalFineAmount", "罚款", False),
+}
+DEFAULT_SORT = "completed"
+
+
+def load(conn, fleet_id, start, end):
+    """One row per driver of ``fleet_id`` for ``start`` .. ``end`` (inclusive dates)."""
+    cursor = conn.cursor()
+    cursor.execute("EXEC dbo.sp_fleet_driver_leaderboard @FleetId=?, @StartDate=?, @EndDate=?",
+                   (fleet_id, start, end))
+    return cursor.fetchall()
+
+
+def sort_args(args):
+    """``sort`` / ``order`` query arguments, falling back to the defaults."""
+    sort = args.get("sort")
+    if sort not in SORT_KEYS:
+        sort = DEFAULT_SORT
+    order = args.get("order")
+    if order not in ("asc", "desc"):
+        order = "desc" if SORT_KEYS[sort][2] else "asc"
+    return sort, order
+
+
+def rank(rows, sort, order):
+    """(rank, row) pairs in ``order`` of ``sort``'s column.
+
+    Ties share a rank (1, 2, 2, 4) and keep DriverId order; rows without a
+    value (completion rate of a driver with no orders) come last, unranked.
+    """
+    column = SORT_KEYS[sort][0]
+    valued = sorted((r for r in rows if getattr(r, column) is not None), key=lambda r: r.DriverId)
+    valued.sort(key=lambda r: getattr(r, column), reverse=order == "desc")
+    ranked, previous, position = [], None, 0
+    for i, row in enumerate(valued, 1):
+        value = getattr(row, column)
+        if i == 1 or value != previous:
+            position, previous = i, value
+        ranked.append((position, row))
+    return ranked + [(None, r) for r in rows if getattr(r, column) is None]
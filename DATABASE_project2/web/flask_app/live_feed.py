@@ -0,0 +1,235 @@
+"""Live feed: one shared poller over dbo.ChangeFeed, fanned out over SSE.
+
+The TR_*_ChangeFeed triggers append a row for every vehicle status change and
+every exception raised or processed. A single background thread reads new
+rows once a second and copies each event into the bounded queue of every
+connected client whose fleet matches, so the database sees one poller however
+many dispatch screens are open.
+
+A client that falls behind (its queue fills up) is disconnected; the browser's
+EventSource reconnects with ``Last-Event-ID`` and the missed events are
+replayed from the table. An open stream holds a server thread, so the number
+of subscribers per process can be capped; past the cap ``subscribe`` refuses.
+"""
+import json
+import queue
+import threading
+import time
+
+import pyodbc
+
+FEED_COLUMNS = """f.FeedId, f.Kind, f.FleetId, f.VehicleId, v.PlateNo, f.ExceptionId,
+               f.OldValue, f.NewValue, f.ChangedAt"""
+
+# READCOMMITTEDLOCK: FeedId is assigned at insert but rows commit in any order.
+# A locking read waits on an uncommitted lower id instead of skipping past it
+# (which a snapshot read would do, losing that event for good).
+POLL_SQL = f"""
+    SELECT TOP (?) {FEED_COLUMNS}
+    FROM dbo.ChangeFeed f WITH (READCOMMITTEDLOCK)
+    JOIN dbo.Vehicles v ON v.VehicleId = f.VehicleId
+    WHERE f.FeedId > ?
+    ORDER BY f.FeedId"""
+
+REPLAY_SQL = f"""
+    SELECT TOP (?) {FEED_COLUMNS}
+    FROM dbo.ChangeFeed f WITH (READCOMMITTEDLOCK)
+    JOIN dbo.Vehicles v ON v.VehicleId = f.VehicleId
+    WHERE f.FeedId > ? AND (? IS NULL OR f.FleetId = ?)
+    ORDER BY f.FeedId"""
+
+
+def _event(row):
+    return {
+        "id": row.FeedId,
+        "kind": row.Kind,
+        "fleet_id": row.FleetId,
+        "vehicle_id": row.VehicleId,
+        "plate_no": row.PlateNo,
+        "exception_id": row.ExceptionId,
+        "old": row.OldValue,
+        "new": row.NewValue,
+        "changed_at": row.ChangedAt.isoformat(sep=" ", timespec="seconds"),
+    }
+
+
+def sse_message(event):
+    data = json.dumps(event, ensure_ascii=False)
+    return f"id: {event['id']}\nevent: {event['kind']}\ndata: {data}\n\n"
+
+
+class Subscriber:
+    def __init__(self, fleet_id, maxsize):
+        self.fleet_id = fleet_id
+        self.queue = queue.Queue(maxsize=maxsize)
+
+
+class LiveFeed:
+    """Single ChangeFeed poller with per-client queues.
+
+    ``connect`` opens the poller's own connection (autocommit, kept for the
+    life of the thread). The thread starts with the first subscriber and then
+    keeps polling, so there is no gap between what a new client replays from
+    the table and what it receives live.
+    """
+
+    def __init__(self, connect, interval=1.0, batch_size=500, queue_size=256,
+                 replay_limit=1000, heartbeat=15.0, purge_every=3600, keep_hours=24,
+                 max_subscribers=None):
+        self.connect = connect
+        self.interval = interval
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.replay_limit = replay_limit
+        self.heartbeat = heartbeat
+        self.purge_every = purge_every
+        self.keep_hours = keep_hours
+        self.max_subscribers = max_subscribers
+
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._thread = None
+        self._last_id = None
+
+        self._polls = 0
+        self._events = 0
+        self._delivered = 0
+        self._dropped = 0
+        self._refused = 0
+        self._errors = 0
+
+    # -- subscriptions ----------------------------------------------------
+
+    def subscribe(self, fleet_id=None):
+        """A new client queue, or None when ``max_subscribers`` are already connected."""
+        sub = Subscriber(fleet_id, self.queue_size)
+        with self._lock:
+            if self.max_subscribers is not None and len(self._subscribers) >= self.max_subscribers:
+                self._refused += 1
+                return None
+            self._subscribers.add(sub)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="live-feed", daemon=True)
+                self._thread.start()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def replay(self, conn, after_id, fleet_id=None):
+        """Events after ``after_id`` for a reconnecting client.
+
+        Returns None when more than ``replay_limit`` were missed; the client
+        should then reload instead of catching up event by event.
+        """
+        rows = conn.execute(REPLAY_SQL, (self.replay_limit + 1, after_id, fleet_id, fleet_id)).fetchall()
+        if len(rows) > self.replay_limit:
+            return None
+        return [_event(r) for r in rows]
+
+    def stream(self, sub, replayed=()):
+        """SSE text for one client: replayed events first, then live ones."""
+        try:
+            yield f"retry: {int(self.interval * 1000) + 1000}\n\n"
+            if replayed is None:
+                yield "event: reset\ndata: {}\n\n"
+                replayed = ()
+            seen = 0
+            for event in replayed:
+                seen = event["id"]
+                yield sse_message(event)
+            while True:
+                try:
+                    event = sub.queue.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    # Comment line: keeps proxies from timing out the request
+                    # and surfaces a closed socket on the next write
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    return
+                if event["id"] > seen:
+                    yield sse_message(event)
+        finally:
+            self.unsubscribe(sub)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "max_subscribers": self.max_subscribers,
+                "refused_subscribers": self._refused,
+                "running": self._thread is not None,
+                "last_feed_id": self._last_id,
+                "polls": self._polls,
+                "events": self._events,
+                "delivered": self._delivered,
+                "dropped_subscribers": self._dropped,
+                "errors": self._errors,
+            }
+
+    # -- poller -----------------------------------------------------------
+
+    def _run(self):
+        conn = None
+        next_purge = time.monotonic() + self.purge_every
+        while True:
+            try:
+                if conn is None:
+                    conn = self.connect()
+                    if self._last_id is None:
+                        self._last_id = conn.execute(
+                            "SELECT ISNULL(MAX(FeedId), 0) FROM dbo.ChangeFeed").fetchone()[0]
+                rows = conn.execute(POLL_SQL, (self.batch_size, self._last_id)).fetchall()
+                if rows:
+                    self._last_id = rows[-1].FeedId
+                    self._publish([_event(r) for r in rows])
+                with self._lock:
+                    self._polls += 1
+                if time.monotonic() >= next_purge:
+                    conn.execute("EXEC dbo.sp_purge_change_feed @KeepHours = ?", (self.keep_hours,))
+                    next_purge = time.monotonic() + self.purge_every
+                if len(rows) == self.batch_size:
+                    continue
+            except pyodbc.Error:
+                with self._lock:
+                    self._errors += 1
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except pyodbc.Error:
+                        pass
+                conn = None
+            time.sleep(self.interval)
+
+    def _publish(self, events):
+        with self._lock:
+            self._events += len(events)
+            subscribers = list(self._subscribers)
+        delivered = 0
+        for sub in subscribers:
+            for event in events:
+                if sub.fleet_id is not None and sub.fleet_id != event["fleet_id"]:
+                    continue
+                try:
+                    sub.queue.put_nowait(event)
+                    delivered += 1
+                except queue.Full:
+                    self._drop(sub)
+                    break
+        with self._lock:
+            self._delivered += delivered
+
+    def _drop(self, sub):
+        # Only this thread puts into the queues, so after draining there is
+        # room for the sentinel that ends the client's stream
+        self.unsubscribe(sub)
+        while True:
+            try:
+                sub.queue.get_nowait()
+            except queue.Empty:
+                break
+        sub.queue.put_nowait(None)
+        with self._lock:
+            self._dropped += 1
@@ -0,0 +1,193 @@
+"""HTTP load test: replay a weighted mix of routes against a running app.
+
+``--concurrency`` worker threads each sign in as one of the ``--user``
+managers (round robin), then pick a route from ``MIX`` by weight, send it and
+record the latency until ``--duration`` seconds have passed (requests in the
+first ``--warmup`` seconds are not counted). Ids for the forms come from the
+database the app uses: vehicles and drivers of each manager's fleet. POSTs
+are timed up to the redirect they answer with; the redirect is not followed.
+
+The report lists requests, errors (HTTP >= 400 or no response), throughput
+and p50 / p95 / p99 latency per route and overall. Fill the database first
+(sql/generate_large_data.sql creates a manager login gen_mgr<FleetId> per
+generated fleet), then e.g.
+
+    python load_test.py --concurrency 16 --duration 60 --user gen_mgr7 --user gen_mgr8
+"""
+import argparse
+import http.cookiejar
+import math
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import date, timedelta
+
+import pyodbc
+
+# name -> (weight, method, path, form builder or None); everything is scoped
+# to the signed-in manager's fleet
+MIX = {
+    "vehicles": (25, "GET", "/vehicles", None),
+    "assign form": (10, "GET", "/orders/assign", None),
+    "assign": (15, "POST", "/orders/assign", lambda s, f: {
+        "vehicle_id": s.pick("vehicles", f), "driver_id": s.pick("drivers", f) or "",
+        "weight": "0.1", "volume": "0.1", "destination": "压测"}),
+    "fleet monthly": (15, "GET", "/reports/fleet_monthly?year={year}&month={month}", None),
+    "driver performance": (15, "GET", "/reports/driver_performance?driver_id={driver_id}"
+                                      "&start_date={start}&end_date={end}", None),
+    "driver leaderboard": (5, "GET", "/reports/driver_leaderboard?start_date={start}&end_date={end}", None),
+    "process list": (10, "GET", "/exceptions/process", None),
+    "week exceptions": (5, "GET", "/views/week_exceptions", None),
+    "vehicles api": (5, "GET", "/api/vehicles", None),
+}
+
+
+class Sample:
+    """Fleets of the given managers and their ids, loaded once from the database."""
+
+    def __init__(self, conn, usernames):
+        marks = ",".join("?" * len(usernames))
+        rows = conn.execute(
+            f"""SELECT u.Username, m.FleetId FROM dbo.Users u
+                JOIN dbo.Managers m ON m.ManagerId = u.RelatedId
+                WHERE u.Role = N'Manager' AND u.Username IN ({marks})""", usernames).fetchall()
+        self.fleet_of = {r.Username: r.FleetId for r in rows}
+        missing = [u for u in usernames if u not in self.fleet_of]
+        if missing:
+            raise SystemExit(f"不是车队主管账号：{', '.join(missing)}")
+        fleets = sorted(set(self.fleet_of.values()))
+        marks = ",".join("?" * len(fleets))
+        self.ids = {"vehicles": defaultdict(list), "drivers": defaultdict(list)}
+        for r in conn.execute(f"SELECT FleetId, VehicleId FROM dbo.Vehicles WHERE FleetId IN ({marks})",
+                              fleets).fetchall():
+            self.ids["vehicles"][r.FleetId].append(r.VehicleId)
+        for r in conn.execute(f"SELECT FleetId, DriverId FROM dbo.Drivers WHERE FleetId IN ({marks})",
+                              fleets).fetchall():
+            self.ids["drivers"][r.FleetId].append(r.DriverId)
+        last_month = date.today().replace(day=1) - timedelta(days=1)
+        self.period = {"year": last_month.year, "month": last_month.month,
+                       "start": (date.today() - timedelta(days=30)).isoformat(),
+                       "end": date.today().isoformat()}
+
+    def pick(self, kind, fleet_id):
+        ids = self.ids[kind].get(fleet_id)
+        return random.choice(ids) if ids else None
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a sorted list."""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def login(base_url, username, password):
+    """An opener holding the session cookie of ``username``."""
+    opener = urllib.request.build_opener(_NoRedirect, urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    form = urllib.parse.urlencode({"username": username, "password": password}).encode()
+    try:
+        opener.open(base_url + "/login", data=form, timeout=60).read()
+    except urllib.error.HTTPError as e:
+        if e.code >= 400:
+            raise
+    return opener
+
+
+def worker(base_url, sample, mix, stop_at, count_from, results, lock, username, password):
+    opener = login(base_url, username, password)
+    fleet_id = sample.fleet_of[username]
+    names = list(mix)
+    weights = [mix[n][0] for n in names]
+    while time.monotonic() < stop_at:
+        name = random.choices(names, weights)[0]
+        _, method, path, build = mix[name]
+        driver_id = sample.pick("drivers", fleet_id)
+        url = base_url + path.format(driver_id=driver_id or "", **sample.period)
+        data = None
+        if build is not None:
+            form = build(sample, fleet_id)
+            if None in form.values():
+                continue  # no vehicle in this fleet
+            data = urllib.parse.urlencode(form).encode()
+        started = time.monotonic()
+        try:
+            with opener.open(url, data=data, timeout=60) as response:
+                response.read()
+                ok = response.status < 400
+        except urllib.error.HTTPError as e:
+            ok = e.code < 400  # the redirect after a POST
+        except (urllib.error.URLError, OSError):
+            ok = False
+        elapsed = time.monotonic() - started
+        if started >= count_from:
+            with lock:
+                results[name].append((elapsed, ok))
+
+
+def report(results, seconds):
+    header = f"{'route':<22}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+    print(header)
+    print("-" * len(header))
+    everything = []
+    for name in sorted(results):
+        samples = results[name]
+        everything += samples
+        _line(name, samples, seconds)
+    print("-" * len(header))
+    _line("total", everything, seconds)
+
+
+def _line(name, samples, seconds):
+    latencies = sorted(s[0] * 1000 for s in samples)
+    errors = sum(1 for s in samples if not s[1])
+    print(f"{name:<22}{len(samples):>9}{errors:>8}{len(samples) / seconds:>9.1f}"
+          f"{percentile(latencies, 50):>9.1f}{percentile(latencies, 95):>9.1f}{percentile(latencies, 99):>9.1f}")
+
+
+def main(argv=None):
+    from app import load_config
+
+    parser = argparse.ArgumentParser(description="HTTP 压测：按权重混合访问各页面")
+    parser.add_argument("--base-url", default="http://localhost:5000")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=60, help="压测秒数（默认 60）")
+    parser.add_argument("--warmup", type=float, default=5, help="不计入结果的预热秒数（默认 5）")
+    parser.add_argument("--user", action="append", help="车队主管账号（可重复，默认 manager1）")
+    parser.add_argument("--password", default="123456")
+    parser.add_argument("--only", action="append", choices=sorted(MIX), help="只压测指定路由（可重复）")
+    args = parser.parse_args(argv)
+
+    conn = pyodbc.connect(load_config()["CONN_STR"])
+    try:
+        users = args.user or ["manager1"]
+        sample = Sample(conn, users)
+    finally:
+        conn.close()
+    mix = {name: MIX[name] for name in (args.only or MIX)}
+
+    results, lock = defaultdict(list), threading.Lock()
+    started = time.monotonic()
+    count_from, stop_at = started + args.warmup, started + args.warmup + args.duration
+    threads = [threading.Thread(target=worker, daemon=True,
+                                args=(args.base_url.rstrip("/"), sample, mix, stop_at, count_from, results, lock,
+                                      users[i % len(users)], args.password))
+               for i in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    report(results, args.duration)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
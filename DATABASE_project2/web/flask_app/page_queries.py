@@ -0,0 +1,51 @@
+"""Run a page's independent queries at the same time on a bounded thread pool.
+
+A pyodbc connection runs one statement at a time, so every query but the
+first runs in a worker thread with a copy of the request context: its
+``get_conn()`` checks out a connection of its own, and the copied context's
+teardown hands it back as soon as that query is done. The first query runs
+in the request thread on the request's connection, so a page with N queries
+borrows at most N - 1 extra connections. ``max_workers`` bounds the threads
+(and so the extra connections) across all requests of the process; with 0
+every query runs in turn in the request thread.
+
+Queries must read everything they need (``fetchall``/``fetchone``) before
+returning, and may only read the request (args, session), not consume its
+body.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from flask import copy_current_request_context, request
+
+
+class PageQueries:
+    def __init__(self, metrics, max_workers=2):
+        self.metrics = metrics
+        self.max_workers = max_workers
+        self._executor = (ThreadPoolExecutor(max_workers, thread_name_prefix="page-query")
+                          if max_workers else None)
+
+    def run(self, *queries):
+        """Call every ``query()``; return their results in the same order.
+
+        If a query raises, the exception propagates once all have finished.
+        """
+        if self._executor is None or len(queries) < 2:
+            return [query() for query in queries]
+        request.args  # parse lazily built request state before other threads read it
+        futures = [self._executor.submit(copy_current_request_context(self._counted), query)
+                   for query in queries[1:]]
+        try:
+            results = [queries[0]()]
+        finally:
+            wait(futures)
+        for future in futures:
+            value, statements, seconds = future.result()
+            self.metrics.add_request_totals(statements, seconds)
+            results.append(value)
+        return results
+
+    def _counted(self, query):
+        # The copied context has a fresh ``g``: carry its query totals back
+        value = query()
+        return (value, *self.metrics.request_totals())
@@ -0,0 +1,346 @@
+"""Query plan regression check for every statement the app runs.
+
+The statements are collected by requesting each page / API in ``ROUTES``
+through the Flask test client, signed in as the manager of one fleet: the
+pages query the database as usual (fleet-scoped, as a manager sees them) and
+the query-metrics proxy hands every executed statement, with the parameters
+it was run with, to this script. Writes and background SQL that no GET
+reaches (the dispatch procedures, the live-feed poller) are listed in
+``extra_statements``.
+
+Each statement is then compiled once more under SET SHOWPLAN_XML ON, wrapped
+in sp_executesql with the captured parameters so the estimate matches the
+parameterised plan, and checked:
+
+* a scan (Table Scan / Clustered Index Scan / Index Scan) of a table in
+  ``LARGE_TABLES`` estimated to read ``--scan-rows`` rows or more fails,
+  unless the baseline already accepted that scan for the statement;
+* the estimated subtree cost fails above ``--max-cost`` for a statement
+  without baseline, or above baseline x (1 + ``--tolerance``) otherwise;
+* a route answering 5xx fails (its statements were never captured), and so
+  does a baseline statement no longer run by any route: the query broke or
+  changed, so check it and re-run with ``--update``.
+
+Run against a database at production size (the estimates of a nearly empty
+one say nothing), or let ``--fake-rows`` make the optimizer believe the big
+tables are large (UPDATE STATISTICS ... WITH ROWCOUNT; test databases only).
+``--update`` accepts the current plans as ``plan_baseline.json``.
+
+    python plan_check.py --update --fake-rows Orders=10000000 --fake-rows Exceptions=1000000
+    python plan_check.py
+"""
+import argparse
+import hashlib
+import json
+import os
+import xml.etree.ElementTree as ET
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pyodbc
+
+from query_metrics import statement_key
+
+SHOWPLAN = "{http://schemas.microsoft.com/sqlserver/2004/07/showplan}"
+SCAN_OPS = ("Table Scan", "Clustered Index Scan", "Index Scan")
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plan_baseline.json")
+
+# Tables that grow with traffic; Centers / Fleets are small and may be scanned
+LARGE_TABLES = ("Orders", "Exceptions", "Drivers", "Vehicles", "History_Log",
+                "FleetDailyStats", "ChangeFeed", "OrdersArchive", "ExceptionsArchive")
+
+# GET pages and APIs of the signed-in manager's fleet; {driver_id} etc. are
+# filled from the database
+ROUTES = (
+    "/drivers", "/vehicles", "/orders/assign", "/exceptions", "/exceptions/process",
+    "/views/week_exceptions",
+    "/reports/fleet_monthly?year={year}&month={month}",
+    "/reports/fleet_monthly?start_date={start}&end_date={end}",
+    "/reports/driver_performance?driver_id={driver_id}&start_date={start}&end_date={end}",
+    "/reports/driver_leaderboard?start_date={start}&end_date={end}",
+    "/api/vehicles", "/api/orders/active", "/api/exceptions/alerts",
+    "/orders/dispatch",
+)
+
+
+def extra_statements(sample):
+    """(label, sql, params) for statements no GET route executes."""
+    from live_feed import POLL_SQL, REPLAY_SQL
+
+    fleet_id = sample["fleet_id"]
+    ids = json.dumps([sample["exception_id"]])
+    return [
+        ("sp_assign_order", "EXEC dbo.sp_assign_order @VehicleId = ?, @DriverId = ?, @Weight = ?, "
+         "@Volume = ?, @Destination = ?, @FleetId = ?, @RequireDriver = 0, @BlockDeparted = 0",
+         (sample["vehicle_id"], sample["driver_id"], 1.0, 1.0, "plan check", fleet_id)),
+        ("sp_record_exception", "EXEC dbo.sp_record_exception @VehicleId = ?, @DriverId = ?, "
+         "@ExceptionType = ?, @Phase = ?, @FineAmount = ?, @FleetId = ?",
+         (sample["vehicle_id"], sample["driver_id"], "超速报警", "运输中异常", 0.0, fleet_id)),
+        ("sp_process_exceptions", "EXEC dbo.sp_process_exceptions @Ids = ?, @FleetId = ?", (ids, fleet_id)),
+        ("sp_purge_change_feed", "EXEC dbo.sp_purge_change_feed @KeepHours = ?", (24,)),
+        ("sp_archive_closed_records", "EXEC dbo.sp_archive_closed_records @KeepDays = ?", (90,)),
+        ("live_feed poll", POLL_SQL, (500, sample["feed_id"])),
+        ("live_feed replay", REPLAY_SQL, (1001, sample["feed_id"], fleet_id, fleet_id)),
+    ]
+
+
+def load_sample(conn):
+    """A fleet with a manager, ids from that fleet and a recent period."""
+    row = conn.execute("""
+        SELECT TOP (1) m.FleetId,
+               (SELECT MAX(VehicleId) FROM dbo.Vehicles v WHERE v.FleetId = m.FleetId) AS VehicleId,
+               (SELECT MAX(DriverId) FROM dbo.Drivers d WHERE d.FleetId = m.FleetId) AS DriverId,
+               (SELECT MAX(ExceptionId) FROM dbo.Exceptions) AS ExceptionId,
+               (SELECT ISNULL(MAX(FeedId), 0) FROM dbo.ChangeFeed) AS FeedId
+        FROM dbo.Managers m
+        ORDER BY m.FleetId""").fetchone()
+    if row is None:
+        raise SystemExit("数据库中没有车队主管（dbo.Managers），无法以主管身份访问页面")
+    today = date.today()
+    last_month = today.replace(day=1) - timedelta(days=1)
+    return {
+        "fleet_id": row.FleetId, "vehicle_id": row.VehicleId or 1, "driver_id": row.DriverId or 1,
+        "exception_id": row.ExceptionId or 1, "feed_id": max(row.FeedId - 100, 0),
+        "year": last_month.year, "month": last_month.month,
+        "start": (today - timedelta(days=30)).isoformat(), "end": today.isoformat(),
+    }
+
+
+def capture(app, urls, fleet_id):
+    """Request ``urls`` through the app as the manager of ``fleet_id``;
+    returns ({statement id: (route, sql, params)}, [routes that answered 5xx])."""
+    statements, broken = {}, []
+    current = [None]
+    metrics = app.extensions["query_metrics"]
+    record = metrics.record
+
+    def collect(sql, params, *timings):
+        statements.setdefault(statement_id(sql), (current[0], sql, params))
+        record(sql, params, *timings)
+
+    metrics.record = collect
+    try:
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session.update(user_id=0, username="plan_check", role="Manager", fleet_id=fleet_id)
+        for url in urls:
+            current[0] = url
+            response = client.get(url)
+            response.get_data()
+            if response.status_code >= 500:
+                broken.append(url)
+                print(f"FAIL   {url} -> HTTP {response.status_code}")
+    finally:
+        metrics.record = record
+    return statements, broken
+
+
+# -- SHOWPLAN -------------------------------------------------------------
+
+def statement_id(sql):
+    return hashlib.sha1(statement_key(sql, max_length=100000).encode("utf-8")).hexdigest()[:12]
+
+
+def _sql_type(value):
+    if isinstance(value, bool):
+        return "BIT"
+    if isinstance(value, int):
+        return "BIGINT" if abs(value) > 2 ** 31 - 1 else "INT"
+    if isinstance(value, float):
+        return "FLOAT"
+    if isinstance(value, Decimal):
+        return "DECIMAL(18, 4)"
+    if isinstance(value, datetime):
+        return "DATETIME2"
+    if isinstance(value, date):
+        return "DATE"
+    if isinstance(value, (bytes, bytearray)):
+        return "VARBINARY(MAX)"
+    if value is None:
+        return "INT"
+    return "NVARCHAR(MAX)" if len(str(value)) > 4000 else "NVARCHAR(4000)"
+
+
+def _sql_literal(value):
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (int, float, Decimal)):
+        return repr(value) if isinstance(value, float) else str(value)
+    if isinstance(value, (datetime, date)):
+        return f"'{value.isoformat()}'"
+    if isinstance(value, (bytes, bytearray)):
+        return "0x" + bytes(value).hex()
+    return "N'" + str(value).replace("'", "''") + "'"
+
+
+def _numbered(sql):
+    """``?`` markers outside string literals and comments become @p1, @p2, ..."""
+    out, n, i = [], 0, 0
+    while i < len(sql):
+        ch = sql[i]
+        if ch == "'":
+            end = i + 1
+            while end < len(sql):
+                if sql[end] == "'" and sql[end + 1:end + 2] == "'":
+                    end += 2
+                elif sql[end] == "'":
+                    break
+                else:
+                    end += 1
+            out.append(sql[i:end + 1])
+            i = end + 1
+        elif sql.startswith("--", i):
+            end = sql.find("\n", i)
+            end = len(sql) if end < 0 else end
+            out.append(sql[i:end])
+            i = end
+        elif ch == "?":
+            n += 1
+            out.append(f"@p{n}")
+            i += 1
+        else:
+            out.append(ch)
+            i += 1
+    return "".join(out), n
+
+
+def parameterized(sql, params):
+    """The statement as an sp_executesql batch carrying ``params``."""
+    if params is None:
+        params = ()
+    elif not isinstance(params, (list, tuple)):
+        params = (params,)
+    text, count = _numbered(sql)
+    if count != len(params):
+        raise ValueError(f"{count} parameter markers, {len(params)} values")
+    body = "N'" + text.replace("'", "''") + "'"
+    if not params:
+        return f"EXEC sp_executesql {body}"
+    declared = ", ".join(f"@p{i} {_sql_type(v)}" for i, v in enumerate(params, start=1))
+    values = ", ".join(f"@p{i} = {_sql_literal(v)}" for i, v in enumerate(params, start=1))
+    return f"EXEC sp_executesql {body}, N'{declared}', {values}"
+
+
+def estimated_plans(conn, sql, params):
+    """SHOWPLAN_XML documents for one statement (one per batch statement / procedure)."""
+    cursor = conn.cursor()
+    cursor.execute("SET SHOWPLAN_XML ON")
+    try:
+        cursor.execute(parameterized(sql, params))
+        plans = []
+        while True:
+            plans.extend(row[0] for row in cursor.fetchall())
+            if not cursor.nextset():
+                break
+        return plans
+    finally:
+        cursor.execute("SET SHOWPLAN_XML OFF")
+
+
+def analyse(plans, scan_rows):
+    """Total estimated cost and the large-table scans of a statement's plans."""
+    cost = 0.0
+    scans = set()
+    for plan in plans:
+        root = ET.fromstring(plan)
+        for stmt in root.iter(f"{SHOWPLAN}StmtSimple"):
+            cost += float(stmt.get("StatementSubTreeCost") or 0)
+        for relop in root.iter(f"{SHOWPLAN}RelOp"):
+            if relop.get("PhysicalOp") not in SCAN_OPS:
+                continue
+            obj = relop.find(f"./*/{SHOWPLAN}Object")
+            if obj is None:
+                continue
+            table = (obj.get("Table") or "").strip("[]")
+            rows = float(relop.get("EstimatedRowsRead") or relop.get("TableCardinality") or 0)
+            if table in LARGE_TABLES and rows >= scan_rows:
+                scans.add(f"{table}.{(obj.get('Index') or 'heap').strip('[]')} {relop.get('PhysicalOp')}")
+    return round(cost, 4), sorted(scans)
+
+
+def fake_rowcounts(conn, specs):
+    """Make the optimizer cost the given tables at ``rows`` (test databases only)."""
+    for spec in specs:
+        table, _, rows = spec.partition("=")
+        if table not in LARGE_TABLES or not rows.isdigit():
+            raise SystemExit(f"--fake-rows 需为 表名=行数，表名取自 {', '.join(LARGE_TABLES)}")
+        conn.execute(f"UPDATE STATISTICS dbo.{table} WITH ROWCOUNT = {int(rows)}, "
+                     f"PAGECOUNT = {max(int(rows) // 50, 1)}")
+
+
+# -- check ----------------------------------------------------------------
+
+def check(conn, statements, baseline, scan_rows, max_cost, tolerance):
+    """Compare every statement's plan with the baseline; returns (results, failures)."""
+    results, failures = {}, 0
+    for sid, (label, sql, params) in statements.items():
+        known = baseline.get(sid)
+        try:
+            cost, scans = analyse(estimated_plans(conn, sql, params), scan_rows)
+        except (pyodbc.Error, ValueError, ET.ParseError) as e:
+            failures += 1
+            print(f"ERROR  {label}: {e}\n       {statement_key(sql)}")
+            continue
+        problems = []
+        accepted = set(known["scans"]) if known else set()
+        problems += [f"新出现扫描 {s}" for s in scans if s not in accepted]
+        limit = known["cost"] * (1 + tolerance) if known else max_cost
+        if cost > max(limit, 0.1):
+            problems.append(f"估算成本 {cost} 超过 {round(limit, 4)}")
+        results[sid] = {"label": label, "sql": statement_key(sql), "cost": cost, "scans": scans}
+        if problems:
+            failures += 1
+            print(f"FAIL   {label} cost={cost}\n       {statement_key(sql)}")
+            for p in problems:
+                print(f"       - {p}")
+        else:
+            print(f"ok     {label} cost={cost}{'' if known else '  (新语句)'}")
+    return results, failures
+
+
+def main(argv=None):
+    from app import create_app
+
+    parser = argparse.ArgumentParser(description="查询计划回归检查")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--update", action="store_true", help="以当前计划覆盖基线")
+    parser.add_argument("--scan-rows", type=int, default=10000, help="大表扫描判定行数（默认 10000）")
+    parser.add_argument("--max-cost", type=float, default=50.0, help="无基线语句的成本上限（默认 50）")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="相对基线允许的成本增幅（默认 0.5）")
+    parser.add_argument("--fake-rows", action="append", default=[], metavar="表名=行数")
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    conn = pyodbc.connect(app.config["CONN_STR"], autocommit=True)
+    try:
+        if args.fake_rows:
+            fake_rowcounts(conn, args.fake_rows)
+        sample = load_sample(conn)
+        statements, broken = capture(app, [url.format(**sample) for url in ROUTES], sample["fleet_id"])
+        for label, sql, params in extra_statements(sample):
+            statements.setdefault(statement_id(sql), (label, sql, params))
+        baseline = {}
+        if os.path.exists(args.baseline) and not args.update:
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+        results, failures = check(conn, statements, baseline, args.scan_rows, args.max_cost, args.tolerance)
+    finally:
+        conn.close()
+    missing = [entry for sid, entry in baseline.items() if sid not in statements]
+    for entry in missing:
+        print(f"FAIL   {entry['label']} 基线中的语句本次未执行\n       {entry['sql']}")
+    failures += len(broken) + len(missing)
+
+    print(f"\n{len(statements)} 条语句，{failures} 项未通过（其中页面出错 {len(broken)}，基线语句缺失 {len(missing)}）")
+    if args.update:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"基线已写入 {args.baseline}")
+        return 0
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
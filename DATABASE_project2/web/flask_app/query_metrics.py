@@ -0,0 +1,365 @@
+"""Per-route request and per-statement query metrics, exported as Prometheus text.
+
+``QueryMetrics.wrap`` puts a thin proxy around the request's pyodbc
+connection: every ``execute`` is timed, and so is every fetch on the cursor it
+returns (rows counted as they come back). Statements are grouped by their SQL
+text with whitespace collapsed, so the same query issued from a loop shows up
+as one statement with a high count, and the per-route ``queries`` histogram
+shows how many statements a single request needs (an N+1 page stands out
+against its neighbours).
+
+Statements slower than ``slow_threshold`` seconds (execute + fetch) are written
+to the ``fleet.slow_query`` logger with the route and the parameter *types*
+only; values never reach the log.
+"""
+import logging
+import re
+import threading
+import time
+
+from flask import g, has_request_context, request
+
+slow_log = logging.getLogger("fleet.slow_query")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+_SPACE = re.compile(r"\s+")
+
+
+def statement_key(sql, max_length=200):
+    """SQL text as a metric label: whitespace collapsed, long text cut short."""
+    text = _SPACE.sub(" ", sql).strip()
+    return text if len(text) <= max_length else text[:max_length - 1] + "…"
+
+
+def redact(params):
+    """Describe parameters without their values, e.g. ``(int, str[12], None)``."""
+    if params is None:
+        return "()"
+    if not isinstance(params, (list, tuple)):
+        params = (params,)
+    described = []
+    for p in params:
+        if p is None:
+            described.append("None")
+        elif isinstance(p, (str, bytes)):
+            described.append(f"{type(p).__name__}[{len(p)}]")
+        else:
+            described.append(type(p).__name__)
+    return "(" + ", ".join(described) + ")"
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label tuple (Prometheus semantics)."""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            base = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(self.label_names, labels))
+            sep = "," if base else ""
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {series[-1]}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class QueryMetrics:
+    """Request latency, queries per request and per-statement timings.
+
+    ``max_statements`` caps the number of distinct statement labels; queries
+    beyond it are counted under ``other`` so dynamic SQL cannot grow the
+    metrics without bound.
+    """
+
+    def __init__(self, slow_threshold=0.5, max_statements=500):
+        self.slow_threshold = slow_threshold
+        self.max_statements = max_statements
+
+        self._lock = threading.Lock()
+        self._statements = set()
+        self._slow = 0
+
+        self.request_seconds = Histogram(
+            "fleet_http_request_duration_seconds", "Request latency by route.",
+            ("route", "method", "status"), LATENCY_BUCKETS)
+        self.request_queries = Histogram(
+            "fleet_http_request_queries", "SQL statements executed per request.",
+            ("route", "method"), COUNT_BUCKETS)
+        self.request_db_seconds = Histogram(
+            "fleet_http_request_db_seconds", "Time per request spent in SQL (execute + fetch).",
+            ("route", "method"), LATENCY_BUCKETS)
+        self.execute_seconds = Histogram(
+            "fleet_db_execute_seconds", "Statement execution time.",
+            ("route", "statement"), LATENCY_BUCKETS)
+        self.fetch_seconds = Histogram(
+            "fleet_db_fetch_seconds", "Time spent fetching a statement's rows.",
+            ("route", "statement"), LATENCY_BUCKETS)
+        self.rows = Histogram(
+            "fleet_db_rows", "Rows fetched per statement.",
+            ("route", "statement"), ROW_BUCKETS)
+
+    # -- Flask integration ------------------------------------------------
+
+    def init_app(self, app):
+        app.before_request(self._before)
+        app.after_request(self._after)
+
+    def wrap(self, conn):
+        """The request's connection, instrumented (one proxy per request)."""
+        if not has_request_context():
+            return MeteredConnection(conn, self)
+        metered = g.get("metered_conn")
+        if metered is None or metered.raw is not conn:
+            metered = g.metered_conn = MeteredConnection(conn, self)
+        return metered
+
+    def _before(self):
+        g.metrics_started = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_db_seconds = 0.0
+
+    def _after(self, response):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return response
+        # Streaming responses (exports, /events) are timed to their first byte
+        elapsed = time.perf_counter() - started
+        route, method = _route(), request.method
+        with self._lock:
+            self.request_seconds.observe((route, method, str(response.status_code)), elapsed)
+            self.request_queries.observe((route, method), g.get("metrics_queries", 0))
+            self.request_db_seconds.observe((route, method), g.get("metrics_db_seconds", 0.0))
+        return response
+
+    # -- recording --------------------------------------------------------
+
+    def record(self, sql, params, executed, fetched, rows):
+        """One statement: ``executed`` / ``fetched`` seconds and rows returned."""
+        in_request = has_request_context()
+        route = _route() if in_request else "-"
+        key = statement_key(sql)
+        with self._lock:
+            if key not in self._statements:
+                if len(self._statements) < self.max_statements:
+                    self._statements.add(key)
+                else:
+                    key = "other"
+            self.execute_seconds.observe((route, key), executed)
+            self.fetch_seconds.observe((route, key), fetched)
+            self.rows.observe((route, key), rows)
+            slow = executed + fetched >= self.slow_threshold
+            if slow:
+                self._slow += 1
+        if in_request:
+            self.add_request_totals(1, executed + fetched)
+        if slow:
+            slow_log.warning("slow query %.3fs (execute %.3fs, fetch %.3fs, %d rows) route=%s params=%s sql=%s",
+                             executed + fetched, executed, fetched, rows, route, redact(params),
+                             statement_key(sql, max_length=2000))
+
+    @staticmethod
+    def request_totals():
+        """Statements and SQL seconds counted so far in this request's ``g``."""
+        return g.get("metrics_queries", 0), g.get("metrics_db_seconds", 0.0)
+
+    @staticmethod
+    def add_request_totals(statements, seconds):
+        """Count statements run for this request elsewhere (worker threads)."""
+        g.metrics_queries = g.get("metrics_queries", 0) + statements
+        g.metrics_db_seconds = g.get("metrics_db_seconds", 0.0) + seconds
+
+    def stats(self):
+        with self._lock:
+            return {
+                "slow_threshold_seconds": self.slow_threshold,
+                "statements": len(self._statements),
+                "max_statements": self.max_statements,
+                "slow_queries": self._slow,
+            }
+
+    def render(self, extra=()):
+        """Prometheus text exposition; ``extra`` lines (gauges etc.) are appended."""
+        lines = []
+        with self._lock:
+            for histogram in (self.request_seconds, self.request_queries, self.request_db_seconds,
+                              self.execute_seconds, self.fetch_seconds, self.rows):
+                lines.extend(histogram.render())
+            lines += ["# HELP fleet_db_slow_queries_total Statements over the slow-query threshold.",
+                      "# TYPE fleet_db_slow_queries_total counter",
+                      f"fleet_db_slow_queries_total {self._slow}"]
+        lines.extend(extra)
+        return "\n".join(lines) + "\n"
+
+
+def _route():
+    rule = request.url_rule
+    return rule.rule if rule is not None else "<unmatched>"
+
+
+class MeteredConnection:
+    """pyodbc connection proxy whose cursors report to ``metrics``."""
+
+    def __init__(self, conn, metrics):
+        self.raw = conn
+        self.metrics = metrics
+
+    def cursor(self):
+        return MeteredCursor(self.raw.cursor(), self.metrics)
+
+    def execute(self, sql, *params):
+        return self.cursor().execute(sql, *params)
+
+    def __enter__(self):
+        self.raw.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self.raw.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+class MeteredCursor:
+    """pyodbc cursor proxy timing execute and fetch for each result.
+
+    A statement is recorded once its rows have been read: when a fetch comes
+    back short, on the next ``execute``, on ``close``, or when the cursor is
+    dropped (``conn.execute(...)`` for an UPDATE is recorded right away).
+    """
+
+    _OWN = frozenset(("raw", "metrics", "_sql", "_params", "_executed", "_fetched", "_rows"))
+
+    def __init__(self, cursor, metrics):
+        self.raw = cursor
+        self.metrics = metrics
+        self._sql = None
+
+    def execute(self, sql, *params):
+        self._finish()
+        started = time.perf_counter()
+        try:
+            self.raw.execute(sql, *params)
+        finally:
+            self._sql, self._params = sql, (params[0] if len(params) == 1 else params)
+            self._executed = time.perf_counter() - started
+            self._fetched = 0.0
+            self._rows = 0
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        # One entry per call; parameters are not described for the whole batch
+        self._finish()
+        started = time.perf_counter()
+        try:
+            self.raw.executemany(sql, seq_of_params)
+        finally:
+            self._sql, self._params = sql, None
+            self._executed = time.perf_counter() - started
+            self._fetched = 0.0
+            self._rows = 0
+            self._finish()
+
+    def fetchone(self):
+        row = self._timed(self.raw.fetchone)
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(self.raw.fetchmany, *(() if size is None else (size,)))
+        self._rows += len(rows)
+        if not rows or (size is not None and len(rows) < size):
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(self.raw.fetchall)
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def fetchval(self):
+        value = self._timed(self.raw.fetchval)
+        self._rows += 1
+        self._finish()
+        return value
+
+    def nextset(self):
+        # Multi-statement batches stay one entry; rows add up across the sets
+        more = self._timed(self.raw.nextset)
+        if not more:
+            self._finish()
+        return more
+
+    def close(self):
+        self._finish()
+        self.raw.close()
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._finish()
+        return self.raw.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def __setattr__(self, name, value):
+        # fast_executemany and friends belong to the real cursor
+        if name in self._OWN:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self.raw, name, value)
+
+    def __del__(self):
+        self._finish()
+
+    def _timed(self, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            if self._sql is not None:
+                self._fetched += time.perf_counter() - started
+
+    def _finish(self):
+        if self._sql is None:
+            return
+        sql, self._sql = self._sql, None
+        self.metrics.record(sql, self._params, self._executed, self._fetched, self._rows)
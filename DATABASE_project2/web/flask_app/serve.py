@@ -0,0 +1,22 @@
+"""Production server without gunicorn (Windows): waitress, one process with
+WEB_THREADS worker threads (default 8).
+
+    python serve.py
+
+Keep DB_POOL_MAX at or above WEB_THREADS + PAGE_QUERY_WORKERS so requests do
+not queue for a connection. Each open /events stream holds one thread;
+LIVE_FEED_MAX_SUBSCRIBERS (default WEB_THREADS / 2) caps them per process.
+"""
+import os
+
+from waitress import serve
+
+from wsgi import app  # loads .env
+
+if __name__ == "__main__":
+    port = int(os.getenv("PORT", "5000"))
+    print(f"[INFO] Serving on http://0.0.0.0:{port}")
+    serve(app, host="0.0.0.0", port=port,
+          threads=int(os.getenv("WEB_THREADS", "8")),
+          connection_limit=int(os.getenv("WEB_CONNECTION_LIMIT", "200")),
+          channel_timeout=int(os.getenv("WEB_TIMEOUT", "60")))
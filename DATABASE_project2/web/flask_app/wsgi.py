@@ -0,0 +1,8 @@
+"""WSGI entry point for production servers, e.g.
+
+    gunicorn -c gunicorn.conf.py wsgi:app     (Linux, several processes)
+    python serve.py                           (Windows, waitress)
+"""
+from app import create_app
+
+app = create_app()